@@ -4,7 +4,7 @@ from multiprocessing import cpu_count
 import shutil
 
 from pythonforandroid.recipe import Recipe
-from pythonforandroid.util import BuildInterruptingException, build_platform
+from pythonforandroid.util import BuildInterruptingException
 
 
 class Arch:
@@ -40,6 +40,39 @@ class Arch:
         '-Wl,-Bsymbolic-functions',
     ]
 
+    load_cflags = [
+        '-ffunction-sections',
+        '-fdata-sections',
+    ]
+    '''The `cflags` of the load-optimized link profile
+    (``--link-profile=load``), giving the linker sections to drop or fold.'''
+
+    load_ldflags = [
+        '-Wl,--hash-style=gnu',
+        '-Wl,--gc-sections',
+        '-Wl,--icf=safe',
+    ]
+    '''The `ldflags` of the load-optimized link profile, see
+    :meth:`get_load_ldflags`.'''
+
+    opt_cflags = {
+        'speed': ['-O3'],
+        'size': ['-Os'],
+        'lto': ['-O2', '-flto=thin'],
+    }
+    '''The `cflags` of the optimization profiles (``--opt-profile``).'''
+
+    opt_ldflags = {
+        'lto': ['-flto=thin'],
+    }
+    '''The `ldflags` of the optimization profiles.'''
+
+    extension_cflags = ['-fvisibility=hidden']
+    '''The `cflags` of the load-optimized link profile for the python
+    extension modules of the recipes with
+    :attr:`~pythonforandroid.recipe.PythonRecipe.hidden_visibility`, which
+    only have to export their ``PyInit_*``.'''
+
     def __init__(self, ctx):
         self.ctx = ctx
 
@@ -106,7 +139,29 @@ class Arch:
             compiler += '++'
         return join(self.ctx.ndk.llvm_bin_dir, compiler)
 
-    def get_env(self, with_flags_in_cc=True):
+    def get_load_ldflags(self):
+        """The `ldflags` of the load-optimized link profile: those of
+        :attr:`load_ldflags`, and the packing of the relocations the bionic
+        of ``ndk_api`` supports (Android packed relocations from API 23,
+        and RELR from API 28, with Android's own tags before API 30)."""
+        ldflags = list(self.load_ldflags)
+        if self.ctx.ndk_api >= 28:
+            ldflags.append('-Wl,--pack-dyn-relocs=android+relr')
+            if self.ctx.ndk_api < 30:
+                ldflags.append('-Wl,--use-android-relr-tags')
+        elif self.ctx.ndk_api >= 23:
+            ldflags.append('-Wl,--pack-dyn-relocs=android')
+        return ldflags
+
+    def get_env(self, with_flags_in_cc=True, link_profile=None,
+                opt_profile=None):
+        """The build env of the arch, with the flags of the link profile
+        ``link_profile`` and of the optimization profile ``opt_profile``
+        (those of ``--link-profile`` and ``--opt-profile`` by default)."""
+        if link_profile is None:
+            link_profile = self.ctx.link_profile
+        if opt_profile is None:
+            opt_profile = self.ctx.opt_profile
         env = {}
 
         # HOME: User's home directory
@@ -126,6 +181,10 @@ class Arch:
         if self.arch_cflags:
             # each architecture may have has his own CFLAGS
             env['CFLAGS'] += ' ' + ' '.join(self.arch_cflags)
+        if link_profile == 'load':
+            env['CFLAGS'] += ' ' + ' '.join(self.load_cflags)
+        if opt_profile in self.opt_cflags:
+            env['CFLAGS'] += ' ' + ' '.join(self.opt_cflags[opt_profile])
         env['CXXFLAGS'] = env['CFLAGS']
 
         # CPPFLAGS (for macros and includes)
@@ -150,6 +209,10 @@ class Arch:
                 ctx_libs_dir=self.ctx.get_libs_dir(self.arch)
             )
         )
+        if link_profile == 'load':
+            env['LDFLAGS'] += ' ' + ' '.join(self.get_load_ldflags())
+        if opt_profile in self.opt_ldflags:
+            env['LDFLAGS'] += ' ' + ' '.join(self.opt_ldflags[opt_profile])
 
         # LDLIBS: Library flags or names given to compilers when they are
         # supposed to invoke the linker.
@@ -209,19 +272,15 @@ class Arch:
 
         # Custom linker options
         env['LDSHARED'] = env['CC'] + ' ' + ' '.join(self.common_ldshared)
+        if link_profile == 'load':
+            env['LDSHARED'] += ' ' + ' '.join(self.get_load_ldflags())
+        if opt_profile in self.opt_ldflags:
+            env['LDSHARED'] += ' ' + ' '.join(self.opt_ldflags[opt_profile])
 
         # Host python (used by some recipes)
         hostpython_recipe = Recipe.get_recipe(
             'host' + self.ctx.python_recipe.name, self.ctx)
-        env['BUILDLIB_PATH'] = join(
-            hostpython_recipe.get_build_dir(self.arch),
-            'native-build',
-            'build',
-            'lib.{}-{}'.format(
-                build_platform,
-                self.ctx.python_recipe.major_minor_version_string,
-            ),
-        )
+        env['BUILDLIB_PATH'] = hostpython_recipe.get_build_lib_dir()
 
         # for reproducible builds
         if 'SOURCE_DATE_EPOCH' in environ:
@@ -8,6 +8,9 @@ import sh
 import shlex
 import shutil
 
+from pythonforandroid.linkprofile import (
+    LINK_PROFILES, collect_library_stats, read_library_stats,
+    write_library_stats, write_link_report)
 from pythonforandroid.logger import (shprint, info, info_main, logger, debug)
 from pythonforandroid.util import (
     current_directory, ensure_dir, temp_directory, BuildInterruptingException,
@@ -199,6 +202,7 @@ class Bootstrap:
             join(self.dist_dir, python_bundle_dir), arch)
         if not self.ctx.with_debug_symbols:
             self.strip_libraries(arch)
+        self.write_link_report(arch)
         self.fry_eggs(site_packages_dir)
 
     def assemble_distribution(self):
@@ -438,6 +442,37 @@ class Bootstrap:
             except sh.ErrorReturnCode_1:
                 logger.debug('Failed to strip ' + filen)
 
+    def write_link_report(self, arch):
+        '''Write in the dist the report of the size, the relocations and the
+        exported symbols of the libraries of ``arch``, with their changes
+        from the last dist built with another ``--link-profile``.'''
+        def stats_filen(profile):
+            return join(self.ctx.build_dir, 'link_stats_{}_{}.json'.format(
+                arch.arch, profile))
+
+        stats = collect_library_stats(self.dist_dir, [
+            dirn for dirn in (
+                join(self.dist_dir, 'libs', arch.arch),
+                join(self.dist_dir, f'_python_bundle__{arch.arch}'))
+            if isdir(dirn)])
+        write_library_stats(stats_filen(self.ctx.link_profile), stats)
+        comments = ['link profile: {}'.format(self.ctx.link_profile)]
+        baseline = None
+        for profile in LINK_PROFILES:
+            if profile != self.ctx.link_profile:
+                baseline = read_library_stats(stats_filen(profile))
+            if baseline is not None:
+                comments.append('baseline: the last dist built with the '
+                                '{} link profile'.format(profile))
+                break
+
+        report_fn = join(self.dist_dir, 'link_report_{}.txt'.format(arch.arch))
+        totals, base_totals = write_link_report(
+            report_fn, stats, baseline, comments)
+        info('Libraries: {}{}, see {}'.format(
+            totals, '' if base_totals is None else ' (was {})'.format(
+                base_totals), report_fn))
+
     def fry_eggs(self, sitepackages):
         info('Frying eggs in {}'.format(sitepackages))
         for d in listdir(sitepackages):
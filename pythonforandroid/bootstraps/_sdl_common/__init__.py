@@ -20,4 +20,5 @@ class SDLGradleBootstrap(Bootstrap):
             join(self.dist_dir, python_bundle_dir), arch)
         if not self.ctx.with_debug_symbols:
             self.strip_libraries(arch)
+        self.write_link_report(arch)
         self.fry_eggs(site_packages_dir)
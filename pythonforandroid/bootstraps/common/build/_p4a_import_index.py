@@ -0,0 +1,75 @@
+'''
+Resolves the top-level imports of the app from the import index written
+when packaging with ``--import-index`` (see ``make_import_index`` in
+build.py), instead of trying each ``sys.path`` entry in turn.
+
+This module is installed by start.c, in the app dir next to the index.
+'''
+
+import sys
+from importlib.machinery import PathFinder
+
+
+class IndexFinder:
+    '''
+    A meta path finder looking up the top-level modules of the index in the
+    only ``sys.path`` entry that holds them. Submodules, the modules that
+    are not in the index and those of a ``sys.path`` the app changed are
+    left to the normal path finder.
+    '''
+
+    def __init__(self, index, path):
+        self.index = index
+        self.path = list(path)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None:
+            # the __path__ of the package is where its submodules are
+            return None
+        entry = self.index.get(fullname)
+        if entry is None or sys.path[:len(self.path)] != self.path:
+            return None
+        return PathFinder.find_spec(fullname, [entry], target)
+
+    def invalidate_caches(self):
+        pass
+
+
+def read_index(filen, path):
+    '''
+    Read the index ``filen``: a line per root, the suffix of its ``sys.path``
+    entry then the top-level modules it holds, separated by spaces. Return
+    the modules by ``path`` entry, without those of the roots not in
+    ``path``.
+    '''
+    index = {}
+    with open(filen) as fileh:
+        for line in fileh:
+            names = line.split()
+            if not names:
+                continue
+            suffix = names.pop(0)
+            entry = next((entry for entry in path
+                          if entry.endswith(suffix)), None)
+            if entry is None:
+                continue
+            for name in names:
+                index.setdefault(name, entry)
+    return index
+
+
+def install(filen, meta_path=None, path=None):
+    '''Put an :class:`IndexFinder` for the index ``filen`` in
+    ``sys.meta_path``, before the normal path finder.'''
+    if meta_path is None:
+        meta_path = sys.meta_path
+    if path is None:
+        path = sys.path
+    finder = IndexFinder(read_index(filen, path), path)
+    position = len(meta_path)
+    for i, other in enumerate(meta_path):
+        if other is PathFinder:
+            position = i
+            break
+    meta_path.insert(position, finder)
+    return finder
@@ -2,12 +2,13 @@
 
 from gzip import GzipFile
 import hashlib
+import io
 import json
 from os.path import (
     dirname, join, isfile, realpath,
     relpath, split, exists, basename
 )
-from os import environ, listdir, makedirs, remove
+from os import listdir, makedirs, remove
 import os
 import shlex
 import shutil
@@ -15,12 +16,15 @@ import subprocess
 import sys
 import tarfile
 import tempfile
-import time
+import zipfile
+import zlib
 
 from fnmatch import fnmatch
 import jinja2
 
 from pythonforandroid.bootstrap import SDL_BOOTSTRAPS
+from pythonforandroid.nativelibs import library_load_order
+from pythonforandroid.pythonbundle import split_in_place_files, write_zip
 from pythonforandroid.util import rmdir, ensure_dir, max_build_tool_version
 
 
@@ -74,6 +78,57 @@ BLACKLIST_PATTERNS = [
 
 WHITELIST_PATTERNS = []
 
+PAYLOAD_CACHE_DIR = '.p4a_payload_cache'
+'''Where :func:`make_tar` keeps the payload manifests, the last built
+payloads and the compiled python files, relative to the dist dir.'''
+
+PAYLOAD_MANIFEST = '.p4a_manifest'
+'''The first member of every payload, listing the hash of each of its files
+so that the app only extracts the files that changed since the payload it
+extracted last (see ``PayloadExtractor.java``).'''
+
+APP_ZIP_LIB = 'libpyapp.so'
+'''With ``--private-zip``, the zip of the app code in the native libs dir,
+which start.c puts on sys.path so that the app runs without extraction.'''
+
+APP_ZIP_ALIGNMENT = 4096
+
+PYBUNDLE_ZIP_LIB = 'libpylib.so'
+'''With ``--python-bundle-zip``, the zip in the native libs dir holding the
+stdlib and the pure python site-packages, which start.c imports in place.'''
+
+LOADED_LIBRARIES = [
+    'libsqlite3.so',
+    'libffi.so',
+    'libpng16.so',
+    'libssl*.so',
+    'libcrypto*.so',
+    'libSDL2.so',
+    'libSDL2_image.so',
+    'libSDL2_mixer.so',
+    'libSDL2_ttf.so',
+    'libSDL3.so',
+    'libSDL3_image.so',
+    'libSDL3_mixer.so',
+    'libSDL3_ttf.so',
+    'libpython3.*.so',
+    'libmain.so',
+]
+'''The libraries the app loads at startup, with the libraries of the native
+libs dir they need (see :func:`make_library_load_plan`).'''
+
+IMPORT_INDEX = 'p4a_import_index.txt'
+'''With ``--import-index``, the index of the top-level modules of the python
+bundle, in the app dir, that start.c resolves imports with (see
+:func:`make_import_index`).'''
+
+IMPORT_INDEX_FINDER = '_p4a_import_index.py'
+'''The module installing the meta path finder reading :data:`IMPORT_INDEX`.'''
+
+PYBUNDLE_COMMON_ASSET = 'pybundle_common.tar'
+'''The asset holding the part of the python bundle that is the same for
+every arch, extracted next to the per-arch ``libpybundle.so``.'''
+
 if os.environ.get("P4A_BUILD_IS_RUNNING_UNITTESTS", "0") != "1":
     PYTHON = get_hostpython()
     _bootstrap_name = get_bootstrap_name()
@@ -147,9 +202,183 @@ def listfiles(d):
             yield fn
 
 
-def make_tar(tfn, source_dirs, byte_compile_python=False, optimize_python=True):
+def file_digest(fn):
+    '''
+    Return the sha256 hex digest of the contents of the file `fn`.
+    '''
+    digest = hashlib.sha256()
+    with open(fn, 'rb') as fileh:
+        for chunk in iter(lambda: fileh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_payload_manifest(manifest_fn):
+    try:
+        with open(manifest_fn, 'r') as fileh:
+            return json.load(fileh)
+    except (OSError, ValueError):
+        return None
+
+
+def build_payload_manifest(sources, previous=None):
+    '''
+    Return a manifest mapping each archive name of `sources` (a list of
+    ``(filename, arcname)`` tuples) to its ``[size, mtime, sha256]``.
+
+    Members whose size and mtime match the `previous` manifest keep their
+    recorded hash instead of being read again.
+    '''
+    previous = previous or {}
+    manifest = {}
+    for fn, afn in sources:
+        st = os.stat(fn)
+        size, mtime = st.st_size, int(st.st_mtime)
+        old = previous.get(afn)
+        if old is not None and old[0] == size and old[1] == mtime:
+            digest = old[2]
+        else:
+            digest = file_digest(fn)
+        manifest[afn] = [size, mtime, digest]
+    return manifest
+
+
+def same_payload_members(manifest, other):
+    '''
+    Compare two payload manifests by path, size and hash only: an mtime
+    change alone (e.g. a fresh checkout) doesn't make a member different.
+    '''
+    if manifest.keys() != other.keys():
+        return False
+    return all(manifest[afn][0] == other[afn][0] and
+               manifest[afn][2] == other[afn][2] for afn in manifest)
+
+
+def find_arch_independent_files(bundle_dirs):
+    '''
+    Return the paths (relative to each of ``bundle_dirs``) of the files that
+    are identical in all the per-arch python bundles ``bundle_dirs``, i.e.
+    what can be shipped once for every arch. Shared libraries and extension
+    modules are never part of it.
+    '''
+    common = None
+    for bundle_dir in bundle_dirs:
+        bundle_dir = realpath(bundle_dir)
+        members = {}
+        for fn in listfiles(bundle_dir):
+            if is_blacklist(fn) or fn.endswith('.so'):
+                continue
+            members[relpath(realpath(fn), bundle_dir)] = (
+                os.path.getsize(fn), file_digest(fn))
+        if common is None:
+            common = members
+        else:
+            common = {afn: member for afn, member in common.items()
+                      if members.get(afn) == member}
+    return set(common or ())
+
+
+def get_cached_pyc(python_file, digest, cache_dir, optimize_python=True,
+                   unchecked_hash_pycs=False, used=None):
+    '''
+    Return a compiled version of `python_file` (whose contents hash to
+    `digest`) from the `cache_dir`, compiling it only on a cache miss.
+
+    The path of `python_file` is part of the key, since the .pyc records it
+    (``co_filename``): identical files, e.g. empty ``__init__.py``, each
+    have their own. If `used` is given, the name of the cached .pyc is added
+    to it, see :func:`prune_pyc_cache`.
+    '''
+    key = '{}-{}-{}-{}{}'.format(
+        digest,
+        hashlib.sha1(realpath(python_file).encode()).hexdigest()[:8],
+        'OO' if optimize_python else 'O0',
+        hashlib.sha1(str(PYTHON).encode()).hexdigest()[:8],
+        '-unchecked' if unchecked_hash_pycs else '')
+    cached_pyc = join(cache_dir, 'pyc', key + '.pyc')
+    if used is not None:
+        used.add(basename(cached_pyc))
+    if exists(cached_pyc):
+        return cached_pyc
+    compiled = compile_py_file(python_file, optimize_python=optimize_python,
+                               unchecked_hash_pycs=unchecked_hash_pycs)
+    if compiled is None:
+        return None
+    ensure_dir(dirname(cached_pyc))
+    shutil.copyfile(compiled, cached_pyc)
+    return compiled
+
+
+def prune_pyc_cache(cache_dir, payload_fns):
+    '''
+    Remove the compiled python files of `cache_dir` that none of the
+    payloads `payload_fns` built with it uses (e.g. those of the previous
+    version of the changed files), so that the cache doesn't grow with
+    every build. Returns how many were removed.
+    '''
+    pyc_dir = join(cache_dir, 'pyc')
+    if not exists(pyc_dir):
+        return 0
+    used = set()
+    for tfn in payload_fns:
+        manifest = load_payload_manifest(
+            join(cache_dir, payload_cache_key(tfn) + '.json'))
+        used.update((manifest or {}).get('pycs', []))
+    removed = 0
+    for fn in listdir(pyc_dir):
+        if fn not in used:
+            remove(join(pyc_dir, fn))
+            removed += 1
+    return removed
+
+
+def payload_cache_key(tfn):
+    '''The name the payload `tfn` is cached under, see :func:`make_tar`.'''
+    return relpath(realpath(tfn)).replace(os.sep, '_')
+
+
+def list_payload_sources(source_dirs, byte_compile_python=False,
+                         member_filter=None):
+    '''
+    Return the files of `source_dirs` to put in a payload, as sorted
+    `(path, path inside the payload)` tuples.
+    '''
+    # get the files and relpath file of all the directory we asked for
+    sources = []
+    for sd in source_dirs:
+        sd = realpath(sd)
+        for fn in listfiles(sd):
+            if is_blacklist(fn):
+                continue
+            if (byte_compile_python and fn.endswith('.pyc') and
+                    exists(fn[:-1])):
+                # left over from compiling the .py in place, it is
+                # compiled again from the source below
+                continue
+            afn = relpath(realpath(fn), sd)
+            if member_filter is not None and not member_filter(afn):
+                continue
+            sources.append((fn, afn))
+    sources.sort()  # deterministic
+    return sources
+
+
+def make_tar(tfn, source_dirs, byte_compile_python=False, optimize_python=True,
+             cache_dir=None, member_filter=None, unchecked_hash_pycs=False):
     '''
     Make a zip file `fn` from the contents of source_dis.
+
+    If `member_filter` is given, only the files whose path inside the
+    payload it returns True for are added.
+
+    The payload starts with a manifest (:data:`PAYLOAD_MANIFEST`) of the hash
+    of each of its files. Returns the hash of the payload, which is the same
+    for the same content since the payload is built deterministically.
+
+    If `cache_dir` is given, a manifest of the payload members (path, size,
+    mtime, hash) is stored there alongside a copy of the payload. When the
+    members are unchanged on the next call, the cached payload is reused
+    outright; otherwise only the changed python files are compiled again.
     '''
 
     def clean(tinfo):
@@ -159,21 +388,66 @@ def make_tar(tfn, source_dirs, byte_compile_python=False, optimize_python=True):
         tinfo.mtime = 0
         return tinfo
 
-    # get the files and relpath file of all the directory we asked for
-    files = []
-    for sd in source_dirs:
-        sd = realpath(sd)
-        for fn in listfiles(sd):
-            if is_blacklist(fn):
-                continue
-            if fn.endswith('.py') and byte_compile_python:
-                fn = compile_py_file(fn, optimize_python=optimize_python)
-            files.append((fn, relpath(realpath(fn), sd)))
-    files.sort()  # deterministic
+    sources = list_payload_sources(
+        source_dirs, byte_compile_python, member_filter)
+
+    manifest_fn = cached_tfn = manifest = None
+    if cache_dir is not None:
+        ensure_dir(cache_dir)
+        payload_key = payload_cache_key(tfn)
+        manifest_fn = join(cache_dir, payload_key + '.json')
+        cached_tfn = join(cache_dir, payload_key)
+        previous = load_payload_manifest(manifest_fn) or {}
+        manifest = {
+            'options': {
+                'byte_compile_python': byte_compile_python,
+                'optimize_python': optimize_python,
+                'unchecked_hash_pycs': unchecked_hash_pycs,
+                'python': PYTHON,
+            },
+            'members': build_payload_manifest(
+                sources, previous.get('members')),
+        }
+        if (exists(cached_tfn) and
+                previous.get('options') == manifest['options'] and
+                same_payload_members(manifest['members'],
+                                     previous.get('members') or {})):
+            print('Payload {} is unchanged, reusing it'.format(tfn))
+            shutil.copyfile(cached_tfn, tfn)
+            return file_digest(tfn)
+
+    files = {}
+    used_pycs = set()
+    for fn, afn in sources:
+        if fn.endswith('.py') and byte_compile_python:
+            if manifest is not None:
+                compiled = get_cached_pyc(
+                    fn, manifest['members'][afn][2], cache_dir,
+                    optimize_python=optimize_python,
+                    unchecked_hash_pycs=unchecked_hash_pycs,
+                    used=used_pycs)
+            else:
+                compiled = compile_py_file(
+                    fn, optimize_python=optimize_python,
+                    unchecked_hash_pycs=unchecked_hash_pycs)
+            if compiled is not None:
+                fn, afn = compiled, afn[:-3] + '.pyc'
+        files[afn] = fn
+    files = [(fn, afn) for afn, fn in sorted(files.items())]  # deterministic
 
     # create tar.gz of those files
     gf = GzipFile(tfn, 'wb', mtime=0)  # deterministic
     tf = tarfile.open(None, 'w', gf, format=tarfile.USTAR_FORMAT)
+
+    # the manifest comes first, so that the app knows which files changed
+    # before it reaches them
+    payload_manifest = ''.join(
+        '{} {}\n'.format(file_digest(fn), afn.replace(os.sep, '/'))
+        for fn, afn in files).encode('utf-8')
+    tinfo = tarfile.TarInfo(PAYLOAD_MANIFEST)
+    tinfo.size = len(payload_manifest)
+    tf.addfile(clean(tinfo), io.BytesIO(payload_manifest))
+
     dirs = []
     for fn, afn in files:
         dn = dirname(afn)
@@ -197,16 +471,225 @@ def make_tar(tfn, source_dirs, byte_compile_python=False, optimize_python=True):
     tf.close()
     gf.close()
 
+    if manifest is not None:
+        # the compiled python files of the cache this payload uses
+        manifest['pycs'] = sorted(used_pycs)
+        shutil.copyfile(tfn, cached_tfn)
+        with open(manifest_fn, 'w') as fileh:
+            json.dump(manifest, fileh, indent=1, sort_keys=True)
+
+    return file_digest(tfn)
+
+
+def make_app_zip(zfn, source_dirs, byte_compile_python=False,
+                 optimize_python=True, member_filter=None,
+                 unchecked_hash_pycs=False):
+    '''
+    Make the zip `zfn`, that the app imports its code from in place, from
+    the contents of source_dirs.
+
+    The entries are stored uncompressed and page-aligned, so that zipimport
+    reads them without inflating anything. Returns the number of files in
+    the zip.
+    '''
+    files = zip_payload_files(
+        list_payload_sources(source_dirs, byte_compile_python, member_filter),
+        byte_compile_python, optimize_python, unchecked_hash_pycs)
+    write_zip(zfn, files, compression='stored', align=APP_ZIP_ALIGNMENT)
+    return len(files)
+
 
-def compile_py_file(python_file, optimize_python=True):
+def deflated_size(fn):
+    '''The size of `fn` once compressed, as it is in the APK.'''
+    with open(fn, 'rb') as fileh:
+        return len(zlib.compress(fileh.read()))
+
+
+def make_python_bundle_zip(zfn, bundle_dir, byte_compile_python=False,
+                           optimize_python=True, on_disk=(),
+                           unchecked_hash_pycs=False):
+    '''
+    Make the zip `zfn` of the part of the python bundle in `bundle_dir` that
+    can be imported in place: the stdlib (the entries of stdlib.zip) at the
+    root, and the pure python site-packages under ``site-packages/``. The
+    entries are stored uncompressed and page-aligned.
+
+    Returns the paths of the bundle files that the zip replaces, relative
+    to `bundle_dir`, which are left out of libpybundle.so.
+    '''
+    python_bundle_dir = join(bundle_dir, '_python_bundle')
+    stdlib_zip = join(python_bundle_dir, 'stdlib.zip')
+    site_packages_dir = join(python_bundle_dir, 'site-packages')
+    replaced = set()
+    stdlib_dir = tempfile.mkdtemp(prefix='p4a-stdlib-')
+    try:
+        files = {}
+        if exists(stdlib_zip):
+            with zipfile.ZipFile(stdlib_zip) as zf:
+                zf.extractall(stdlib_dir)
+                for name in zf.namelist():
+                    if not name.endswith('/'):
+                        files[name] = join(stdlib_dir, name)
+            replaced.add(relpath(stdlib_zip, bundle_dir))
+        if exists(site_packages_dir):
+            sources = dict(
+                (afn, fn) for fn, afn in
+                list_payload_sources([site_packages_dir], byte_compile_python))
+            in_place, _ = split_in_place_files(sources, on_disk=on_disk)
+            for afn, fn in zip_payload_files(
+                    [(sources[afn], afn) for afn in in_place],
+                    byte_compile_python, optimize_python,
+                    unchecked_hash_pycs).items():
+                files['site-packages/' + afn] = fn
+            replaced.update(join(relpath(site_packages_dir, bundle_dir), afn)
+                            for afn in in_place)
+        write_zip(zfn, files, compression='stored', align=APP_ZIP_ALIGNMENT)
+    finally:
+        rmdir(stdlib_dir)
+    return replaced
+
+
+def top_level_modules(paths):
+    '''
+    Return the top-level modules of the files `paths` (relative to a
+    ``sys.path`` entry, with ``/`` separators): ``{name: is_package}``,
+    where namespace packages (directories without ``__init__``) are
+    ``None``.
+    '''
+    modules = {}
+    for path in paths:
+        parts = path.split('/')
+        if len(parts) > 1:
+            name = parts[0]
+            if parts[1:] in (['__init__.py'], ['__init__.pyc']):
+                modules[name] = True
+            else:
+                modules.setdefault(name, None)
+        elif path.endswith(('.py', '.pyc', '.so')):
+            name = path.split('.')[0]
+            modules.setdefault(name, False)
+    return {name: kind for name, kind in modules.items()
+            if name.isidentifier()}
+
+
+def make_import_index(ifn, bundle_dir, app_dirs, in_place_files=()):
+    '''
+    Write the import index `ifn` of the python bundle in `bundle_dir`: the
+    top-level modules of each ``sys.path`` entry the bundle is imported from
+    (see start.c), in ``sys.path`` order, with the entry suffix first::
+
+        /_python_bundle/stdlib.zip abc argparse asyncio ...
+        /_python_bundle/modules _ctypes _decimal ...
+
+    A module is only listed in the first entry that holds it. The modules
+    of the app dirs `app_dirs` (e.g. a ``json.py`` shadowing the stdlib) and
+    the namespace packages are left out, their imports go through
+    ``sys.path``. With ``--python-bundle-zip``, `in_place_files` are the
+    bundle files in the bundle zip.
+
+    Returns the number of modules listed.
+    '''
+    python_bundle_dir = join(bundle_dir, '_python_bundle')
+    site_packages = relpath(join(python_bundle_dir, 'site-packages'),
+                            bundle_dir)
+    zipped = [relpath(afn, site_packages) for afn in in_place_files
+              if afn.startswith(site_packages + '/')]
+    extracted = []
+    if exists(join(python_bundle_dir, 'site-packages')):
+        extracted = [
+            afn for afn in (
+                relpath(fn, join(python_bundle_dir, 'site-packages'))
+                for fn in listfiles(join(python_bundle_dir, 'site-packages')))
+            if afn not in zipped]
+    stdlib = []
+    if exists(join(python_bundle_dir, 'stdlib.zip')):
+        with zipfile.ZipFile(join(python_bundle_dir, 'stdlib.zip')) as zf:
+            stdlib = [name for name in zf.namelist()
+                      if not name.endswith('/')]
+    modules = []
+    if exists(join(python_bundle_dir, 'modules')):
+        modules = listdir(join(python_bundle_dir, 'modules'))
+
+    if in_place_files:
+        roots = [
+            ('/' + PYBUNDLE_ZIP_LIB, stdlib),
+            ('/_python_bundle/modules', modules),
+            ('/_python_bundle/site-packages', extracted),
+            ('/{}/site-packages'.format(PYBUNDLE_ZIP_LIB), zipped),
+        ]
+    else:
+        roots = [
+            ('/_python_bundle/stdlib.zip', stdlib),
+            ('/_python_bundle/modules', modules),
+            ('/_python_bundle/site-packages', extracted),
+        ]
+
+    # modules imported through sys.path
+    skipped = set()
+    for app_dir in app_dirs:
+        skipped.update(top_level_modules(listdir(app_dir)))
+        skipped.update(name for name in listdir(app_dir)
+                       if not isfile(join(app_dir, name)))
+    root_modules = [top_level_modules(paths) for _, paths in roots]
+    for found in root_modules:
+        skipped.update(name for name, kind in found.items() if kind is None)
+
+    count = 0
+    with open(ifn, 'w') as fileh:
+        for (suffix, _), found in zip(roots, root_modules):
+            names = sorted(set(found) - skipped)
+            skipped.update(names)
+            count += len(names)
+            fileh.write(' '.join([suffix] + names) + '\n')
+    return count
+
+
+def zip_payload_files(sources, byte_compile_python=False,
+                      optimize_python=True, unchecked_hash_pycs=False):
+    '''
+    Return the files of a zip payload (see :func:`write_zip`) made from
+    `sources`, the `(path, path inside the payload)` tuples returned by
+    :func:`list_payload_sources`, with the .py files compiled if asked to.
+    '''
+    files = {}
+    for fn, afn in sources:
+        if fn.endswith('.py') and byte_compile_python:
+            compiled = compile_py_file(
+                fn, optimize_python=optimize_python,
+                unchecked_hash_pycs=unchecked_hash_pycs)
+            if compiled is not None:
+                fn, afn = compiled, afn[:-3] + '.pyc'
+        files[afn.replace(os.sep, '/')] = fn
+    return files
+
+
+def make_library_load_plan(libs_dir):
+    '''
+    Return the libraries of `libs_dir` the app loads at startup, in
+    dependency order and named as ``System.loadLibrary`` expects them
+    (``libssl.so`` is ``ssl``), from the ``NEEDED`` entries of their ELF
+    dynamic section.
+    '''
+    return [name[len('lib'):-len('.so')]
+            for name in library_load_order(libs_dir, LOADED_LIBRARIES)]
+
+
+def compile_py_file(python_file, optimize_python=True,
+                    unchecked_hash_pycs=False):
     '''
     Compile python_file to *.pyc and return the filename of the *.pyc file.
+
+    With `unchecked_hash_pycs`, the .pyc is hash-based and never checked
+    against its source (PEP 552): it only depends on the source contents,
+    and the app doesn't look for the source when importing it.
     '''
 
     if PYTHON is None:
         return
 
     args = [PYTHON, '-m', 'compileall', '-b', '-f', python_file]
+    if unchecked_hash_pycs:
+        args[-1:-1] = ['--invalidation-mode', 'unchecked-hash']
     if optimize_python:
         # -OO = strip docstrings
         args.insert(1, '-OO')
@@ -254,12 +737,23 @@ main.py that loads it.''')
             f.write("KIVY_ORIENTATION=" + str(args.sdl_orientation_hint) + "\n")
         f.write("P4A_NUMERIC_VERSION=" + str(args.numeric_version) + "\n")
         f.write("P4A_MINSDK=" + str(args.min_sdk_version) + "\n")
+        if getattr(args, "profile_imports", False):
+            f.write("PYTHONPROFILEIMPORTTIME=1\n")
+        if getattr(args, "log_flush_interval", None) is not None:
+            f.write("P4A_LOG_FLUSH_INTERVAL_MS={}\n".format(
+                args.log_flush_interval))
+        if getattr(args, "log_rate_limit", None) is not None:
+            f.write("P4A_LOG_RATE_LIMIT={}\n".format(args.log_rate_limit))
 
     # Package up the private data (public not supported).
     use_setup_py = get_dist_info_for("use_setup_py",
                                      error_if_missing=False) is True
     private_tar_dirs = [env_vars_tarpath]
     _temp_dirs_to_clean = []
+    # The content hash of each payload, which the app compares to the one
+    # it extracted last to know whether to extract it again
+    payload_versions = {}
+    pybundle_versions = {}
     try:
         if args.private:
             if not use_setup_py or (
@@ -313,20 +807,137 @@ main.py that loads it.''')
                 shutil.copytree(realpath(asset_src), join(assets_dir, asset_dest))
 
         if args.private or args.launcher:
-            for arch in get_dist_info_for("archs"):
+            payload_cache_dir = (
+                PAYLOAD_CACHE_DIR if args.payload_cache else None)
+            archs = get_dist_info_for("archs")
+            bundle_dirs = [f"_python_bundle__{arch}" for arch in archs]
+            # the files imported in place from the bundle zip of each arch
+            in_place_files = set()
+            for arch, bundle_dir in zip(archs, bundle_dirs):
+                bundle_zip = join(f"libs/{arch}", PYBUNDLE_ZIP_LIB)
+                if args.python_bundle_zip:
+                    in_place_files.update(make_python_bundle_zip(
+                        bundle_zip, bundle_dir,
+                        byte_compile_python=args.byte_compile_python,
+                        optimize_python=args.optimize_python,
+                        unchecked_hash_pycs=args.unchecked_hash_pycs,
+                        on_disk=args.python_bundle_zip_extract,
+                    ))
+                    print('Python bundle: {} ({:.1f} MiB) imported in '
+                          'place for {}'.format(
+                              PYBUNDLE_ZIP_LIB,
+                              os.path.getsize(bundle_zip) / 2**20, arch))
+                elif exists(bundle_zip):
+                    remove(bundle_zip)
+            if args.import_index:
+                shutil.copy(join(curdir, IMPORT_INDEX_FINDER), env_vars_tarpath)
+                indexed = make_import_index(
+                    join(env_vars_tarpath, IMPORT_INDEX), bundle_dirs[0],
+                    private_tar_dirs, in_place_files)
+                print('Import index: {} top-level modules in {}'.format(
+                    indexed, IMPORT_INDEX))
+            common_files = set()
+            if args.dedupe_python_bundle and len(archs) > 1:
+                common_files = find_arch_independent_files(
+                    bundle_dirs) - in_place_files
+            for arch, bundle_dir in zip(archs, bundle_dirs):
                 libs_dir = f"libs/{arch}"
-                make_tar(
+                pybundle_versions[arch.replace("-", "_")] = make_tar(
                     join(libs_dir, "libpybundle.so"),
-                    [f"_python_bundle__{arch}"],
+                    [bundle_dir],
+                    byte_compile_python=args.byte_compile_python,
+                    optimize_python=args.optimize_python,
+                    unchecked_hash_pycs=args.unchecked_hash_pycs,
+                    cache_dir=payload_cache_dir,
+                    member_filter=lambda afn: (
+                        afn not in common_files and
+                        afn not in in_place_files),
+                )
+            if common_files:
+                payload_versions[PYBUNDLE_COMMON_ASSET] = make_tar(
+                    join(assets_dir, PYBUNDLE_COMMON_ASSET),
+                    [bundle_dirs[0]],
+                    byte_compile_python=args.byte_compile_python,
+                    optimize_python=args.optimize_python,
+                    unchecked_hash_pycs=args.unchecked_hash_pycs,
+                    cache_dir=payload_cache_dir,
+                    member_filter=common_files.__contains__,
+                )
+                common_size = os.path.getsize(
+                    join(assets_dir, PYBUNDLE_COMMON_ASSET))
+                arch_sizes = ', '.join(
+                    '{} {:.1f} MiB'.format(
+                        arch, os.path.getsize(
+                            join(f"libs/{arch}", "libpybundle.so")) / 2**20)
+                    for arch in archs)
+                print('Python bundle: {} arch-independent files in {} '
+                      '({:.1f} MiB), per-arch libpybundle.so: {}. Saved '
+                      '{:.1f} MiB of duplicated payloads'.format(
+                          len(common_files), PYBUNDLE_COMMON_ASSET,
+                          common_size / 2**20, arch_sizes,
+                          common_size * (len(archs) - 1) / 2**20))
+            if args.private_zip:
+                def extracted(afn):
+                    return any(fnmatch(afn, pattern)
+                               for pattern in args.private_zip_extract)
+
+                app_zip = join(f"libs/{archs[0]}", APP_ZIP_LIB)
+                zipped = make_app_zip(
+                    app_zip,
+                    private_tar_dirs[1:],
                     byte_compile_python=args.byte_compile_python,
                     optimize_python=args.optimize_python,
+                    unchecked_hash_pycs=args.unchecked_hash_pycs,
+                    member_filter=lambda afn: not extracted(afn),
                 )
-            make_tar(
+                # zipimport needs it on disk, and only the libs of the
+                # device ABI are installed there (nativeLibraryDir)
+                for arch in archs[1:]:
+                    shutil.copyfile(app_zip, join(f"libs/{arch}", APP_ZIP_LIB))
+                print('App code: {} files in {} ({:.1f} KiB), imported in '
+                      'place'.format(zipped, APP_ZIP_LIB,
+                                     os.path.getsize(app_zip) / 1024))
+                if len(archs) > 1:
+                    print('App code: {} is in the native libs of each of the '
+                          '{} archs, {:.1f} KiB more in a universal APK than '
+                          'a single copy (nothing more in the per-ABI APKs '
+                          'of an app bundle)'.format(
+                              APP_ZIP_LIB, len(archs),
+                              (len(archs) - 1) * deflated_size(app_zip) /
+                              1024))
+
+                # only the env vars, the import index and the files asked
+                # for are extracted
+                env_files = {
+                    "p4a_env_vars.txt", IMPORT_INDEX, IMPORT_INDEX_FINDER,
+                    IMPORT_INDEX_FINDER + "c"}
+
+                def private_filter(afn):
+                    return afn in env_files or extracted(afn)
+            else:
+                private_filter = None
+                for arch in archs:
+                    if exists(join(f"libs/{arch}", APP_ZIP_LIB)):
+                        remove(join(f"libs/{arch}", APP_ZIP_LIB))
+            payload_versions["private.tar"] = make_tar(
                 join(assets_dir, "private.tar"),
                 private_tar_dirs,
                 byte_compile_python=args.byte_compile_python,
                 optimize_python=args.optimize_python,
+                unchecked_hash_pycs=args.unchecked_hash_pycs,
+                cache_dir=payload_cache_dir,
+                member_filter=private_filter,
             )
+            if payload_cache_dir is not None:
+                cached_payloads = [join(assets_dir, "private.tar")] + [
+                    join(f"libs/{arch}", "libpybundle.so") for arch in archs]
+                if common_files:
+                    cached_payloads.append(
+                        join(assets_dir, PYBUNDLE_COMMON_ASSET))
+                pruned = prune_pyc_cache(payload_cache_dir, cached_payloads)
+                if pruned:
+                    print('Payload cache: removed {} compiled python files '
+                          'no payload uses anymore'.format(pruned))
     finally:
         for directory in _temp_dirs_to_clean:
             rmdir(directory)
@@ -334,6 +945,16 @@ main.py that loads it.''')
     # Remove extra env vars tar-able directory:
     rmdir(env_vars_tarpath)
 
+    # The libraries the app loads, so that it doesn't look for them at
+    # runtime
+    native_libs = {}
+    for arch in get_dist_info_for("archs"):
+        if exists(f"libs/{arch}"):
+            libs = make_library_load_plan(f"libs/{arch}")
+            native_libs[arch.replace("-", "_")] = libs
+            print('Native libraries loaded for {}: {}'.format(
+                arch, ', '.join(libs)))
+
     # Prepare some variables for templating process
     res_dir = "src/main/res"
     res_dir_initial = "src/res_initial"
@@ -598,18 +1219,17 @@ main.py that loads it.''')
         versioned_name=versioned_name)
 
     # String resources:
-    timestamp = time.time()
-    if 'SOURCE_DATE_EPOCH' in environ:
-        # for reproducible builds
-        timestamp = int(environ['SOURCE_DATE_EPOCH'])
-    private_version = "{} {} {}".format(
-        args.version,
-        args.numeric_version,
-        timestamp
-    )
+    private_version = payload_versions.get("private.tar")
+    if private_version is None:
+        private_version = hashlib.sha1("{} {}".format(
+            args.version, args.numeric_version).encode()).hexdigest()
     render_args = {
         "args": args,
-        "private_version": hashlib.sha1(private_version.encode()).hexdigest()
+        "private_version": private_version,
+        "pybundle_versions": pybundle_versions,
+        "native_libs": native_libs,
+        "pybundle_common_version": payload_versions.get(
+            PYBUNDLE_COMMON_ASSET),
     }
     if is_sdl_bootstrap():
         render_args["url_scheme"] = url_scheme
@@ -840,6 +1460,11 @@ tools directory of the Android SDK.
     ap.add_argument('--native-service', dest='native_services', action='append', default=[],
                     help='Declare a new native service: '
                          'package.name.service')
+    ap.add_argument('--service-host', dest='service_host', action='store_true',
+                    help=('Run the services declared with --service in a '
+                          'single process, each one in its own python '
+                          'subinterpreter (python 3.14+), instead of a '
+                          'process per service. Needs the android recipe.'))
     if get_bootstrap_name() != "service_only":
         ap.add_argument('--presplash', dest='presplash',
                         help=('A jpeg file to use as a screen while the '
@@ -978,6 +1603,67 @@ tools directory of the Android SDK.
                     action='store_false', default=True,
                     help=('Whether to compile to optimised .pyc files, using -OO '
                           '(strips docstrings and asserts)'))
+    ap.add_argument('--unchecked-hash-pycs', dest='unchecked_hash_pycs',
+                    action='store_true', default=False,
+                    help=('Compile to unchecked hash-based .pyc files (PEP '
+                          '552), that the app imports without checking them '
+                          'against their source, and that only depend on the '
+                          'source contents'))
+    ap.add_argument('--no-payload-cache', dest='payload_cache',
+                    action='store_false', default=True,
+                    help=('Always rebuild private.tar and libpybundle.so from '
+                          'scratch instead of reusing unchanged payloads and '
+                          'compiled files from the previous build'))
+    ap.add_argument('--private-zip', dest='private_zip',
+                    action='store_true', default=False,
+                    help=('Ship the app code as an uncompressed zip in the '
+                          'native libs dir that is imported in place, '
+                          'instead of extracting it on the first launch'))
+    ap.add_argument('--private-zip-extract', dest='private_zip_extract',
+                    action='append', default=[],
+                    help=('With --private-zip, a pattern (matched against '
+                          'the paths in the app dir) of files that are still '
+                          'extracted, e.g. files the app opens by path. Can '
+                          'be used multiple times'))
+    ap.add_argument('--python-bundle-zip', dest='python_bundle_zip',
+                    action='store_true', default=False,
+                    help=('Ship the stdlib and the pure python site-packages '
+                          'as an uncompressed zip in the native libs dir that '
+                          'is imported in place, so that only the extension '
+                          'modules are extracted on the first launch'))
+    ap.add_argument('--python-bundle-zip-extract',
+                    dest='python_bundle_zip_extract',
+                    action='append', default=[],
+                    help=('With --python-bundle-zip, a top level '
+                          'site-packages module that is still extracted, e.g. '
+                          'a package opening its data files by path. Can be '
+                          'used multiple times'))
+    ap.add_argument('--import-index', dest='import_index',
+                    action='store_true', default=False,
+                    help=('Write an index of the top-level modules of the '
+                          'python bundle, that the app resolves its imports '
+                          'with instead of looking for them in each sys.path '
+                          'entry'))
+    ap.add_argument('--no-dedupe-python-bundle', dest='dedupe_python_bundle',
+                    action='store_false', default=True,
+                    help=('Ship the whole python bundle in the libpybundle.so '
+                          'of every arch, instead of storing the files that '
+                          'are the same for every arch once in the assets'))
+    ap.add_argument('--profile-imports', dest='profile_imports',
+                    action='store_true', default=False,
+                    help=('Log the import time of every module at startup '
+                          '(python -X importtime), e.g. to record the import '
+                          'trace the stdlib is pruned with'))
+    ap.add_argument('--log-flush-interval', dest='log_flush_interval',
+                    type=int, default=None,
+                    help=('How many milliseconds the lines printed by python '
+                          'are buffered at most, to be logged in batches '
+                          '(100 by default, 0 to log them on every write)'))
+    ap.add_argument('--log-rate-limit', dest='log_rate_limit', type=int,
+                    default=None,
+                    help=('Log at most this many lines printed by python per '
+                          'second, and drop the others (unlimited by '
+                          'default)'))
     ap.add_argument('--extra-manifest-xml', default='',
                     help=('Extra xml to write directly inside the <manifest> element of'
                           'AndroidManifest.xml'))
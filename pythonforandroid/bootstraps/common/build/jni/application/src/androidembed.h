@@ -0,0 +1,463 @@
+/* The androidembed module, that python's stdout and stderr are redirected to
+ * logcat with.
+ *
+ * Its log entries are written with P4A_LOG_SINK, __android_log_write unless
+ * it is defined before including this file: tests/test_androidembed.py
+ * builds the module on the host with a stub sink.
+ */
+#ifndef P4A_ANDROIDEMBED_H
+#define P4A_ANDROIDEMBED_H
+
+#include <pthread.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#ifndef P4A_LOG_SINK
+#include "android/log.h"
+#define P4A_LOG_SINK __android_log_write
+#endif
+
+static PyObject *androidembed_log(PyObject *self, PyObject *args) {
+  char *logstr = NULL;
+  char *tag = NULL;
+  if (!PyArg_ParseTuple(args, "s|s", &logstr, &tag)) {
+    return NULL;
+  }
+  P4A_LOG_SINK(ANDROID_LOG_INFO, tag != NULL ? tag : getenv("PYTHON_NAME"),
+               logstr);
+  Py_RETURN_NONE;
+}
+
+static PyMethodDef AndroidEmbedMethods[] = {
+    {"log", androidembed_log, METH_VARARGS,
+     "Log on android platform, with the tag PYTHON_NAME or the given one"},
+    {NULL, NULL, 0, NULL}};
+
+#if PY_MAJOR_VERSION >= 3
+#include "structmember.h"
+
+/* androidembed.LogWriter: a text file writing to logcat, that coalesces the
+ * lines written into as few log entries as it can. The complete lines are
+ * logged once buffer_size bytes are pending, or flush_interval seconds after
+ * the first of them was written (by a thread of the writer, which doesn't
+ * need the GIL), or on flush(). A line longer than a log entry is split.
+ *
+ * With a rate, at most that many lines per second (with bursts of as many)
+ * are logged, the others are dropped, and counted in the log.
+ */
+
+/* the longest message logcat doesn't truncate (LOGGER_ENTRY_MAX_PAYLOAD,
+ * less the priority, the tag and the NULs) */
+#define LOG_ENTRY_MAX 4000
+
+typedef struct {
+  PyObject_HEAD
+  pthread_mutex_t lock;
+  pthread_cond_t cond;
+  pthread_t flusher;
+  int flusher_started;
+  int closed;
+  char *tag;
+  int priority;
+  /* the pending text, the complete lines first */
+  char *buffer;
+  size_t buffer_size;
+  size_t length;
+  size_t complete;
+  /* when the first of the complete lines was written, 0 if none */
+  long long pending_since;
+  long long flush_interval;
+  /* the rate limiter, a bucket of rate tokens, one per line */
+  double rate;
+  double tokens;
+  long long tokens_time;
+  unsigned long long dropped;
+  unsigned long long dropped_reported;
+  unsigned long long entries;
+} LogWriter;
+
+static long long log_writer_now(void) {
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (long long)ts.tv_sec * 1000000000LL + ts.tv_nsec;
+}
+
+static void log_writer_entry(LogWriter *self, const char *text, size_t len) {
+  char entry[LOG_ENTRY_MAX + 1];
+  memcpy(entry, text, len);
+  entry[len] = '\0';
+  P4A_LOG_SINK(self->priority,
+               self->tag != NULL ? self->tag : getenv("PYTHON_NAME"), entry);
+  self->entries++;
+}
+
+/* the end of the next log entry of text, at the last new line that fits, or
+ * else at the last UTF-8 character boundary */
+static size_t log_writer_split(const char *text, size_t len) {
+  size_t end;
+  if (len <= LOG_ENTRY_MAX) {
+    return len;
+  }
+  for (end = LOG_ENTRY_MAX; end > 0; end--) {
+    if (text[end - 1] == '\n') {
+      return end;
+    }
+  }
+  end = LOG_ENTRY_MAX;
+  while (end > 0 && (text[end] & 0xC0) == 0x80) {
+    end--;
+  }
+  return end > 0 ? end : LOG_ENTRY_MAX;
+}
+
+/* refill the bucket of the rate limiter */
+static void log_writer_refill(LogWriter *self) {
+  long long now = log_writer_now();
+  self->tokens += (now - self->tokens_time) * self->rate / 1e9;
+  if (self->tokens > self->rate) {
+    self->tokens = self->rate;
+  }
+  self->tokens_time = now;
+}
+
+/* how many of the lines of text the rate limiter lets through, as a length */
+static size_t log_writer_limit(LogWriter *self, const char *text, size_t len) {
+  size_t pos = 0, i;
+  const char *eol;
+
+  while (pos < len && self->tokens >= 1) {
+    eol = memchr(text + pos, '\n', len - pos);
+    pos = eol != NULL ? (size_t)(eol - text) + 1 : len;
+    self->tokens -= 1;
+  }
+  for (i = pos; i < len; i++) {
+    if (text[i] == '\n' || i == len - 1) {
+      self->dropped++;
+    }
+  }
+  return pos;
+}
+
+/* log the first len bytes of the buffer, and drop them from it; with the
+ * lock held */
+static void log_writer_emit(LogWriter *self, size_t len) {
+  const char *text = self->buffer;
+  size_t remaining = len, end;
+
+  if (self->rate > 0) {
+    log_writer_refill(self);
+    if (self->dropped > self->dropped_reported && self->tokens >= 1) {
+      char notice[80];
+      snprintf(notice, sizeof(notice),
+               "[%llu lines dropped by the log rate limit]",
+               self->dropped - self->dropped_reported);
+      self->dropped_reported = self->dropped;
+      log_writer_entry(self, notice, strlen(notice));
+    }
+    remaining = log_writer_limit(self, text, len);
+  }
+  while (remaining > 0) {
+    end = log_writer_split(text, remaining);
+    /* the new line ending an entry is implied */
+    log_writer_entry(self, text,
+                     text[end - 1] == '\n' ? end - 1 : end);
+    text += end;
+    remaining -= end;
+  }
+
+  memmove(self->buffer, self->buffer + len, self->length - len);
+  self->length -= len;
+  self->complete = self->complete > len ? self->complete - len : 0;
+  if (self->complete == 0) {
+    self->pending_since = 0;
+  }
+}
+
+static void *log_writer_flusher(void *arg) {
+  LogWriter *self = (LogWriter *)arg;
+  struct timespec deadline;
+  long long due;
+
+  pthread_mutex_lock(&self->lock);
+  while (!self->closed) {
+    if (self->pending_since == 0) {
+      pthread_cond_wait(&self->cond, &self->lock);
+      continue;
+    }
+    due = self->pending_since + self->flush_interval;
+    if (log_writer_now() >= due) {
+      log_writer_emit(self, self->complete);
+      continue;
+    }
+    deadline.tv_sec = due / 1000000000LL;
+    deadline.tv_nsec = due % 1000000000LL;
+    pthread_cond_timedwait(&self->cond, &self->lock, &deadline);
+  }
+  pthread_mutex_unlock(&self->lock);
+  return NULL;
+}
+
+static int LogWriter_init(LogWriter *self, PyObject *args, PyObject *kwargs) {
+  static char *kwlist[] = {"tag", "priority", "buffer_size", "flush_interval",
+                           "rate", NULL};
+  const char *tag = NULL;
+  char *buffer, *tag_copy;
+  int priority = ANDROID_LOG_INFO;
+  Py_ssize_t buffer_size = LOG_ENTRY_MAX;
+  double flush_interval = 0.1, rate = 0;
+  pthread_condattr_t condattr;
+
+  if (self->buffer != NULL) {
+    PyErr_SetString(PyExc_RuntimeError, "LogWriter already initialized");
+    return -1;
+  }
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|zindd", kwlist, &tag,
+                                   &priority, &buffer_size, &flush_interval,
+                                   &rate)) {
+    return -1;
+  }
+  if (buffer_size < 1 || flush_interval < 0 || rate < 0) {
+    PyErr_SetString(PyExc_ValueError,
+                    "buffer_size must be positive, flush_interval and rate "
+                    "must not be negative");
+    return -1;
+  }
+  buffer = PyMem_RawMalloc(buffer_size);
+  tag_copy = tag != NULL ? strdup(tag) : NULL;
+  if (buffer == NULL || (tag != NULL && tag_copy == NULL)) {
+    PyMem_RawFree(buffer);
+    free(tag_copy);
+    PyErr_NoMemory();
+    return -1;
+  }
+  self->buffer = buffer;
+  self->tag = tag_copy;
+  self->buffer_size = buffer_size;
+  self->priority = priority;
+  self->flush_interval = (long long)(flush_interval * 1e9);
+  self->rate = rate;
+  self->tokens = rate;
+  self->tokens_time = log_writer_now();
+
+  pthread_mutex_init(&self->lock, NULL);
+  pthread_condattr_init(&condattr);
+  pthread_condattr_setclock(&condattr, CLOCK_MONOTONIC);
+  pthread_cond_init(&self->cond, &condattr);
+  pthread_condattr_destroy(&condattr);
+  return 0;
+}
+
+static PyObject *LogWriter_write(LogWriter *self, PyObject *arg) {
+  const char *data, *nul, *eol;
+  char *start;
+  Py_ssize_t size, i, chunk;
+  int start_flusher;
+
+  if (!PyUnicode_Check(arg)) {
+    PyErr_Format(PyExc_TypeError, "write() argument must be str, not %.100s",
+                 Py_TYPE(arg)->tp_name);
+    return NULL;
+  }
+  if (self->buffer == NULL || self->closed) {
+    PyErr_SetString(PyExc_ValueError, "I/O operation on closed file.");
+    return NULL;
+  }
+  data = PyUnicode_AsUTF8AndSize(arg, &size);
+  if (data == NULL) {
+    return NULL;
+  }
+
+  pthread_mutex_lock(&self->lock);
+  nul = memchr(data, '\0', size);
+  for (i = 0; i < size; i += chunk) {
+    /* logcat messages end at the first NUL */
+    if (data + i == nul) {
+      chunk = 1;
+      nul = memchr(data + i + 1, '\0', size - i - 1);
+      continue;
+    }
+    chunk = (nul != NULL ? nul - data : size) - i;
+    if ((size_t)chunk > self->buffer_size - self->length) {
+      chunk = self->buffer_size - self->length;
+    }
+    start = self->buffer + self->length;
+    memcpy(start, data + i, chunk);
+    self->length += chunk;
+    for (eol = start + chunk - 1; eol >= start && *eol != '\n'; eol--) {
+    }
+    if (eol >= start) {
+      self->complete = eol - self->buffer + 1;
+      if (self->pending_since == 0) {
+        self->pending_since = log_writer_now();
+        pthread_cond_signal(&self->cond);
+      }
+    }
+    if (self->length == self->buffer_size) {
+      /* a line longer than the buffer is logged in pieces */
+      log_writer_emit(self, self->complete > 0 ? self->complete
+                                               : self->length);
+    }
+  }
+  if (self->complete > 0 && self->flush_interval == 0) {
+    log_writer_emit(self, self->complete);
+  }
+  start_flusher = self->pending_since != 0 && !self->flusher_started;
+  pthread_mutex_unlock(&self->lock);
+
+  if (start_flusher) {
+    self->flusher_started =
+        pthread_create(&self->flusher, NULL, log_writer_flusher, self) == 0;
+  }
+  return PyLong_FromSsize_t(PyUnicode_GET_LENGTH(arg));
+}
+
+static PyObject *LogWriter_flush(LogWriter *self, PyObject *unused) {
+  if (self->buffer != NULL) {
+    pthread_mutex_lock(&self->lock);
+    log_writer_emit(self, self->complete);
+    pthread_mutex_unlock(&self->lock);
+  }
+  Py_RETURN_NONE;
+}
+
+static void log_writer_close(LogWriter *self) {
+  if (self->buffer == NULL || self->closed) {
+    return;
+  }
+  pthread_mutex_lock(&self->lock);
+  /* the last line too, even without its new line */
+  log_writer_emit(self, self->length);
+  self->closed = 1;
+  pthread_cond_signal(&self->cond);
+  pthread_mutex_unlock(&self->lock);
+  if (self->flusher_started) {
+    Py_BEGIN_ALLOW_THREADS
+    pthread_join(self->flusher, NULL);
+    Py_END_ALLOW_THREADS
+    self->flusher_started = 0;
+  }
+}
+
+static PyObject *LogWriter_close(LogWriter *self, PyObject *unused) {
+  log_writer_close(self);
+  Py_RETURN_NONE;
+}
+
+static PyObject *LogWriter_false(LogWriter *self, PyObject *unused) {
+  Py_RETURN_FALSE;
+}
+
+static PyObject *LogWriter_true(LogWriter *self, PyObject *unused) {
+  Py_RETURN_TRUE;
+}
+
+static PyObject *LogWriter_fileno(LogWriter *self, PyObject *unused) {
+  PyObject *io = PyImport_ImportModule("io");
+  PyObject *exc;
+  if (io == NULL) {
+    return NULL;
+  }
+  exc = PyObject_GetAttrString(io, "UnsupportedOperation");
+  Py_DECREF(io);
+  if (exc != NULL) {
+    PyErr_SetString(exc, "fileno");
+    Py_DECREF(exc);
+  }
+  return NULL;
+}
+
+static PyObject *LogWriter_get_closed(LogWriter *self, void *closure) {
+  return PyBool_FromLong(self->closed);
+}
+
+static PyObject *LogWriter_get_encoding(LogWriter *self, void *closure) {
+  return PyUnicode_FromString("utf-8");
+}
+
+static void LogWriter_dealloc(LogWriter *self) {
+  PyTypeObject *tp = Py_TYPE(self);
+  log_writer_close(self);
+  if (self->buffer != NULL) {
+    pthread_cond_destroy(&self->cond);
+    pthread_mutex_destroy(&self->lock);
+    PyMem_RawFree(self->buffer);
+  }
+  free(self->tag);
+  tp->tp_free((PyObject *)self);
+  Py_DECREF(tp);
+}
+
+static PyMethodDef LogWriter_methods[] = {
+    {"write", (PyCFunction)LogWriter_write, METH_O,
+     "Log the complete lines of the text, once flushed"},
+    {"flush", (PyCFunction)LogWriter_flush, METH_NOARGS,
+     "Log the complete lines written"},
+    {"close", (PyCFunction)LogWriter_close, METH_NOARGS,
+     "Log everything written, and stop the writer"},
+    {"fileno", (PyCFunction)LogWriter_fileno, METH_NOARGS, NULL},
+    {"isatty", (PyCFunction)LogWriter_false, METH_NOARGS, NULL},
+    {"readable", (PyCFunction)LogWriter_false, METH_NOARGS, NULL},
+    {"seekable", (PyCFunction)LogWriter_false, METH_NOARGS, NULL},
+    {"writable", (PyCFunction)LogWriter_true, METH_NOARGS, NULL},
+    {NULL, NULL, 0, NULL}};
+
+static PyMemberDef LogWriter_members[] = {
+    {"entries", T_ULONGLONG, offsetof(LogWriter, entries), READONLY,
+     "The number of log entries written"},
+    {"dropped", T_ULONGLONG, offsetof(LogWriter, dropped), READONLY,
+     "The number of lines dropped by the rate limiter"},
+    {NULL, 0, 0, 0, NULL}};
+
+static PyGetSetDef LogWriter_getset[] = {
+    {"closed", (getter)LogWriter_get_closed, NULL, NULL, NULL},
+    {"encoding", (getter)LogWriter_get_encoding, NULL, NULL, NULL},
+    {NULL, NULL, NULL, NULL, NULL}};
+
+static PyType_Slot LogWriter_slots[] = {
+    {Py_tp_doc, "LogWriter(tag=None, priority=ANDROID_LOG_INFO, "
+                "buffer_size=4000, flush_interval=0.1, rate=0)\n\n"
+                "A text file writing its lines to logcat, in batches"},
+    {Py_tp_init, LogWriter_init},
+    {Py_tp_dealloc, LogWriter_dealloc},
+    {Py_tp_methods, LogWriter_methods},
+    {Py_tp_members, LogWriter_members},
+    {Py_tp_getset, LogWriter_getset},
+    {0, NULL}};
+
+static PyType_Spec LogWriter_spec = {"androidembed.LogWriter",
+                                     sizeof(LogWriter), 0, Py_TPFLAGS_DEFAULT,
+                                     LogWriter_slots};
+
+static int androidembed_exec(PyObject *module) {
+  PyObject *type = PyType_FromSpec(&LogWriter_spec);
+  if (type == NULL || PyModule_AddObject(module, "LogWriter", type) < 0) {
+    Py_XDECREF(type);
+    return -1;
+  }
+  return 0;
+}
+
+/* multi-phase init, so that the services of the service host can import it
+ * in their subinterpreters */
+static PyModuleDef_Slot androidembed_slots[] = {
+    {Py_mod_exec, androidembed_exec},
+#if PY_VERSION_HEX >= 0x030C0000
+    {Py_mod_multiple_interpreters, Py_MOD_PER_INTERPRETER_GIL_SUPPORTED},
+#endif
+    {0, NULL}};
+
+static struct PyModuleDef androidembed = {PyModuleDef_HEAD_INIT, "androidembed",
+                                          "", 0, AndroidEmbedMethods,
+                                          androidembed_slots};
+
+PyMODINIT_FUNC initandroidembed(void) {
+  return PyModuleDef_Init(&androidembed);
+}
+#else
+PyMODINIT_FUNC initandroidembed(void) {
+  (void)Py_InitModule("androidembed", AndroidEmbedMethods);
+}
+#endif
+
+#endif
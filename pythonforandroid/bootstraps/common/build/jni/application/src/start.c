@@ -7,6 +7,7 @@
 
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <unistd.h>
 #include <dirent.h>
 #include <dlfcn.h>
@@ -15,6 +16,7 @@
 #include <sys/stat.h>
 #include <sys/types.h>
 #include <errno.h>
+#include <time.h>
 
 #include "bootstrap_name.h"
 
@@ -29,8 +31,11 @@
 #endif
 
 #include "android/log.h"
+#include "androidembed.h"
 
 #define ENTRYPOINT_MAXLEN 128
+/* the entrypoint of the service host (--service-host), a module */
+#define SERVICE_HOST_MODULE "android.servicehost"
 #define LOG(n, x) __android_log_write(ANDROID_LOG_INFO, (n), (x))
 #define P4A_MIN_VER 11
 static void LOGP(const char *fmt, ...) {
@@ -40,31 +45,98 @@ static void LOGP(const char *fmt, ...) {
     va_end(args);
 }
 
-static PyObject *androidembed_log(PyObject *self, PyObject *args) {
-  char *logstr = NULL;
-  if (!PyArg_ParseTuple(args, "s", &logstr)) {
-    return NULL;
+/* Startup phase tracing: the start and end of each startup phase, in ns of
+ * CLOCK_BOOTTIME (the clock of SystemClock.elapsedRealtimeNanos()), after
+ * the phases the Java side recorded in P4A_STARTUP_TRACE (see
+ * StartupTrace.java). They are logged as a single "P4A_STARTUP_TRACE <json>"
+ * line, that `p4a startup_report` reads, and are exposed to python as
+ * androidembed.startup_phases.
+ */
+#define STARTUP_PHASES_MAX 32
+#define STARTUP_PHASE_NAME_MAX 32
+
+typedef struct {
+  char name[STARTUP_PHASE_NAME_MAX];
+  long long start;
+  long long end;
+} startup_phase;
+
+static startup_phase startup_phases[STARTUP_PHASES_MAX];
+static int startup_phases_count = 0;
+
+static long long startup_now(void) {
+  struct timespec ts;
+  clock_gettime(CLOCK_BOOTTIME, &ts);
+  return (long long)ts.tv_sec * 1000000000LL + ts.tv_nsec;
+}
+
+static int startup_phase_add(const char *name, long long start, long long end) {
+  if (startup_phases_count >= STARTUP_PHASES_MAX) {
+    return -1;
   }
-  LOG(getenv("PYTHON_NAME"), logstr);
-  Py_RETURN_NONE;
+  startup_phase *phase = &startup_phases[startup_phases_count];
+  snprintf(phase->name, sizeof(phase->name), "%s", name);
+  phase->start = start;
+  phase->end = end;
+  return startup_phases_count++;
 }
 
-static PyMethodDef AndroidEmbedMethods[] = {
-    {"log", androidembed_log, METH_VARARGS, "Log on android platform"},
-    {NULL, NULL, 0, NULL}};
+static int startup_phase_begin(const char *name) {
+  long long now = startup_now();
+  return startup_phase_add(name, now, now);
+}
 
-#if PY_MAJOR_VERSION >= 3
-static struct PyModuleDef androidembed = {PyModuleDef_HEAD_INIT, "androidembed",
-                                          "", -1, AndroidEmbedMethods};
+static void startup_phase_end(int phase) {
+  if (phase >= 0) {
+    startup_phases[phase].end = startup_now();
+  }
+}
 
-PyMODINIT_FUNC initandroidembed(void) {
-  return PyModule_Create(&androidembed);
+/* P4A_STARTUP_TRACE is a list of "name:start:end;" */
+static void startup_phases_from_env(void) {
+  const char *trace = getenv("P4A_STARTUP_TRACE");
+  char name[STARTUP_PHASE_NAME_MAX];
+  long long start, end;
+  int len;
+  while (trace != NULL &&
+         sscanf(trace, "%31[^:;]:%lld:%lld;%n", name, &start, &end, &len) == 3) {
+    startup_phase_add(name, start, end);
+    trace += len;
+  }
 }
-#else
-PyMODINIT_FUNC initandroidembed(void) {
-  (void)Py_InitModule("androidembed", AndroidEmbedMethods);
+
+static void startup_trace_report(void) {
+  char line[4000];
+  size_t pos = 0;
+  int i;
+  PyObject *phases = PyTuple_New(startup_phases_count);
+
+  pos += snprintf(line, sizeof(line), "P4A_STARTUP_TRACE {\"phases\": [");
+  for (i = 0; i < startup_phases_count && pos < sizeof(line); i++) {
+    startup_phase *phase = &startup_phases[i];
+    pos += snprintf(line + pos, sizeof(line) - pos,
+                    "%s{\"name\": \"%s\", \"start_ns\": %lld, \"end_ns\": %lld}",
+                    i ? ", " : "", phase->name, phase->start, phase->end);
+  }
+  if (pos < sizeof(line)) {
+    snprintf(line + pos, sizeof(line) - pos, "]}");
+  }
+  LOGP("%s", line);
+
+  for (i = 0; phases != NULL && i < startup_phases_count; i++) {
+    startup_phase *phase = &startup_phases[i];
+    PyTuple_SET_ITEM(phases, i, Py_BuildValue(
+        "(sLL)", phase->name, phase->start, phase->end));
+  }
+
+  PyObject *module = PyImport_ImportModule("androidembed");
+  if (module != NULL && phases != NULL) {
+    PyObject_SetAttrString(module, "startup_phases", phases);
+  }
+  Py_XDECREF(module);
+  Py_XDECREF(phases);
+  PyErr_Clear();
 }
-#endif
 
 int dir_exists(char *filename) {
   struct stat st;
@@ -111,22 +183,22 @@ static void get_exe_name(const char *filename, char *out, size_t size) {
     }
 }
 
-char *setup_symlinks() {
+// the directory the app's native libraries are installed in
+static int get_native_lib_dir(char *dir, size_t size) {
     Dl_info info;
-    char lib_path[512];
-    char *interpreter = NULL;
-
-    if (!(dladdr((void*)setup_symlinks, &info) && info.dli_fname)) {
-        LOGP("symlinking failed: failed to get libdir");
-        return interpreter;
+    if (!(dladdr((void*)get_native_lib_dir, &info) && info.dli_fname)) {
+        dir[0] = '\0';
+        return 0;
     }
+    get_dirname(info.dli_fname, dir, size);
+    return dir[0] != '\0';
+}
 
-    strncpy(lib_path, info.dli_fname, sizeof(lib_path) - 1);
-    lib_path[sizeof(lib_path) - 1] = '\0';
+char *setup_symlinks() {
+    char *interpreter = NULL;
 
     char native_lib_dir[512];
-    get_dirname(lib_path, native_lib_dir, sizeof(native_lib_dir));
-    if (native_lib_dir[0] == '\0') {
+    if (!get_native_lib_dir(native_lib_dir, sizeof(native_lib_dir))) {
         LOGP("symlinking failed: could not determine lib directory");
         return interpreter;
     }
@@ -195,6 +267,40 @@ char *setup_symlinks() {
 }
 
 
+/* Run the entrypoint (e.g. service/main.pyc) from the app zip, when the
+ * app code is imported in place instead of extracted.
+ */
+static int run_entrypoint_from_zip(const char *app_zip, const char *entrypoint) {
+  char dir[ENTRYPOINT_MAXLEN] = "";
+  char name[ENTRYPOINT_MAXLEN];
+  char code[2048];
+
+  if (!strncmp(entrypoint, "./", 2)) {
+    entrypoint += 2;
+  }
+  const char *slash = strrchr(entrypoint, '/');
+  if (slash) {
+    snprintf(dir, sizeof(dir), "/%.*s", (int)(slash - entrypoint), entrypoint);
+    snprintf(name, sizeof(name), "%s", slash + 1);
+  } else {
+    snprintf(name, sizeof(name), "%s", entrypoint);
+  }
+  char *dot = strrchr(name, '.');
+  if (dot) {
+    *dot = '\0';
+  }
+
+  snprintf(code, sizeof(code),
+           "import zipimport\n"
+           "__loader__ = zipimport.zipimporter('%s%s')\n"
+           "__file__ = __loader__.get_filename('%s')\n"
+           "exec(__loader__.get_code('%s'))\n",
+           app_zip, dir, name, name);
+  LOGP("Running %s from %s", entrypoint, app_zip);
+  return PyRun_SimpleString(code);
+}
+
+
 /* int main(int argc, char **argv) { */
 int main(int argc, char *argv[]) {
 
@@ -206,6 +312,7 @@ int main(int argc, char *argv[]) {
   FILE *fd;
 
   LOGP("Initializing Python for Android");
+  startup_phases_from_env();
 
   // Set a couple of built-in environment vars:
   setenv("P4A_BOOTSTRAP", bootstrap_name, 1);  // env var to identify p4a to applications
@@ -224,6 +331,7 @@ int main(int argc, char *argv[]) {
 
   // Set additional file-provided environment vars:
   LOGP("Setting additional env vars from p4a_env_vars.txt");
+  int phase = startup_phase_begin("parse_env");
   char env_file_path[256];
   snprintf(env_file_path, sizeof(env_file_path),
            "%s/p4a_env_vars.txt", getenv("ANDROID_UNPACK"));
@@ -264,6 +372,7 @@ int main(int argc, char *argv[]) {
   } else {
     LOGP("Warning: no p4a_env_vars.txt found / failed to open!");
   }
+  startup_phase_end(phase);
 
   LOGP("Changing directory to '%s'", env_argument);
   chdir(env_argument);
@@ -290,6 +399,40 @@ int main(int argc, char *argv[]) {
   snprintf(python_bundle_dir, 256,
            "%s/_python_bundle", getenv("ANDROID_UNPACK"));
 
+  /* With --python-bundle-zip, the stdlib and the pure python site-packages
+   * are imported in place from a zip in the native libs dir, see
+   * PYBUNDLE_ZIP_LIB in build.py. With --private-zip, so is the app code
+   * (APP_ZIP_LIB).
+   */
+  char native_lib_dir[512];
+  char bundle_zip[512] = "";
+  char app_zip[512] = "";
+  /* With --biglink, the extension modules of the recipes are linked into
+   * libpymodules.so, see pythonforandroid/pymodules.py */
+  char pymodules[512] = "";
+  if (get_native_lib_dir(native_lib_dir, sizeof(native_lib_dir))) {
+    snprintf(bundle_zip, sizeof(bundle_zip), "%s/libpylib.so", native_lib_dir);
+    if (!file_exists(bundle_zip)) {
+      bundle_zip[0] = '\0';
+    }
+    snprintf(app_zip, sizeof(app_zip), "%s/libpyapp.so", native_lib_dir);
+    if (!file_exists(app_zip)) {
+      app_zip[0] = '\0';
+    }
+    snprintf(pymodules, sizeof(pymodules), "%s/libpymodules.so",
+             native_lib_dir);
+    if (!file_exists(pymodules)) {
+      pymodules[0] = '\0';
+    }
+  }
+  char stdlib_path[512];
+  if (bundle_zip[0] != '\0') {
+    snprintf(stdlib_path, sizeof(stdlib_path), "%s", bundle_zip);
+    LOGP("Importing the python bundle from %s", bundle_zip);
+  } else {
+    snprintf(stdlib_path, sizeof(stdlib_path), "%s/stdlib.zip", python_bundle_dir);
+  }
+
   #if PY_MAJOR_VERSION >= 3
 
     #if PY_MINOR_VERSION >= P4A_MIN_VER
@@ -310,17 +453,17 @@ int main(int argc, char *argv[]) {
       #if PY_MAJOR_VERSION >= 3
           #if PY_MINOR_VERSION >= P4A_MIN_VER
             
-            wchar_t wchar_zip_path[256];
+            wchar_t wchar_zip_path[512];
             wchar_t wchar_modules_path[256];
-            swprintf(wchar_zip_path, 256, L"%s/stdlib.zip", python_bundle_dir);
+            swprintf(wchar_zip_path, 512, L"%s", stdlib_path);
             swprintf(wchar_modules_path, 256, L"%s/modules", python_bundle_dir);
 
             config.module_search_paths_set = 1;
             PyWideStringList_Append(&config.module_search_paths, wchar_zip_path);
             PyWideStringList_Append(&config.module_search_paths, wchar_modules_path);
         #else
-            char paths[512];
-            snprintf(paths, 512, "%s/stdlib.zip:%s/modules", python_bundle_dir, python_bundle_dir);
+            char paths[1024];
+            snprintf(paths, 1024, "%s:%s/modules", stdlib_path, python_bundle_dir);
             wchar_t *wchar_paths = Py_DecodeLocale(paths, NULL);
             Py_SetPath(wchar_paths);
         #endif
@@ -333,6 +476,7 @@ int main(int argc, char *argv[]) {
            " recipes should have this folder, should we expect a crash soon?");
   }
 
+  phase = startup_phase_begin("py_initialize");
 #if PY_MAJOR_VERSION >= 3 && PY_MINOR_VERSION >= P4A_MIN_VER
     PyStatus status = Py_InitializeFromConfig(&config);
     if (PyStatus_Exception(status)) {
@@ -343,6 +487,7 @@ int main(int argc, char *argv[]) {
     Py_Initialize();
     LOGP("Python initialized using legacy Py_Initialize().");
 #endif
+  startup_phase_end(phase);
 
   LOGP("Initialized python");
 
@@ -371,6 +516,7 @@ int main(int argc, char *argv[]) {
 
   char add_site_packages_dir[256];
 
+  phase = startup_phase_begin("sys_path");
   if (dir_exists(python_bundle_dir)) {
     snprintf(add_site_packages_dir, 256,
              "sys.path.append('%s/site-packages')",
@@ -387,84 +533,155 @@ int main(int argc, char *argv[]) {
     PyRun_SimpleString(buf_argv);
 
     PyRun_SimpleString(add_site_packages_dir);
+    if (bundle_zip[0] != '\0') {
+      /* the extracted site-packages only hold what can't be imported in
+       * place, so both are on sys.path
+       */
+      char add_bundle_zip[600];
+      snprintf(add_bundle_zip, sizeof(add_bundle_zip),
+               "sys.path.append('%s/site-packages')", bundle_zip);
+      PyRun_SimpleString(add_bundle_zip);
+    }
     /* "sys.path.append(join(dirname(realpath(__file__)), 'site-packages'))") */
     PyRun_SimpleString("sys.path = ['.'] + sys.path");
+    if (app_zip[0] != '\0') {
+      char add_app_zip[600];
+      snprintf(add_app_zip, sizeof(add_app_zip),
+               "sys.path.insert(1, '%s')", app_zip);
+      PyRun_SimpleString(add_app_zip);
+      LOGP("Importing the app code from %s", app_zip);
+    }
     PyRun_SimpleString("os.environ['PYTHONPATH'] = ':'.join(sys.path)");
+    /* --import-index: the top-level imports are resolved with the index
+     * written when packaging, see make_import_index in build.py */
+    if (file_exists("p4a_import_index.txt")) {
+      PyRun_SimpleString(
+          "import _p4a_import_index\n"
+          "_p4a_import_index.install('p4a_import_index.txt')\n");
+      LOGP("Resolving the imports with p4a_import_index.txt");
+    }
+    if (pymodules[0] != '\0') {
+      char install_pymodules[600];
+      snprintf(install_pymodules, sizeof(install_pymodules),
+               "import _p4a_pymodules\n"
+               "_p4a_pymodules.install('%s')\n", pymodules);
+      PyRun_SimpleString(install_pymodules);
+      LOGP("Importing the extension modules from %s", pymodules);
+    }
   }
+  startup_phase_end(phase);
 
+  phase = startup_phase_begin("redirect_stdout");
+  /* the lines written are logged in batches by androidembed.LogWriter,
+   * see androidembed.h */
   PyRun_SimpleString(
-      "class LogFile(io.IOBase):\n"
-      "    def __init__(self):\n"
-      "        self.__buffer = ''\n"
-      "    def readable(self):\n"
-      "        return False\n"
-      "    def writable(self):\n"
-      "        return True\n"
-      "    def write(self, s):\n"
-      "        s = self.__buffer + s\n"
-      "        lines = s.split('\\n')\n"
-      "        for l in lines[:-1]:\n"
-      "            androidembed.log(l.replace('\\x00', ''))\n"
-      "        self.__buffer = lines[-1]\n"
-      "sys.stdout = sys.stderr = LogFile()\n"
+      "if hasattr(androidembed, 'LogWriter'):\n"
+      "    import os\n"
+      "    sys.stdout = sys.stderr = androidembed.LogWriter(\n"
+      "        flush_interval=float(\n"
+      "            os.environ.get('P4A_LOG_FLUSH_INTERVAL_MS', 100)) / 1000,\n"
+      "        rate=float(os.environ.get('P4A_LOG_RATE_LIMIT', 0)))\n"
+      "    io.TextIOBase.register(androidembed.LogWriter)\n"
+      "else:\n"
+      "    class LogFile(io.IOBase):\n"
+      "        def __init__(self):\n"
+      "            self.__buffer = ''\n"
+      "        def readable(self):\n"
+      "            return False\n"
+      "        def writable(self):\n"
+      "            return True\n"
+      "        def write(self, s):\n"
+      "            s = self.__buffer + s\n"
+      "            lines = s.split('\\n')\n"
+      "            for l in lines[:-1]:\n"
+      "                androidembed.log(l.replace('\\x00', ''))\n"
+      "            self.__buffer = lines[-1]\n"
+      "    sys.stdout = sys.stderr = LogFile()\n"
       "print('Android kivy bootstrap done. __name__ is', __name__)");
+  startup_phase_end(phase);
 
 #if PY_MAJOR_VERSION < 3
   PyRun_SimpleString("import site; print site.getsitepackages()\n");
 #endif
 
-  char *dot = strrchr(env_entrypoint, '.');
-  char *ext = ".pyc";
-  if (dot <= 0) {
-    LOGP("Invalid entrypoint, abort.");
-    return -1;
-  }
-  if (strlen(env_entrypoint) > ENTRYPOINT_MAXLEN - 2) {
-      LOGP("Entrypoint path is too long, try increasing ENTRYPOINT_MAXLEN.");
+  int run_from_zip = 0;
+  /* --service-host: the entrypoint is the service host module, that runs
+   * the services of the app until the process ends */
+  int run_module = !strcmp(env_entrypoint, SERVICE_HOST_MODULE);
+  if (!run_module) {
+    char *dot = strrchr(env_entrypoint, '.');
+    char *ext = ".pyc";
+    if (dot <= 0) {
+      LOGP("Invalid entrypoint, abort.");
       return -1;
-  }
-  if (!strcmp(dot, ext)) {
-    if (!file_exists(env_entrypoint)) {
-      /* fallback on .py */
-      strcpy(entrypoint, env_entrypoint);
-      entrypoint[strlen(env_entrypoint) - 1] = '\0';
-      LOGP(entrypoint);
-      if (!file_exists(entrypoint)) {
-        LOGP("Entrypoint not found (.pyc, fallback on .py), abort");
+    }
+    if (strlen(env_entrypoint) > ENTRYPOINT_MAXLEN - 2) {
+        LOGP("Entrypoint path is too long, try increasing ENTRYPOINT_MAXLEN.");
         return -1;
-      }
-    } else {
-      strcpy(entrypoint, env_entrypoint);
     }
-  } else if (!strcmp(dot, ".py")) {
-    /* if .py is passed, check the pyc version first */
-    strcpy(entrypoint, env_entrypoint);
-    entrypoint[strlen(env_entrypoint) + 1] = '\0';
-    entrypoint[strlen(env_entrypoint)] = 'c';
-    if (!file_exists(entrypoint)) {
-      /* fallback on pure python version */
+    if (!strcmp(dot, ext)) {
       if (!file_exists(env_entrypoint)) {
-        LOGP("Entrypoint not found (.py), abort.");
-        return -1;
+        /* fallback on .py */
+        strcpy(entrypoint, env_entrypoint);
+        entrypoint[strlen(env_entrypoint) - 1] = '\0';
+        LOGP(entrypoint);
+        if (!file_exists(entrypoint)) {
+          if (app_zip[0] == '\0') {
+            LOGP("Entrypoint not found (.pyc, fallback on .py), abort");
+            return -1;
+          }
+          run_from_zip = 1;
+        }
+      } else {
+        strcpy(entrypoint, env_entrypoint);
       }
+    } else if (!strcmp(dot, ".py")) {
+      /* if .py is passed, check the pyc version first */
       strcpy(entrypoint, env_entrypoint);
+      entrypoint[strlen(env_entrypoint) + 1] = '\0';
+      entrypoint[strlen(env_entrypoint)] = 'c';
+      if (!file_exists(entrypoint)) {
+        /* fallback on pure python version */
+        if (!file_exists(env_entrypoint)) {
+          if (app_zip[0] == '\0') {
+            LOGP("Entrypoint not found (.py), abort.");
+            return -1;
+          }
+          run_from_zip = 1;
+        }
+        strcpy(entrypoint, env_entrypoint);
+      }
+    } else {
+      LOGP("Entrypoint have an invalid extension (must be .py or .pyc), abort.");
+      return -1;
     }
-  } else {
-    LOGP("Entrypoint have an invalid extension (must be .py or .pyc), abort.");
-    return -1;
   }
   // LOGP("Entrypoint is:");
   // LOGP(entrypoint);
-  fd = fopen(entrypoint, "r");
-  if (fd == NULL) {
-    LOGP("Open the entrypoint failed");
-    LOGP(entrypoint);
-    return -1;
+  /* the entrypoint runs until the app exits, only its start is recorded */
+  startup_phase_begin("entrypoint");
+  startup_trace_report();
+  if (run_module) {
+    ret = PyRun_SimpleString(
+        "import runpy\n"
+        "runpy.run_module('" SERVICE_HOST_MODULE "', run_name='__main__')\n")
+        == 0 ? 0 : 1;
+  } else if (run_from_zip) {
+    /* run python from the app zip !
+     */
+    ret = run_entrypoint_from_zip(app_zip, env_entrypoint) == 0 ? 0 : 1;
+  } else {
+    fd = fopen(entrypoint, "r");
+    if (fd == NULL) {
+      LOGP("Open the entrypoint failed");
+      LOGP(entrypoint);
+      return -1;
+    }
+    /* run python !
+     */
+    ret = PyRun_SimpleFile(fd, entrypoint);
+    fclose(fd);
   }
-  /* run python !
-   */
-  ret = PyRun_SimpleFile(fd, entrypoint);
-  fclose(fd);
 
   if (PyErr_Occurred() != NULL) {
     ret = 1;
@@ -532,6 +749,45 @@ JNIEXPORT void JNICALL Java_org_kivy_android_PythonService_nativeStart(
   main(1, argv);
 }
 
+/* The pipe the service host reads the services to start from, see
+ * android/servicehost.py. Its read end is passed in P4A_SERVICE_HOST_FD. */
+static int service_host_pipe[2] = {-1, -1};
+
+JNIEXPORT void JNICALL Java_org_kivy_android_PythonService_nativeHostService(
+    JNIEnv *env,
+    jclass cls,
+    jstring j_request) {
+  if (service_host_pipe[1] == -1) {
+    char fd[16];
+    if (pipe(service_host_pipe) != 0) {
+      LOGP("Could not create the service host pipe: %s", strerror(errno));
+      return;
+    }
+    snprintf(fd, sizeof(fd), "%d", service_host_pipe[0]);
+    setenv("P4A_SERVICE_HOST_FD", fd, 1);
+  }
+
+  const char *request = (*env)->GetStringUTFChars(env, j_request, NULL);
+  size_t len = strlen(request);
+  size_t written = 0;
+  while (written < len) {
+    ssize_t ret = write(service_host_pipe[1], request + written, len - written);
+    if (ret < 0 && errno == EINTR) {
+      continue;
+    }
+    if (ret < 0) {
+      LOGP("Could not queue a service for the service host: %s",
+           strerror(errno));
+      break;
+    }
+    written += ret;
+  }
+  if (written == len) {
+    write(service_host_pipe[1], "\n", 1);
+  }
+  (*env)->ReleaseStringUTFChars(env, j_request, request);
+}
+
 #if defined(BOOTSTRAP_NAME_WEBVIEW) || defined(BOOTSTRAP_NAME_SERVICEONLY)
 // Webview and service_only uses some more functions:
 
@@ -16,6 +16,8 @@ import android.util.Log;
 import java.io.File;
 import java.lang.reflect.InvocationTargetException;
 import java.lang.reflect.Method;
+import org.json.JSONException;
+import org.json.JSONObject;
 
 public class PythonService extends Service implements Runnable {
 
@@ -37,6 +39,12 @@ public class PythonService extends Service implements Runnable {
 
     private boolean autoRestartService = false;
 
+    // With --service-host, the module the first hosted service runs, which
+    // runs every hosted service in a subinterpreter of the same process
+    // (see android/servicehost.py)
+    private static final String SERVICE_HOST_MODULE = "android.servicehost";
+    private static boolean serviceHostStarted = false;
+
     public void setAutoRestartService(boolean restart) {
         autoRestartService = restart;
     }
@@ -92,6 +100,11 @@ public class PythonService extends Service implements Runnable {
         return 1;
     }
 
+    /** Whether the service runs in the process of the service host (--service-host). */
+    protected boolean isHosted() {
+        return false;
+    }
+
     protected Intent getThisDefaultIntent(Context ctx, String pythonServiceArgument) {
         return null;
     }
@@ -179,10 +192,19 @@ public class PythonService extends Service implements Runnable {
     public void onDestroy() {
         super.onDestroy();
         pythonThread = null;
+        if (isHosted() && pythonName != null) {
+            // the process runs the other services too, only this one is
+            // asked to stop, before its restart if any
+            queueHostRequest("stop");
+        }
         if (autoRestartService && startIntent != null) {
             Log.v("python service", "service restart requested");
             startService(startIntent);
         }
+        if (isHosted()) {
+            // the process runs the other services too
+            return;
+        }
         Process.killProcess(Process.myPid());
     }
 
@@ -203,8 +225,13 @@ public class PythonService extends Service implements Runnable {
     public void run() {
         String app_root = getFilesDir().getAbsolutePath() + "/app";
         File app_root_file = new File(app_root);
-        PythonUtil.loadLibraries(app_root_file, new File(getApplicationInfo().nativeLibraryDir));
+        PythonUtil.loadLibraries(
+                this, app_root_file, new File(getApplicationInfo().nativeLibraryDir));
         this.mService = this;
+        if (isHosted()) {
+            runHosted();
+            return;
+        }
         nativeStart(
                 androidPrivate,
                 androidArgument,
@@ -216,6 +243,48 @@ public class PythonService extends Service implements Runnable {
         stopSelf();
     }
 
+    /**
+     * Asks the service host to run the service entrypoint. The first hosted
+     * service to start runs the service host itself, until the process ends.
+     */
+    private void runHosted() {
+        synchronized (PythonService.class) {
+            queueHostRequest("start");
+            if (serviceHostStarted) {
+                return;
+            }
+            serviceHostStarted = true;
+        }
+        nativeStart(
+                androidPrivate,
+                androidArgument,
+                SERVICE_HOST_MODULE,
+                "servicehost",
+                pythonHome,
+                pythonPath,
+                "");
+    }
+
+    /**
+     * Queues the request to start or stop (action) this service for the
+     * service host. A service started again while running is stopped then
+     * restarted by the host.
+     */
+    private void queueHostRequest(String action) {
+        JSONObject request = new JSONObject();
+        try {
+            request.put("action", action);
+            request.put("name", pythonName);
+            if (action.equals("start")) {
+                request.put("entrypoint", serviceEntrypoint);
+                request.put("argument", pythonServiceArgument);
+            }
+        } catch (JSONException e) {
+            throw new RuntimeException(e);
+        }
+        nativeHostService(request.toString());
+    }
+
     // Native part
     public static native void nativeStart(
             String androidPrivate,
@@ -225,4 +294,7 @@ public class PythonService extends Service implements Runnable {
             String pythonHome,
             String pythonPath,
             String pythonServiceArgument);
+
+    /** Queue a service for the service host, as a JSON object. */
+    public static native void nativeHostService(String request);
 }
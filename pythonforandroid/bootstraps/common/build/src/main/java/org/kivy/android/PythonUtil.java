@@ -3,11 +3,14 @@ package org.kivy.android;
 import android.app.Activity;
 import android.content.Context;
 import android.content.res.Resources;
+import android.os.Build;
+import android.os.SystemClock;
 import android.util.Log;
 import android.widget.Toast;
 import java.io.File;
 import java.io.FileInputStream;
 import java.io.FileOutputStream;
+import java.io.IOException;
 import java.io.InputStream;
 import java.util.ArrayList;
 import java.util.regex.Pattern;
@@ -16,6 +19,10 @@ import org.renpy.android.AssetExtract;
 public class PythonUtil {
     private static final String TAG = "pythonutil";
 
+    // The part of the python bundle that is the same for every arch, see
+    // PYBUNDLE_COMMON_ASSET in build.py
+    private static final String PYBUNDLE_COMMON = "pybundle_common";
+
     protected static void addLibraryIfExists(
             ArrayList<String> libsList, String pattern, File libsDir) {
         // pattern should be the name of the lib file, without the
@@ -67,7 +74,43 @@ public class PythonUtil {
         return libsList;
     }
 
+    /**
+     * The libraries to load, in dependency order, as computed when packaging
+     * from their ELF NEEDED entries (see make_library_load_plan in build.py),
+     * or null if the app was packaged without it.
+     */
+    protected static String[] getLoadPlan(Context ctx) {
+        Resources res = ctx.getResources();
+        for (String abi : Build.SUPPORTED_ABIS) {
+            int id = res.getIdentifier(
+                    "native_libs_" + abi.replace('-', '_'), "string", ctx.getPackageName());
+            if (id != 0) {
+                String libs = res.getString(id);
+                return libs.isEmpty() ? null : libs.split(",");
+            }
+        }
+        return null;
+    }
+
+    public static void loadLibraries(Context ctx, File filesDir, File libsDir) {
+        String[] plan = getLoadPlan(ctx);
+        if (plan == null) {
+            loadLibraries(filesDir, libsDir);
+            return;
+        }
+
+        long traceStart = StartupTrace.now();
+        for (String lib : plan) {
+            Log.v(TAG, "Loading library: " + lib);
+            System.loadLibrary(lib);
+        }
+        Log.v(TAG, "Loaded everything!");
+        StartupTrace.add("load_libraries", traceStart);
+    }
+
+    /** Load the libraries found in libsDir, for apps packaged without a load plan. */
     public static void loadLibraries(File filesDir, File libsDir) {
+        long traceStart = StartupTrace.now();
         boolean foundPython = false;
 
         for (String lib : getLibraries(libsDir)) {
@@ -97,6 +140,7 @@ public class PythonUtil {
         }
 
         Log.v(TAG, "Loaded everything!");
+        StartupTrace.add("load_libraries", traceStart);
     }
 
     public static String getAppRoot(Context ctx) {
@@ -138,9 +182,35 @@ public class PythonUtil {
         f.delete();
     }
 
+    /**
+     * The version of the libpybundle.so the app runs with, i.e. the one of
+     * the first ABI of the device the app has libraries for.
+     */
+    protected static String getPyBundleVersion(Context ctx) {
+        Resources res = ctx.getResources();
+        for (String abi : Build.SUPPORTED_ABIS) {
+            int id = res.getIdentifier(
+                    "pybundle_version_" + abi.replace('-', '_'), "string", ctx.getPackageName());
+            if (id != 0) {
+                return res.getString(id);
+            }
+        }
+        return getResourceString(ctx, "private_version");
+    }
+
+    protected static boolean assetExists(Context ctx, String asset) {
+        try {
+            ctx.getAssets().open(asset).close();
+            return true;
+        } catch (IOException e) {
+            return false;
+        }
+    }
+
     public static void unpackAsset(
             Context ctx, final String resource, File target, boolean cleanup_on_version_update) {
 
+        long traceStart = StartupTrace.now();
         Log.v(TAG, "Unpacking " + resource + " " + target.getName());
 
         // The version of data in memory and on disk.
@@ -172,11 +242,15 @@ public class PythonUtil {
         if (!dataVersion.equals(diskVersion)) {
             Log.v(TAG, "Extracting " + resource + " assets.");
 
-            if (cleanup_on_version_update) {
+            // With the manifest of the previous payload, only the changed
+            // files are extracted and the removed ones deleted.
+            File manifest = AssetExtract.getManifestFile(resource + ".tar", filesDir);
+            if (cleanup_on_version_update && !manifest.exists()) {
                 recursiveDelete(target);
             }
             target.mkdirs();
 
+            long start = SystemClock.uptimeMillis();
             AssetExtract ae = new AssetExtract(ctx);
             if (!ae.extractTar(resource + ".tar", target.getAbsolutePath(), "private")) {
                 String msg = "Could not extract " + resource + " data.";
@@ -186,6 +260,7 @@ public class PythonUtil {
                     Log.v(TAG, msg);
                 }
             }
+            Log.v(TAG, "Extracted " + resource + " in " + (SystemClock.uptimeMillis() - start) + " ms");
 
             try {
                 // Write .nomedia.
@@ -199,15 +274,17 @@ public class PythonUtil {
                 Log.w(TAG, e);
             }
         }
+        StartupTrace.add("extract_" + resource, traceStart);
     }
 
     public static void unpackPyBundle(
             Context ctx, final String resource, File target, boolean cleanup_on_version_update) {
 
+        long traceStart = StartupTrace.now();
         Log.v(TAG, "Unpacking " + resource + " " + target.getName());
 
         // The version of data in memory and on disk.
-        String dataVersion = getResourceString(ctx, "private_version");
+        String dataVersion = getPyBundleVersion(ctx);
         String diskVersion = null;
 
         Log.v(TAG, "Data version is " + dataVersion);
@@ -231,17 +308,40 @@ public class PythonUtil {
             diskVersion = "";
         }
 
-        if (!dataVersion.equals(diskVersion)) {
+        // With the manifest of the previous payload, only the changed
+        // files are extracted and the removed ones deleted.
+        boolean outdated = !dataVersion.equals(diskVersion);
+        File manifest = AssetExtract.getManifestFile(resource + ".so", filesDir);
+        if (outdated && cleanup_on_version_update && !manifest.exists()) {
+            recursiveDelete(target);
+        }
+
+        // The arch-independent part of the bundle goes in the same
+        // directory, since a package may be split between both. It is
+        // extracted first, so that the files which moved to it are never
+        // deleted with the per-ABI part.
+        if (assetExists(ctx, PYBUNDLE_COMMON + ".tar")) {
+            unpackAsset(ctx, PYBUNDLE_COMMON, target, false);
+        } else if (outdated) {
+            // An update without the common part: its previous files are
+            // deleted, the per-ABI part extracts again those it has.
+            AssetExtract.removeExtracted(PYBUNDLE_COMMON + ".tar", filesDir);
+            new File(target, PYBUNDLE_COMMON + ".version").delete();
+        }
+
+        if (outdated) {
             // If the disk data is out of date, extract it and write the version file.
             Log.v(TAG, "Extracting " + resource + " assets.");
-
-            if (cleanup_on_version_update) {
-                recursiveDelete(target);
-            }
             target.mkdirs();
 
+            long start = SystemClock.uptimeMillis();
             AssetExtract ae = new AssetExtract(ctx);
-            if (!ae.extractTar(resource + ".so", target.getAbsolutePath(), "pybundle")) {
+            // the files that moved to the common part are kept
+            if (!ae.extractTar(
+                    resource + ".so",
+                    target.getAbsolutePath(),
+                    "pybundle",
+                    PYBUNDLE_COMMON + ".tar")) {
                 String msg = "Could not extract " + resource + " data.";
                 if (ctx instanceof Activity) {
                     toastError((Activity) ctx, msg);
@@ -249,6 +349,7 @@ public class PythonUtil {
                     Log.v(TAG, msg);
                 }
             }
+            Log.v(TAG, "Extracted " + resource + " in " + (SystemClock.uptimeMillis() - start) + " ms");
 
             try {
                 // Write version file.
@@ -259,5 +360,6 @@ public class PythonUtil {
                 Log.w(TAG, e);
             }
         }
+        StartupTrace.add("extract_pybundle", traceStart);
     }
 }
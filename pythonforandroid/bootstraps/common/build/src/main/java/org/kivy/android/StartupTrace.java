@@ -0,0 +1,50 @@
+package org.kivy.android;
+
+import android.os.Build;
+import android.os.Process;
+import android.os.SystemClock;
+import android.system.ErrnoException;
+import android.system.Os;
+import android.util.Log;
+
+/**
+ * Records the start and end of the startup phases that run in Java (loading
+ * the libraries, extracting the payloads...), with the clock start.c uses
+ * for the native phases (CLOCK_BOOTTIME).
+ *
+ * The phases are handed to start.c in the P4A_STARTUP_TRACE environment
+ * variable, as a list of "name:start_ns:end_ns;", and logged by it with its
+ * own phases in a single "P4A_STARTUP_TRACE" line.
+ */
+public class StartupTrace {
+    private static final String TAG = "StartupTrace";
+    private static final String ENV = "P4A_STARTUP_TRACE";
+
+    private static final StringBuilder phases = new StringBuilder();
+
+    static {
+        if (Build.VERSION.SDK_INT >= 24) {
+            // when the process was forked from the zygote
+            long start = Process.getStartElapsedRealtime() * 1000000L;
+            add("process_start", start, start);
+        }
+    }
+
+    public static long now() {
+        return SystemClock.elapsedRealtimeNanos();
+    }
+
+    /** Record the phase name that started at start (see {@link #now}) and ends now. */
+    public static void add(String name, long start) {
+        add(name, start, now());
+    }
+
+    public static synchronized void add(String name, long start, long end) {
+        phases.append(name).append(':').append(start).append(':').append(end).append(';');
+        try {
+            Os.setenv(ENV, phases.toString(), true);
+        } catch (ErrnoException e) {
+            Log.w(TAG, "Could not record the startup phase " + name, e);
+        }
+    }
+}
@@ -6,32 +6,39 @@ import android.content.Context;
 import android.content.res.AssetManager;
 import android.util.Log;
 import java.io.BufferedInputStream;
-import java.io.BufferedOutputStream;
 import java.io.File;
 import java.io.FileInputStream;
-import java.io.FileNotFoundException;
-import java.io.FileOutputStream;
 import java.io.IOException;
 import java.io.InputStream;
-import java.io.OutputStream;
 import java.util.zip.GZIPInputStream;
-import org.kamranzafar.jtar.TarEntry;
-import org.kamranzafar.jtar.TarInputStream;
 
 public class AssetExtract {
 
+    private static final int BUFFER_SIZE = 64 * 1024;
+
     private AssetManager mAssetManager = null;
 
     public AssetExtract(Context context) {
         mAssetManager = context.getAssets();
     }
 
-    public boolean extractTar(String asset, String target, String method) {
+    /**
+     * Where the manifest of the payload asset extracted in target is kept,
+     * see PayloadExtractor.
+     */
+    public static File getManifestFile(String asset, String target) {
+        return new File(target, new File(asset).getName() + ".manifest");
+    }
 
-        byte buf[] = new byte[1024 * 1024];
+    /**
+     * Extracts the payload asset into target. The files listed in the manifests
+     * of siblingAssets, extracted in the same directory before, are never
+     * deleted.
+     */
+    public boolean extractTar(
+            String asset, String target, String method, String... siblingAssets) {
 
         InputStream assetStream = null;
-        TarInputStream tis = null;
 
         try {
             if (method == "private") {
@@ -40,82 +47,41 @@ public class AssetExtract {
                 assetStream = new FileInputStream(asset);
             }
 
-            tis =
-                    new TarInputStream(
+            PayloadExtractor extractor =
+                    new PayloadExtractor(new File(target), getManifestFile(asset, target));
+            for (String siblingAsset : siblingAssets) {
+                extractor.addSiblingManifest(getManifestFile(siblingAsset, target));
+            }
+            // A single buffer in front of the decoder: GZIPInputStream
+            // already reads its input in large chunks.
+            PayloadExtractor.Result result =
+                    extractor.extract(
                             new BufferedInputStream(
-                                    new GZIPInputStream(new BufferedInputStream(assetStream, 8192)),
-                                    8192));
+                                    new GZIPInputStream(assetStream, BUFFER_SIZE), BUFFER_SIZE));
+            Log.i("python", "extracted " + asset + ": " + result);
         } catch (IOException e) {
-            Log.e("python", "opening up extract tar", e);
+            Log.e("python", "extracting tar", e);
             return false;
-        }
-
-        while (true) {
-            TarEntry entry = null;
-
+        } finally {
             try {
-                entry = tis.getNextEntry();
-            } catch (IOException e) {
-                Log.e("python", "extracting tar", e);
-                return false;
-            }
-
-            if (entry == null) {
-                break;
-            }
-
-            Log.v("python", "extracting " + entry.getName());
-
-            if (entry.isDirectory()) {
-
-                try {
-                    new File(target + "/" + entry.getName()).mkdirs();
-                } catch (SecurityException e) {
+                if (assetStream != null) {
+                    assetStream.close();
                 }
-                ;
-
-                continue;
-            }
-
-            OutputStream out = null;
-            String path = target + "/" + entry.getName();
-
-            try {
-                out = new BufferedOutputStream(new FileOutputStream(path), 8192);
-            } catch (FileNotFoundException | SecurityException e) {
-            }
-
-            if (out == null) {
-                Log.e("python", "could not open " + path);
-                return false;
-            }
-
-            try {
-                while (true) {
-                    int len = tis.read(buf);
-
-                    if (len == -1) {
-                        break;
-                    }
-
-                    out.write(buf, 0, len);
-                }
-
-                out.flush();
-                out.close();
             } catch (IOException e) {
-                Log.e("python", "extracting zip", e);
-                return false;
+                // pass
             }
         }
 
-        try {
-            tis.close();
-            assetStream.close();
-        } catch (IOException e) {
-            // pass
-        }
-
         return true;
     }
+
+    /**
+     * Deletes the files of the payload asset extracted last in target, for an
+     * asset the app no longer has, see PayloadExtractor.remove.
+     */
+    public static void removeExtracted(String asset, String target) {
+        PayloadExtractor.Result result =
+                new PayloadExtractor(new File(target), getManifestFile(asset, target)).remove();
+        Log.i("python", "removed " + asset + ": " + result);
+    }
 }
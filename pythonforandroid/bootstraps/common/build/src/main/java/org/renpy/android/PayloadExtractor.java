@@ -0,0 +1,300 @@
+package org.renpy.android;
+
+import java.io.File;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.nio.channels.Channels;
+import java.nio.channels.FileChannel;
+import java.nio.channels.ReadableByteChannel;
+import java.util.ArrayList;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+import java.util.concurrent.ArrayBlockingQueue;
+import java.util.concurrent.Callable;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.Future;
+import java.util.concurrent.ThreadPoolExecutor;
+import java.util.concurrent.TimeUnit;
+import org.kamranzafar.jtar.TarEntry;
+import org.kamranzafar.jtar.TarInputStream;
+
+/**
+ * Extracts a payload (an uncompressed tar stream) into a directory.
+ *
+ * If the payload starts with a {@link PayloadManifest} and the manifest of the
+ * payload extracted last in the directory is found, only the files that were
+ * added or changed are written, and only the files that were removed are
+ * deleted. Everything else is left in place. The new manifest is saved only
+ * after a successful extraction, so an interrupted extraction is completed on
+ * the next run.
+ *
+ * The tar stream is decoded on the calling thread. Small files are read in
+ * memory and written by a small pool of writer threads, so that opening and
+ * writing files overlaps with decompression; large files are copied straight
+ * from the stream to their FileChannel. Each directory is created once.
+ *
+ * This class doesn't depend on Android, so that it can be unit tested on the JVM.
+ */
+public class PayloadExtractor {
+
+    /** Files bigger than this are copied with a FileChannel on the decoding thread. */
+    public static final int LARGE_ENTRY_SIZE = 256 * 1024;
+
+    /** How many small files may wait in memory for a writer thread. */
+    private static final int WRITE_QUEUE_SIZE = 64;
+
+    /** What an extraction did. */
+    public static class Result {
+        public int written = 0;
+        public int unchanged = 0;
+        public int deleted = 0;
+        public long bytes = 0;
+        public long millis = 0;
+
+        @Override
+        public String toString() {
+            return written + " files written (" + (bytes / 1024) + " KiB), " + unchanged
+                    + " unchanged, " + deleted + " deleted in " + millis + " ms";
+        }
+    }
+
+    private final File target;
+    private final File manifestFile;
+    private final int threads;
+    private final Set<String> dirs = new HashSet<>();
+    private final List<File> siblingManifestFiles = new ArrayList<>();
+
+    /**
+     * @param target the directory to extract to
+     * @param manifestFile where the manifest of the payload is kept between extractions
+     */
+    public PayloadExtractor(File target, File manifestFile) {
+        this(target, manifestFile, defaultThreads());
+    }
+
+    /** A single core gains nothing from handing the files to another thread. */
+    private static int defaultThreads() {
+        int cpus = Runtime.getRuntime().availableProcessors();
+        return cpus > 1 ? Math.min(4, cpus) : 0;
+    }
+
+    /**
+     * @param threads how many threads write the small files, 0 to write them on
+     *     the decoding thread
+     */
+    public PayloadExtractor(File target, File manifestFile, int threads) {
+        this.target = target;
+        this.manifestFile = manifestFile;
+        this.threads = threads;
+    }
+
+    /**
+     * Never delete the files listed in the manifest of another payload
+     * extracted in the same directory (e.g. the arch independent part of the
+     * python bundle), where they may have moved from this payload. Extract
+     * that payload first, so that its manifest is the new one.
+     */
+    public void addSiblingManifest(File siblingManifestFile) {
+        siblingManifestFiles.add(siblingManifestFile);
+    }
+
+    public Result extract(InputStream tarStream) throws IOException {
+        long start = System.nanoTime();
+        Result result = new Result();
+        PayloadManifest previous = PayloadManifest.read(manifestFile);
+        PayloadManifest manifest = null;
+        dirs.clear();
+
+        ThreadPoolExecutor writers = null;
+        if (threads > 0) {
+            // When the queue is full, the decoding thread writes the file
+            // itself, which bounds the memory used by pending files.
+            writers =
+                    new ThreadPoolExecutor(
+                            threads,
+                            threads,
+                            0,
+                            TimeUnit.SECONDS,
+                            new ArrayBlockingQueue<Runnable>(WRITE_QUEUE_SIZE),
+                            new ThreadPoolExecutor.CallerRunsPolicy());
+        }
+        List<Future<?>> pending = new ArrayList<>();
+
+        try {
+            TarInputStream tis = new TarInputStream(tarStream);
+            TarEntry entry;
+            while ((entry = tis.getNextEntry()) != null) {
+                String name = entry.getName();
+
+                if (name.equals(PayloadManifest.ENTRY_NAME)) {
+                    manifest = PayloadManifest.parse(tis);
+                    continue;
+                }
+
+                File file = new File(target, name);
+                if (entry.isDirectory()) {
+                    ensureDir(file);
+                    continue;
+                }
+
+                if (manifest != null && manifest.isUnchanged(name, previous) && file.isFile()) {
+                    result.unchanged++;
+                    continue;
+                }
+
+                ensureDir(file.getParentFile());
+                long size = entry.getSize();
+                if (size > LARGE_ENTRY_SIZE) {
+                    transfer(tis, file, size);
+                } else {
+                    final File out = file;
+                    final byte[] data = readFully(tis, (int) size);
+                    if (writers == null) {
+                        write(out, data);
+                    } else {
+                        pending.add(
+                                writers.submit(
+                                        new Callable<Void>() {
+                                            public Void call() throws IOException {
+                                                write(out, data);
+                                                return null;
+                                            }
+                                        }));
+                    }
+                }
+                result.written++;
+                result.bytes += size;
+            }
+
+            for (Future<?> future : pending) {
+                try {
+                    future.get();
+                } catch (ExecutionException e) {
+                    if (e.getCause() instanceof IOException) {
+                        throw (IOException) e.getCause();
+                    }
+                    throw new IOException(e.getCause());
+                } catch (InterruptedException e) {
+                    Thread.currentThread().interrupt();
+                    throw new IOException(e);
+                }
+            }
+        } finally {
+            if (writers != null) {
+                writers.shutdownNow();
+            }
+        }
+
+        if (manifest != null) {
+            if (previous != null) {
+                List<PayloadManifest> siblings = readSiblingManifests();
+                for (String path : previous.getPaths()) {
+                    if (manifest.getHash(path) == null
+                            && !isListed(path, siblings)
+                            && new File(target, path).delete()) {
+                        result.deleted++;
+                    }
+                }
+            }
+            manifest.write(manifestFile);
+        } else {
+            // A payload without manifest can't be compared with the next one.
+            manifestFile.delete();
+        }
+
+        result.millis = (System.nanoTime() - start) / 1000000;
+        return result;
+    }
+
+    /**
+     * Delete the files of the payload extracted last, for a payload the app
+     * no longer has, and its manifest. The files listed by the sibling
+     * manifests are kept.
+     */
+    public Result remove() {
+        long start = System.nanoTime();
+        Result result = new Result();
+        PayloadManifest previous = PayloadManifest.read(manifestFile);
+        if (previous != null) {
+            List<PayloadManifest> siblings = readSiblingManifests();
+            for (String path : previous.getPaths()) {
+                if (!isListed(path, siblings) && new File(target, path).delete()) {
+                    result.deleted++;
+                }
+            }
+        }
+        manifestFile.delete();
+        result.millis = (System.nanoTime() - start) / 1000000;
+        return result;
+    }
+
+    private List<PayloadManifest> readSiblingManifests() {
+        List<PayloadManifest> siblings = new ArrayList<>();
+        for (File siblingManifestFile : siblingManifestFiles) {
+            PayloadManifest sibling = PayloadManifest.read(siblingManifestFile);
+            if (sibling != null) {
+                siblings.add(sibling);
+            }
+        }
+        return siblings;
+    }
+
+    private static boolean isListed(String path, List<PayloadManifest> manifests) {
+        for (PayloadManifest manifest : manifests) {
+            if (manifest.getHash(path) != null) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    private void ensureDir(File dir) {
+        // Only the decoding thread creates directories, before handing out
+        // the files they contain.
+        if (dirs.add(dir.getPath()) && !dir.isDirectory()) {
+            dir.mkdirs();
+        }
+    }
+
+    private static byte[] readFully(InputStream is, int size) throws IOException {
+        byte[] data = new byte[size];
+        int off = 0;
+        while (off < size) {
+            int len = is.read(data, off, size - off);
+            if (len == -1) {
+                throw new IOException("Truncated tar entry");
+            }
+            off += len;
+        }
+        return data;
+    }
+
+    private static void write(File file, byte[] data) throws IOException {
+        FileOutputStream out = new FileOutputStream(file);
+        try {
+            out.write(data);
+        } finally {
+            out.close();
+        }
+    }
+
+    private static void transfer(InputStream is, File file, long size) throws IOException {
+        ReadableByteChannel in = Channels.newChannel(is);
+        FileOutputStream out = new FileOutputStream(file);
+        try {
+            FileChannel channel = out.getChannel();
+            long position = 0;
+            while (position < size) {
+                long len = channel.transferFrom(in, position, size - position);
+                if (len <= 0) {
+                    throw new IOException("Truncated tar entry");
+                }
+                position += len;
+            }
+        } finally {
+            out.close();
+        }
+    }
+}
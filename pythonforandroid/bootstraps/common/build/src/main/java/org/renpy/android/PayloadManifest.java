@@ -0,0 +1,83 @@
+package org.renpy.android;
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.nio.charset.StandardCharsets;
+import java.util.LinkedHashMap;
+import java.util.Map;
+import java.util.Set;
+
+/**
+ * The hash of each file of a payload, as listed in its first member (see
+ * PAYLOAD_MANIFEST in build.py): one "<sha256> <path>" line per file.
+ *
+ * This class doesn't depend on Android, so that it can be unit tested on the JVM.
+ */
+public class PayloadManifest {
+
+    /** The name of the manifest inside a payload. */
+    public static final String ENTRY_NAME = ".p4a_manifest";
+
+    private final Map<String, String> hashes = new LinkedHashMap<>();
+
+    public static PayloadManifest parse(InputStream is) throws IOException {
+        PayloadManifest manifest = new PayloadManifest();
+        BufferedReader reader =
+                new BufferedReader(new InputStreamReader(is, StandardCharsets.UTF_8));
+        String line;
+        while ((line = reader.readLine()) != null) {
+            int space = line.indexOf(' ');
+            if (space > 0) {
+                manifest.hashes.put(line.substring(space + 1), line.substring(0, space));
+            }
+        }
+        return manifest;
+    }
+
+    /** Read a manifest written by {@link #write}, or return null if there is none. */
+    public static PayloadManifest read(File file) {
+        if (!file.isFile()) {
+            return null;
+        }
+        try (InputStream is = new FileInputStream(file)) {
+            return parse(is);
+        } catch (IOException e) {
+            return null;
+        }
+    }
+
+    /** Write the manifest, atomically so that it is never left half written. */
+    public void write(File file) throws IOException {
+        File tmp = new File(file.getPath() + ".tmp");
+        try (OutputStream os = new FileOutputStream(tmp)) {
+            StringBuilder sb = new StringBuilder();
+            for (Map.Entry<String, String> entry : hashes.entrySet()) {
+                sb.append(entry.getValue()).append(' ').append(entry.getKey()).append('\n');
+            }
+            os.write(sb.toString().getBytes(StandardCharsets.UTF_8));
+        }
+        if (!tmp.renameTo(file)) {
+            throw new IOException("could not write " + file);
+        }
+    }
+
+    public String getHash(String path) {
+        return hashes.get(path);
+    }
+
+    public Set<String> getPaths() {
+        return hashes.keySet();
+    }
+
+    /** Whether the file at path has the same content in both manifests. */
+    public boolean isUnchanged(String path, PayloadManifest previous) {
+        String hash = hashes.get(path);
+        return previous != null && hash != null && hash.equals(previous.getHash(path));
+    }
+}
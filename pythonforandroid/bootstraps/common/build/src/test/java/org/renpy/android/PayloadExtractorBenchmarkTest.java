@@ -0,0 +1,172 @@
+package org.renpy.android;
+
+import static org.junit.Assert.assertArrayEquals;
+import static org.junit.Assert.assertEquals;
+import static org.junit.Assume.assumeTrue;
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.nio.file.Files;
+import java.util.Random;
+import java.util.zip.GZIPInputStream;
+import java.util.zip.GZIPOutputStream;
+import org.junit.BeforeClass;
+import org.junit.Rule;
+import org.junit.Test;
+import org.junit.rules.TemporaryFolder;
+import org.kamranzafar.jtar.TarEntry;
+import org.kamranzafar.jtar.TarHeader;
+import org.kamranzafar.jtar.TarInputStream;
+import org.kamranzafar.jtar.TarOutputStream;
+
+/**
+ * Compares the throughput of PayloadExtractor with the jtar loop AssetExtract
+ * used before, on a payload shaped like a python bundle: thousands of small
+ * .pyc files in a few hundred packages, and a few large files.
+ *
+ * <p>It takes a while, so it is skipped unless the p4a.benchmark system
+ * property is set: {@code ./gradlew test -Pp4a.benchmark}.
+ */
+public class PayloadExtractorBenchmarkTest {
+
+    private static final int FILES = 6000;
+    private static final int LARGE_FILES = 8;
+    private static final int ROUNDS = 3;
+
+    private static byte[] payload;
+    private static long payloadSize;
+
+    @Rule public TemporaryFolder tmp = new TemporaryFolder();
+
+    @BeforeClass
+    public static void makePayload() throws IOException {
+        assumeTrue("the benchmark runs with -Pp4a.benchmark", Boolean.getBoolean("p4a.benchmark"));
+        Random random = new Random(42);
+        ByteArrayOutputStream bos = new ByteArrayOutputStream();
+        TarOutputStream tos = new TarOutputStream(new GZIPOutputStream(bos));
+        for (int i = 0; i < FILES + LARGE_FILES; i++) {
+            String dir = "site-packages/pkg" + (i % 300) + "/sub" + (i % 7);
+            if (i < 2100) {
+                tos.putNextEntry(new TarEntry(TarHeader.createHeader(dir, 0, 0, true)));
+            }
+            int size = i < FILES ? 512 + random.nextInt(16 * 1024) : 2 * 1024 * 1024;
+            byte[] data = new byte[size];
+            // compressible, like bytecode
+            for (int j = 0; j < size; j++) {
+                data[j] = (byte) (random.nextInt(16) + 'a');
+            }
+            tos.putNextEntry(
+                    new TarEntry(TarHeader.createHeader(dir + "/module" + i + ".pyc", size, 0, false)));
+            tos.write(data);
+            payloadSize += size;
+        }
+        tos.close();
+        payload = bos.toByteArray();
+    }
+
+    private static InputStream open() throws IOException {
+        return new BufferedInputStream(
+                new GZIPInputStream(new ByteArrayInputStream(payload), 64 * 1024), 64 * 1024);
+    }
+
+    /** The extraction loop of AssetExtract before PayloadExtractor, minus the logging. */
+    private static void legacyExtract(File target) throws IOException {
+        byte buf[] = new byte[1024 * 1024];
+        TarInputStream tis =
+                new TarInputStream(
+                        new BufferedInputStream(
+                                new GZIPInputStream(
+                                        new BufferedInputStream(new ByteArrayInputStream(payload), 8192)),
+                                8192));
+        TarEntry entry;
+        while ((entry = tis.getNextEntry()) != null) {
+            if (entry.isDirectory()) {
+                new File(target, entry.getName()).mkdirs();
+                continue;
+            }
+            OutputStream out =
+                    new BufferedOutputStream(new FileOutputStream(new File(target, entry.getName())), 8192);
+            int len;
+            while ((len = tis.read(buf)) != -1) {
+                out.write(buf, 0, len);
+            }
+            out.flush();
+            out.close();
+        }
+        tis.close();
+    }
+
+    private long best(String name, Extraction extraction) throws IOException {
+        long best = Long.MAX_VALUE;
+        for (int round = 0; round < ROUNDS; round++) {
+            File target = tmp.newFolder();
+            long start = System.nanoTime();
+            extraction.run(target);
+            best = Math.min(best, System.nanoTime() - start);
+        }
+        System.out.println(
+                String.format(
+                        "%-28s %6d files, %5.1f MiB: %6.0f ms, %6.1f MiB/s",
+                        name,
+                        FILES + LARGE_FILES,
+                        payloadSize / 1048576.0,
+                        best / 1e6,
+                        payloadSize / 1048576.0 / (best / 1e9)));
+        return best;
+    }
+
+    interface Extraction {
+        void run(File target) throws IOException;
+    }
+
+    @Test
+    public void testThroughput() throws IOException {
+        best(
+                "jtar (previous AssetExtract)",
+                new Extraction() {
+                    public void run(File target) throws IOException {
+                        legacyExtract(target);
+                    }
+                });
+        best(
+                "PayloadExtractor, 1 thread",
+                new Extraction() {
+                    public void run(File target) throws IOException {
+                        new PayloadExtractor(target, new File(target, "payload.manifest"), 0)
+                                .extract(open());
+                    }
+                });
+        best(
+                "PayloadExtractor",
+                new Extraction() {
+                    public void run(File target) throws IOException {
+                        new PayloadExtractor(target, new File(target, "payload.manifest")).extract(open());
+                    }
+                });
+    }
+
+    @Test
+    public void testSameResultAsLegacyExtraction() throws IOException {
+        File legacy = tmp.newFolder();
+        legacyExtract(legacy);
+        File target = tmp.newFolder();
+        PayloadExtractor.Result result =
+                new PayloadExtractor(target, new File(tmp.getRoot(), "payload.manifest")).extract(open());
+
+        assertEquals(FILES + LARGE_FILES, result.written);
+        assertEquals(payloadSize, result.bytes);
+        for (int i : new int[] {0, 1, FILES - 1, FILES, FILES + LARGE_FILES - 1}) {
+            String name = "site-packages/pkg" + (i % 300) + "/sub" + (i % 7) + "/module" + i + ".pyc";
+            assertArrayEquals(
+                    Files.readAllBytes(new File(legacy, name).toPath()),
+                    Files.readAllBytes(new File(target, name).toPath()));
+        }
+    }
+}
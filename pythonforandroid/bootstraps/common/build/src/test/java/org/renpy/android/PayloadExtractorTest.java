@@ -0,0 +1,210 @@
+package org.renpy.android;
+
+import static org.junit.Assert.assertEquals;
+import static org.junit.Assert.assertFalse;
+import static org.junit.Assert.assertTrue;
+
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.IOException;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.security.MessageDigest;
+import java.security.NoSuchAlgorithmException;
+import java.util.LinkedHashMap;
+import java.util.Map;
+import org.junit.Before;
+import org.junit.Rule;
+import org.junit.Test;
+import org.junit.rules.TemporaryFolder;
+import org.kamranzafar.jtar.TarEntry;
+import org.kamranzafar.jtar.TarHeader;
+import org.kamranzafar.jtar.TarOutputStream;
+
+public class PayloadExtractorTest {
+
+    @Rule public TemporaryFolder tmp = new TemporaryFolder();
+
+    private File target;
+    private File manifestFile;
+
+    @Before
+    public void setUp() throws IOException {
+        target = tmp.newFolder("app");
+        manifestFile = new File(target, "private.tar.manifest");
+    }
+
+    /** Build a payload like make_tar does, with or without its manifest. */
+    static byte[] payload(Map<String, String> files, boolean withManifest) throws Exception {
+        ByteArrayOutputStream bos = new ByteArrayOutputStream();
+        TarOutputStream tos = new TarOutputStream(bos);
+        if (withManifest) {
+            StringBuilder manifest = new StringBuilder();
+            for (Map.Entry<String, String> file : files.entrySet()) {
+                manifest.append(sha256(file.getValue())).append(' ').append(file.getKey()).append('\n');
+            }
+            putFile(tos, PayloadManifest.ENTRY_NAME, manifest.toString());
+        }
+        for (Map.Entry<String, String> file : files.entrySet()) {
+            String parent = new File(file.getKey()).getParent();
+            if (parent != null) {
+                tos.putNextEntry(new TarEntry(TarHeader.createHeader(parent, 0, 0, true)));
+            }
+            putFile(tos, file.getKey(), file.getValue());
+        }
+        tos.close();
+        return bos.toByteArray();
+    }
+
+    static void putFile(TarOutputStream tos, String name, String content) throws IOException {
+        byte[] data = content.getBytes(StandardCharsets.UTF_8);
+        tos.putNextEntry(new TarEntry(TarHeader.createHeader(name, data.length, 0, false)));
+        tos.write(data);
+    }
+
+    static String sha256(String content) throws NoSuchAlgorithmException {
+        byte[] digest =
+                MessageDigest.getInstance("SHA-256").digest(content.getBytes(StandardCharsets.UTF_8));
+        StringBuilder sb = new StringBuilder();
+        for (byte b : digest) {
+            sb.append(String.format("%02x", b));
+        }
+        return sb.toString();
+    }
+
+    PayloadExtractor.Result extract(byte[] payload) throws IOException {
+        return new PayloadExtractor(target, manifestFile).extract(new ByteArrayInputStream(payload));
+    }
+
+    String read(String name) throws IOException {
+        return new String(Files.readAllBytes(new File(target, name).toPath()), StandardCharsets.UTF_8);
+    }
+
+    @Test
+    public void testFirstExtractionWritesEverything() throws Exception {
+        Map<String, String> files = new LinkedHashMap<>();
+        files.put("main.pyc", "main");
+        files.put("pkg/__init__.pyc", "pkg");
+
+        PayloadExtractor.Result result = extract(payload(files, true));
+
+        assertEquals(2, result.written);
+        assertEquals("main", read("main.pyc"));
+        assertEquals("pkg", read("pkg/__init__.pyc"));
+        assertTrue(manifestFile.isFile());
+        assertFalse(new File(target, PayloadManifest.ENTRY_NAME).exists());
+    }
+
+    @Test
+    public void testUpdateOnlyTouchesChangedFiles() throws Exception {
+        Map<String, String> files = new LinkedHashMap<>();
+        files.put("main.pyc", "main");
+        files.put("pkg/__init__.pyc", "pkg");
+        files.put("pkg/removed.pyc", "removed");
+        extract(payload(files, true));
+        File unchanged = new File(target, "pkg/__init__.pyc");
+        assertTrue(unchanged.setLastModified(1000000000L));
+        Files.write(new File(target, "user_data.txt").toPath(), new byte[] {1});
+
+        files.put("main.pyc", "main v2");
+        files.remove("pkg/removed.pyc");
+        files.put("pkg/added.pyc", "added");
+        PayloadExtractor.Result result = extract(payload(files, true));
+
+        assertEquals(2, result.written);
+        assertEquals(1, result.unchanged);
+        assertEquals(1, result.deleted);
+        assertEquals("main v2", read("main.pyc"));
+        assertEquals("added", read("pkg/added.pyc"));
+        assertFalse(new File(target, "pkg/removed.pyc").exists());
+        assertEquals(1000000000L, unchanged.lastModified());
+        // files which were never part of the payload are left alone
+        assertTrue(new File(target, "user_data.txt").exists());
+    }
+
+    @Test
+    public void testMissingFileIsExtractedAgain() throws Exception {
+        Map<String, String> files = new LinkedHashMap<>();
+        files.put("main.pyc", "main");
+        extract(payload(files, true));
+        assertTrue(new File(target, "main.pyc").delete());
+
+        PayloadExtractor.Result result = extract(payload(files, true));
+
+        assertEquals(1, result.written);
+        assertEquals("main", read("main.pyc"));
+    }
+
+    @Test
+    public void testPayloadWithoutManifestIsFullyExtracted() throws Exception {
+        Map<String, String> files = new LinkedHashMap<>();
+        files.put("main.pyc", "main");
+        extract(payload(files, true));
+
+        PayloadExtractor.Result result = extract(payload(files, false));
+
+        assertEquals(1, result.written);
+        assertEquals(0, result.unchanged);
+        assertFalse(manifestFile.exists());
+    }
+
+    /**
+     * Extract both parts of a python bundle like PythonUtil.unpackPyBundle
+     * does: the common part first, then the per-ABI one.
+     */
+    void extractBundle(byte[] common, byte[] abi) throws IOException {
+        File commonManifestFile = new File(target, "pybundle_common.tar.manifest");
+        new PayloadExtractor(target, commonManifestFile).extract(new ByteArrayInputStream(common));
+        PayloadExtractor extractor = new PayloadExtractor(target, manifestFile);
+        extractor.addSiblingManifest(commonManifestFile);
+        extractor.extract(new ByteArrayInputStream(abi));
+    }
+
+    @Test
+    public void testFileMovingBetweenPayloadsIsKept() throws Exception {
+        Map<String, String> common = new LinkedHashMap<>();
+        common.put("pkg/__init__.pyc", "pkg");
+        Map<String, String> abi = new LinkedHashMap<>();
+        abi.put("pkg/_speedups.so", "so");
+        abi.put("pkg/moving.pyc", "moving");
+        extractBundle(payload(common, true), payload(abi, true));
+
+        // from the per-ABI part to the common one
+        abi.remove("pkg/moving.pyc");
+        common.put("pkg/moving.pyc", "moving");
+        extractBundle(payload(common, true), payload(abi, true));
+        assertEquals("moving", read("pkg/moving.pyc"));
+
+        // and back
+        common.remove("pkg/moving.pyc");
+        abi.put("pkg/moving.pyc", "moving v2");
+        extractBundle(payload(common, true), payload(abi, true));
+        assertEquals("moving v2", read("pkg/moving.pyc"));
+        assertEquals("pkg", read("pkg/__init__.pyc"));
+        assertEquals("so", read("pkg/_speedups.so"));
+    }
+
+    @Test
+    public void testRemovedPayloadFilesAreDeleted() throws Exception {
+        File commonManifestFile = new File(target, "pybundle_common.tar.manifest");
+        Map<String, String> common = new LinkedHashMap<>();
+        common.put("pkg/__init__.pyc", "pkg");
+        common.put("pkg/data.txt", "data");
+        Map<String, String> abi = new LinkedHashMap<>();
+        abi.put("pkg/_speedups.so", "so");
+        extractBundle(payload(common, true), payload(abi, true));
+
+        // an update without the common part, where pkg/__init__.pyc moved
+        // back to the per-ABI part
+        abi.put("pkg/__init__.pyc", "pkg");
+        PayloadExtractor.Result result = new PayloadExtractor(target, commonManifestFile).remove();
+        extract(payload(abi, true));
+
+        assertEquals(2, result.deleted);
+        assertFalse(commonManifestFile.exists());
+        assertFalse(new File(target, "pkg/data.txt").exists());
+        assertEquals("pkg", read("pkg/__init__.pyc"));
+        assertEquals("so", read("pkg/_speedups.so"));
+    }
+}
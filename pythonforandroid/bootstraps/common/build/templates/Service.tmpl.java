@@ -13,6 +13,13 @@ public class Service{{ name|capitalize }} extends {{ base_service_class }} {
     }
     {% endif %}
 
+    {% if args.service_host %}
+    @Override
+    protected boolean isHosted() {
+        return true;
+    }
+    {% endif %}
+
     @Override
     protected int getServiceId() {
         return {{ service_id }};
@@ -67,7 +67,8 @@ public class PythonActivity extends SDLActivity {
     public void loadLibraries() {
         String app_root = new String(getAppRoot());
         File app_root_file = new File(app_root);
-        PythonUtil.loadLibraries(app_root_file, new File(getApplicationInfo().nativeLibraryDir));
+        PythonUtil.loadLibraries(
+                this, app_root_file, new File(getApplicationInfo().nativeLibraryDir));
     }
 
     /** Show an error using a toast. (Only makes sense from non-UI threads.) */
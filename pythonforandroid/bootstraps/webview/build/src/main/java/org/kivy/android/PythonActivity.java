@@ -12,6 +12,7 @@ import android.graphics.Color;
 import android.net.Uri;
 import android.os.AsyncTask;
 import android.os.Bundle;
+import android.os.ParcelFileDescriptor;
 import android.os.PowerManager;
 import android.os.SystemClock;
 import android.util.Log;
@@ -206,6 +207,18 @@ public class PythonActivity extends Activity {
             PythonActivity.nativeSetenv("PYTHONPATH", app_root_dir + ":" + app_root_dir + "/lib");
             PythonActivity.nativeSetenv("PYTHONOPTIMIZE", "2");
 
+            // The web server tells when it listens by writing to this pipe
+            // (see android/webview.py), so that the page is loaded right away
+            try {
+                ParcelFileDescriptor[] readyPipe = ParcelFileDescriptor.createPipe();
+                // python owns the write end
+                PythonActivity.nativeSetenv(
+                        "P4A_WEBVIEW_READY_FD", Integer.toString(readyPipe[1].detachFd()));
+                WebViewLoader.readyPipe = readyPipe[0];
+            } catch (IOException e) {
+                Log.w(TAG, "Could not create the web server readiness pipe", e);
+            }
+
             try {
                 Log.v(TAG, "Access to our meta-data...");
                 mActivity.mMetaData =
@@ -245,7 +258,8 @@ public class PythonActivity extends Activity {
     public void loadLibraries() {
         String app_root = new String(getAppRoot());
         File app_root_file = new File(app_root);
-        PythonUtil.loadLibraries(app_root_file, new File(getApplicationInfo().nativeLibraryDir));
+        PythonUtil.loadLibraries(
+                this, app_root_file, new File(getApplicationInfo().nativeLibraryDir));
     }
 
     public static void loadUrl(String url) {
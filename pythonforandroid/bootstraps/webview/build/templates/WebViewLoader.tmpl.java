@@ -3,10 +3,16 @@ package org.kivy.android;
 import android.util.Log;
 
 import java.io.IOException;
+import java.io.InterruptedIOException;
 import java.net.Socket;
 import java.net.InetSocketAddress;
 
+import android.os.ParcelFileDescriptor;
 import android.os.SystemClock;
+import android.system.ErrnoException;
+import android.system.Os;
+import android.system.OsConstants;
+import android.system.StructPollfd;
 
 import android.os.Handler;
 
@@ -15,30 +21,70 @@ import org.kivy.android.PythonActivity;
 public class WebViewLoader {
     private static final String TAG = "WebViewLoader";
 
+    // The read end of the pipe the web server writes to once it listens
+    // (P4A_WEBVIEW_READY_FD, see android/webview.py), if any
+    static ParcelFileDescriptor readyPipe = null;
+
     public static void testConnection() {
 
         while (true) {
-            if (WebViewLoader.pingHost("localhost", {{ args.port }}, 100)) {
+            if (WebViewLoader.waitReady(100)) {
+                Log.v(TAG, "The web server on localhost:{{ args.port }} is ready");
+            } else if (!WebViewLoader.pingHost("localhost", {{ args.port }}, 100)) {
+                Log.v(TAG, "Could not ping localhost:{{ args.port }}");
+                continue;
+            } else {
                 Log.v(TAG, "Successfully pinged localhost:{{ args.port }}");
-                Handler mainHandler = new Handler(PythonActivity.mActivity.getMainLooper());
-                Runnable myRunnable = new Runnable() {
-                        @Override
-                        public void run() {
-                            PythonActivity.mActivity.loadUrl("http://127.0.0.1:{{ args.port }}/");
-                            Log.v(TAG, "Loaded webserver in webview");
-                        }
-                    };
-                mainHandler.post(myRunnable);
-                break;
+            }
+            Handler mainHandler = new Handler(PythonActivity.mActivity.getMainLooper());
+            Runnable myRunnable = new Runnable() {
+                    @Override
+                    public void run() {
+                        PythonActivity.mActivity.loadUrl("http://127.0.0.1:{{ args.port }}/");
+                        Log.v(TAG, "Loaded webserver in webview");
+                    }
+                };
+            mainHandler.post(myRunnable);
+            break;
+        }
+        closeReadyPipe();
+    }
 
-            } else {
-                Log.v(TAG, "Could not ping localhost:{{ args.port }}");
-                try {
-                    Thread.sleep(100);
-                } catch(InterruptedException e) {
-                    Log.v(TAG, "InterruptedException occurred when sleeping");
-                }
+    /**
+     * Wait up to timeout ms for the web server to tell it is ready, and
+     * return whether it did. Without readiness pipe, or once python closed
+     * it without writing to it, this only sleeps, and the server is pinged.
+     */
+    public static boolean waitReady(int timeout) {
+        if (readyPipe == null) {
+            try {
+                Thread.sleep(timeout);
+            } catch(InterruptedException e) {
+                Log.v(TAG, "InterruptedException occurred when sleeping");
             }
+            return false;
+        }
+        StructPollfd pollfd = new StructPollfd();
+        pollfd.fd = readyPipe.getFileDescriptor();
+        pollfd.events = (short) OsConstants.POLLIN;
+        try {
+            if (Os.poll(new StructPollfd[] {pollfd}, timeout) == 0) {
+                return false;
+            }
+            if (Os.read(pollfd.fd, new byte[1], 0, 1) == 1) {
+                return true;
+            }
+        } catch (ErrnoException | InterruptedIOException e) {
+            Log.v(TAG, "Could not read the readiness pipe", e);
+        }
+        closeReadyPipe();
+        return false;
+    }
+
+    private static void closeReadyPipe() {
+        if (readyPipe != null) {
+            try {readyPipe.close();} catch (IOException e) {}
+            readyPipe = null;
         }
     }
 
@@ -19,7 +19,11 @@ from packaging.requirements import Requirement
 
 from pythonforandroid.androidndk import AndroidNDK
 from pythonforandroid.archs import ArchARM, ArchARMv7_a, ArchAarch_64, Archx86, Archx86_64
+from pythonforandroid.linkprofile import profile_choices
 from pythonforandroid.logger import (info, warning, info_notify, info_main, shprint, Out_Style, Out_Fore)
+from pythonforandroid.pymodules import (
+    PYMODULES_FINDER, PYMODULES_LIBRARY, find_placeholders, object_filens,
+    objects_digest, split_modules, write_finder)
 from pythonforandroid.pythonpackage import get_package_name
 from pythonforandroid.recipe import CythonRecipe, Recipe
 from pythonforandroid.recommendations import (
@@ -72,6 +76,8 @@ class Context:
     root_dir = None
     # the root dir where builds and dists will be stored
     storage_dir = None
+    # the hostpython executable, set once the hostpython recipe is built
+    hostpython = None
 
     # in which bootstraps are copied for building
     # and recipes are built
@@ -101,6 +107,44 @@ class Context:
 
     java_build_tool = 'auto'
 
+    app_dir = None  # the --private directory of the app, if any
+
+    # An import trace file (or 'host') the stdlib is pruned with
+    stdlib_import_trace = None
+    # Stdlib modules kept whatever the import trace says
+    stdlib_keep = []
+    # How the stdlib.zip entries are compressed, None for the recipe's choice
+    stdlib_zip_compression = None
+    # Patterns of the stdlib.zip entries stored uncompressed
+    stdlib_zip_stored_patterns = []
+    # A file listing the stdlib modules laid out first in stdlib.zip
+    stdlib_zip_import_order = None
+    # Whether to drop the site-packages modules the app can't reach
+    site_packages_tree_shaking = False
+    # Site-packages modules kept whatever the module graph says
+    site_packages_keep = []
+    # Whether to freeze the stdlib modules imported at startup into libpython
+    freeze_startup_modules = False
+    # Stdlib modules frozen into libpython besides the startup ones
+    frozen_modules = []
+    # Whether to build stdlib extension modules into libpython
+    builtin_extension_modules = False
+    # Stdlib extension modules built into libpython besides the common ones
+    builtin_modules = []
+    # Whether to build python with extension modules too, to log the size
+    # saved by building them into libpython
+    builtin_modules_size_report = False
+    # Whether to compile to unchecked hash-based .pyc files (PEP 552)
+    unchecked_hash_pycs = False
+    # The link profile of the native code, one of linkprofile.LINK_PROFILES
+    link_profile = 'default'
+    # The optimization profile, one of linkprofile.OPT_PROFILES
+    opt_profile = 'default'
+    # Whether to build the hostpython with PGO and LTO, cached in storage_dir
+    optimized_hostpython = False
+    # A system python ('auto' to look for it) reused as the hostpython
+    system_hostpython = None
+
     @property
     def packages_path(self):
         '''Where packages are downloaded before being unpacked'''
@@ -143,7 +187,10 @@ class Context:
         return directory
 
     def get_python_install_dir(self, arch):
-        return join(self.python_installs_dir, self.bootstrap.distribution.name, arch)
+        # kept apart for each profile, like the build dirs of the recipes
+        dir_name = '-'.join([self.bootstrap.distribution.name] + profile_choices(
+            self.link_profile, self.opt_profile))
+        return join(self.python_installs_dir, dir_name, arch)
 
     def setup_dirs(self, storage_dir):
         '''Calculates all the storage and build dirs, and makes sure
@@ -378,6 +425,8 @@ class Context:
 
         self.local_recipes = None
         self.copy_libs = False
+        # Whether to link the extension modules into libpymodules.so
+        self.biglink = False
 
         self.activity_class_name = u'org.kivy.android.PythonActivity'
         self.service_class_name = u'org.kivy.android.PythonService'
@@ -524,11 +573,10 @@ def build_recipes(build_order, python_modules, ctx, project_dir,
         info_main('# Biglinking object files')
         if not ctx.python_recipe:
             biglink(ctx, arch)
+        elif ctx.biglink:
+            biglink_pymodules(ctx, arch)
         else:
-            warning(
-                "Context's python recipe found, "
-                "skipping biglink (will this work?)"
-            )
+            info('Not biglinking the extension modules (see --biglink)')
 
         # 5) postbuild packages
         info_main('# Postbuilding recipes')
@@ -704,10 +752,7 @@ def process_python_modules(ctx, modules):
     env = environ.copy()
     try:
         host_recipe = Recipe.get_recipe("hostpython3", ctx)
-        _python_path = host_recipe.get_path_to_python()
-        libdir = glob.glob(join(_python_path, "build", "lib*"))
-        env['PYTHONPATH'] = host_recipe.site_dir + ":" + join(
-            _python_path, "Modules") + ":" + (libdir[0] if libdir else "")
+        env['PYTHONPATH'] = host_recipe.python_path
         pip = host_recipe.pip
     except Exception:
         # hostpython3 non available so we use system pip (like in tests)
@@ -949,6 +994,97 @@ def biglink(ctx, arch):
             env=env)
 
 
+def biglink_pymodules(ctx, arch):
+    '''
+    Link the extension modules the recipes built with ``tools/liblink``
+    (``--biglink``) into libpymodules.so, and write the finder importing them
+    from it in the site-packages, see :mod:`pythonforandroid.pymodules`. The
+    library is only linked again when its objects changed.
+    '''
+    site_packages = ctx.get_python_install_dir(arch.arch)
+    recipes = [Recipe.get_recipe(name, ctx) for name in ctx.recipe_build_order]
+    objects_dirs = [join(recipe.get_build_container_dir(arch.arch),
+                         'objects_{}'.format(recipe.name))
+                    for recipe in recipes]
+    modules = {}
+    if exists(site_packages):
+        for module, (filen, name) in find_placeholders(site_packages).items():
+            obj = object_filens(objects_dirs, name)
+            if obj is None:
+                warning('No object file {} for the extension module {}, '
+                        'rebuild its recipe'.format(name, module))
+                continue
+            modules[module] = (filen, obj)
+
+    env = arch.get_env()
+    link_dirs = [join(ctx.bootstrap.build_dir, 'obj', 'local', arch.arch),
+                 ctx.get_libs_dir(arch.arch)]
+    library = join(ctx.get_libs_dir(arch.arch), PYMODULES_LIBRARY)
+    finder = join(site_packages, PYMODULES_FINDER)
+    stamp = join(ctx.bootstrap.build_dir, 'pymodules_{}.stamp'.format(
+        arch.arch))
+    linked, separate = split_modules(modules)
+    for module in separate:
+        info('{} has the init function of another extension module, linking '
+             'it separately'.format(module))
+        link_objects(join(site_packages, modules[module][0]),
+                     [modules[module][1]], link_dirs, env)
+    if not linked:
+        info('There are no extension modules to biglink, skipping')
+        return
+
+    objects = [modules[module][1] for module in linked]
+    digest = objects_digest(objects, [env['CC']] + link_dirs)
+    up_to_date = False
+    if exists(library) and exists(stamp):
+        with open(stamp) as fileh:
+            up_to_date = fileh.read() == digest
+    if up_to_date:
+        info('{} is up to date ({} extension modules)'.format(
+            PYMODULES_LIBRARY, len(linked)))
+    else:
+        info('Biglinking {} extension modules into {}'.format(
+            len(linked), library))
+        try:
+            link_objects(library, objects, link_dirs, env)
+        except sh.ErrorReturnCode:
+            # e.g. two modules defining the same global symbol
+            warning('Could not link the extension modules together, linking '
+                    'each one separately')
+            for module in linked:
+                link_objects(join(site_packages, modules[module][0]),
+                             [modules[module][1]], link_dirs, env)
+            for filen in (library, stamp, finder):
+                if exists(filen):
+                    os.remove(filen)
+            return
+        with open(stamp, 'w') as fileh:
+            fileh.write(digest)
+    write_finder(finder, {module: modules[module][0] for module in linked})
+
+
+def link_objects(soname, objects, link_dirs, env):
+    '''Link the relocatable ``objects`` written by ``tools/liblink`` into
+    the shared library ``soname``, with the libraries of their ``.libs``.'''
+    args = []
+    for obj in objects:
+        args.append(obj)
+        with open(obj[:-len('.o')] + '.libs') as fileh:
+            args.extend(arg for arg in fileh.read().split(' ') if arg)
+    # the last occurrence of a library is the one that matters
+    unique_args = []
+    for arg in reversed(args):
+        if arg not in unique_args:
+            unique_args.insert(0, arg)
+    unique_args.extend('-L' + link_dir for link_dir in link_dirs
+                       if '-L' + link_dir not in unique_args)
+    if exists(soname):
+        # it may be a placeholder, or a link of the dist
+        os.remove(soname)
+    cc = sh.Command(env['CC'].split()[0]).bake(*env['CC'].split()[1:])
+    shprint(cc, '-shared', '-o', soname, *unique_args, _env=env)
+
+
 def biglink_function(soname, objs_paths, extra_link_dirs=None, env=None):
     if extra_link_dirs is None:
         extra_link_dirs = []
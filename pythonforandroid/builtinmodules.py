@@ -0,0 +1,136 @@
+"""
+Helpers to build stdlib extension modules into libpython instead of as
+separate ``.so`` files, through CPython's ``Modules/Setup.local``: the first
+``Modules/Setup*`` line of a module wins, so copying its line from
+``Modules/Setup.stdlib`` (which configure generated, with the flags of its
+dependencies) under a ``*static*`` marker makes it a built-in module, that
+is imported without extracting, loading and relocating a library.
+"""
+
+from collections import namedtuple
+from os.path import exists, getsize, join, splitext
+import glob
+import os
+
+
+SETUP_LOCAL_HEADER = '# python-for-android built-in extension modules\n'
+'''The first line of the ``Modules/Setup.local`` written by
+:func:`write_setup_local`.'''
+
+DEFAULT_BUILTIN_MODULES = [
+    '_asyncio',
+    '_bisect',
+    '_contextvars',
+    '_datetime',
+    '_heapq',
+    '_json',
+    '_opcode',
+    '_pickle',
+    '_random',
+    '_socket',
+    '_struct',
+    'array',
+    'binascii',
+    'math',
+    'select',
+    'zlib',
+]
+'''Extension modules imported by most apps (or by the modules they import
+at startup), that only depend on libc, libm and zlib.'''
+
+
+class BuiltinModulesReport(namedtuple('BuiltinModulesReport', [
+        'modules', 'libpython_size', 'builtin_libpython_size',
+        'extensions_size'])):
+    '''The sizes before and after building ``modules`` into libpython:
+    libpython, and the extension modules it replaces.'''
+
+    @property
+    def size_delta(self):
+        return (self.builtin_libpython_size - self.libpython_size -
+                self.extensions_size)
+
+    def __str__(self):
+        return (
+            '{count} extension modules built into libpython: libpython '
+            '{before:.1f} KiB -> {after:.1f} KiB, {count} fewer .so files '
+            '({extensions:.1f} KiB), {delta:+.1f} KiB in total'.format(
+                count=len(self.modules),
+                before=self.libpython_size / 1024,
+                after=self.builtin_libpython_size / 1024,
+                extensions=self.extensions_size / 1024,
+                delta=self.size_delta / 1024))
+
+
+def read_setup_modules(filen, kind='shared'):
+    '''The modules a ``Modules/Setup*`` file ``filen`` builds as ``kind``
+    (``'shared'`` or ``'static'``), by name: their whole line.'''
+    modules = {}
+    if not exists(filen):
+        return modules
+    current = 'static'
+    with open(filen) as fileh:
+        lines = fileh.read().replace('\\\n', ' ').splitlines()
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if not line or '=' in line.split()[0]:
+            continue
+        if line.startswith('*'):
+            if line in ('*shared*', '*static*', '*disabled*'):
+                current = line.strip('*')
+            continue
+        if current == kind:
+            modules.setdefault(line.split()[0], line)
+    return modules
+
+
+def select_builtin_modules(setup_stdlib, modules):
+    '''The lines of ``Modules/Setup.stdlib`` ``setup_stdlib`` building the
+    ``modules`` as shared extensions, and the modules it doesn't build
+    this way (not available, or already built in).'''
+    shared = read_setup_modules(setup_stdlib)
+    lines = [shared[module] for module in modules if module in shared]
+    missing = [module for module in modules if module not in shared]
+    return lines, missing
+
+
+def write_setup_local(filen, lines):
+    '''Write the ``Modules/Setup.local`` ``filen`` building the modules of
+    ``lines`` (Setup lines) into libpython. Return whether it changed.'''
+    content = SETUP_LOCAL_HEADER
+    if lines:
+        content += '*static*\n' + ''.join(line + '\n' for line in lines)
+    if exists(filen):
+        with open(filen) as fileh:
+            if fileh.read() == content:
+                return False
+    with open(filen, 'w') as fileh:
+        fileh.write(content)
+    return True
+
+
+def module_objects(modules_dir, line):
+    '''The object files of the sources of the Setup ``line``, in
+    ``modules_dir``.'''
+    return [join(modules_dir, splitext(word)[0] + '.o')
+            for word in line.split()[1:]
+            if splitext(word)[1] in ('.c', '.cc', '.cpp', '.m')]
+
+
+def remove_module_objects(modules_dir, lines):
+    for line in lines:
+        for filen in module_objects(modules_dir, line):
+            if exists(filen):
+                os.remove(filen)
+
+
+def extension_filens(lib_dir, modules):
+    '''The extension module files of ``modules`` in ``lib_dir``.'''
+    return [filen
+            for module in modules
+            for filen in glob.glob(join(lib_dir, module + '.*.so')) +
+            glob.glob(join(lib_dir, module + '.so'))]
+
+
+def extensions_size(lib_dir, modules):
+    return sum(getsize(filen) for filen in extension_filens(lib_dir, modules))
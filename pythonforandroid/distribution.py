@@ -23,6 +23,8 @@ class Distribution:
     url = None
     dist_dir = None  # Where the dist dir ultimately is. Should not be None.
     ndk_api = None
+    link_profile = 'default'
+    opt_profile = 'default'
 
     archs = []
     '''The names of the arch targets that the dist is built for.'''
@@ -122,6 +124,13 @@ class Distribution:
                     f"dist {dist} failed to match ndk_api, target api {ndk_api}, dist api {dist.ndk_api}"
                 )
                 continue
+            if (dist.link_profile, dist.opt_profile) != (ctx.link_profile, ctx.opt_profile):
+                debug(
+                    f"dist {dist} failed to match the link and optimization profiles, "
+                    f"target {ctx.link_profile} and {ctx.opt_profile}, "
+                    f"dist {dist.link_profile} and {dist.opt_profile}"
+                )
+                continue
             for recipe in recipes:
                 if recipe not in dist.recipes:
                     debug(f"dist {dist} missing recipe {recipe}")
@@ -194,6 +203,8 @@ class Distribution:
             name)
         dist.recipes = recipes
         dist.ndk_api = ctx.ndk_api
+        dist.link_profile = ctx.link_profile
+        dist.opt_profile = ctx.opt_profile
         dist.archs = archs
 
         return dist
@@ -228,6 +239,8 @@ class Distribution:
                 dist.recipes = dist_info['recipes']
                 if 'archs' in dist_info:
                     dist.archs = dist_info['archs']
+                dist.link_profile = dist_info.get('link_profile', 'default')
+                dist.opt_profile = dist_info.get('opt_profile', 'default')
                 if 'ndk_api' in dist_info:
                     dist.ndk_api = dist_info['ndk_api']
                 else:
@@ -257,6 +270,8 @@ class Distribution:
                            'use_setup_py': self.ctx.use_setup_py,
                            'recipes': self.ctx.recipe_build_order + self.ctx.python_modules,
                            'hostpython': self.ctx.hostpython,
+                           'link_profile': self.link_profile,
+                           'opt_profile': self.opt_profile,
                            'python_version': self.ctx.python_recipe.major_minor_version_string},
                           fileh)
 
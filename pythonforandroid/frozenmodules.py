@@ -0,0 +1,162 @@
+"""
+Helpers to freeze extra stdlib modules into libpython, with CPython's own
+freeze tooling (``Tools/build/freeze_modules.py``, python 3.11+): the
+modules listed in its ``FROZEN`` table are compiled into the interpreter
+(and deep-frozen, up to python 3.12), so importing them at startup reads
+neither ``stdlib.zip`` nor a ``.pyc``.
+"""
+
+from os.path import exists, join
+import ast
+import subprocess
+import time
+
+
+FREEZE_SCRIPTS = [
+    join('Tools', 'build', 'freeze_modules.py'),
+    join('Tools', 'scripts', 'freeze_modules.py'),  # python 3.11
+]
+'''Where CPython keeps its freeze script, depending on the version.'''
+
+FROZEN_SECTION = 'stdlib - python-for-android startup'
+'''The section of the ``FROZEN`` table the extra modules are added to.'''
+
+FROZEN_BEGIN = '    # begin python-for-android frozen modules\n'
+FROZEN_END = '    # end python-for-android frozen modules\n'
+
+NEVER_FROZEN = {
+    '__main__',
+    '__phello__',
+    'antigravity',
+    'this',
+}
+'''Stdlib modules never worth freezing.'''
+
+
+def find_freeze_script(source_dir):
+    '''The freeze script of the CPython source ``source_dir``, or ``None``
+    for a python older than 3.11.'''
+    for script in FREEZE_SCRIPTS:
+        if exists(join(source_dir, script)):
+            return join(source_dir, script)
+    return None
+
+
+def _frozen_node(source):
+    for node in ast.parse(source).body:
+        if (isinstance(node, ast.Assign) and
+                any(isinstance(target, ast.Name) and target.id == 'FROZEN'
+                    for target in node.targets)):
+            return node
+    raise ValueError('No FROZEN table found in the freeze script')
+
+
+def read_frozen_modules(script):
+    '''The modules the freeze script ``script`` freezes, whatever the
+    section.'''
+    with open(script) as fileh:
+        node = _frozen_node(fileh.read())
+    modules = set()
+    # FROZEN is a list of (section, [spec, ...])
+    for section in node.value.elts:
+        for spec in section.elts[1].elts:
+            if not isinstance(spec, ast.Constant):
+                continue
+            # e.g. 'importlib._bootstrap : _frozen_importlib' or '<encodings.*>'
+            name = spec.value.split(':')[0].strip().strip('<>')
+            if name.endswith('.*'):
+                name = name[:-2]
+            modules.add(name)
+    return modules
+
+
+def add_frozen_modules(script, modules):
+    '''
+    Add ``modules`` to the ``FROZEN`` table of the freeze script ``script``,
+    in their own section, which replaces the one added by a previous call.
+    '''
+    with open(script) as fileh:
+        source = fileh.read()
+    begin = source.find(FROZEN_BEGIN)
+    if begin != -1:
+        end = source.index(FROZEN_END, begin) + len(FROZEN_END)
+        source = source[:begin] + source[end:]
+    if modules:
+        node = _frozen_node(source)
+        lines = source.splitlines(True)
+        # the closing bracket of the table
+        closing = sum(len(line) for line in lines[:node.end_lineno - 1]) + (
+            node.value.end_col_offset - 1)
+        section = '{}    ({!r}, [\n{}        ]),\n{}'.format(
+            FROZEN_BEGIN, FROZEN_SECTION,
+            ''.join('        {!r},\n'.format(module) for module in modules),
+            FROZEN_END)
+        source = source[:closing] + section + source[closing:]
+    with open(script, 'w') as fileh:
+        fileh.write(source)
+
+
+def select_frozen_modules(lib_dir, imported, extra=(), frozen=()):
+    '''
+    Return the modules worth freezing among the modules ``imported`` at
+    startup and the ``extra`` ones, in order: the pure python modules of the
+    stdlib ``lib_dir``, except those already ``frozen``.
+
+    Packages are left out: a frozen package gets a ``__path__`` in the
+    stdlib directory, which doesn't exist on the device (the stdlib is
+    zipped), so its submodules that are not frozen couldn't be imported.
+    Their frozen submodules are found whatever the ``__path__``.
+    '''
+    selected = []
+    for module in list(imported) + list(extra):
+        if module in frozen or module in NEVER_FROZEN or module in selected:
+            continue
+        if not exists(join(lib_dir, *module.split('.')) + '.py'):
+            # package, builtin, extension or third party module
+            continue
+        selected.append(module)
+    return selected
+
+
+def freeze_modules(source_dir, modules, python):
+    '''
+    Freeze ``modules`` into the interpreter built from the CPython source
+    ``source_dir``, by adding them to the ``FROZEN`` table and running the
+    freeze script with ``python`` (it only regenerates the build files, the
+    modules are frozen when building). Returns the modules actually added,
+    i.e. those that were not frozen already.
+    '''
+    script = find_freeze_script(source_dir)
+    if script is None:
+        raise ValueError(
+            'No freeze script in {}, freezing modules needs python 3.11+'
+            .format(source_dir))
+    add_frozen_modules(script, [])
+    frozen = read_frozen_modules(script)
+    modules = [module for module in modules if module not in frozen]
+    add_frozen_modules(script, modules)
+    subprocess.check_call([python, script], cwd=source_dir)
+    return modules
+
+
+def measure_frozen_startup(python, modules, runs=10):
+    '''
+    Return the median time (in ms) ``python`` takes to start and import
+    ``modules``, without and with the frozen modules (``-X frozen_modules``),
+    e.g. to measure the gain of freezing them on a host build of the same
+    configuration.
+    '''
+    code = ''.join('import {}\n'.format(module) for module in modules)
+    medians = []
+    for frozen in ('off', 'on'):
+        args = [python, '-I', '-X', 'frozen_modules=' + frozen, '-c', code]
+        # the first run writes the .pyc of the non frozen modules
+        subprocess.check_call(args)
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call(args)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        medians.append(timings[len(timings) // 2])
+    return tuple(medians)
@@ -0,0 +1,106 @@
+"""
+Benchmarks of the steps of a build that run on the hostpython, to compare
+hostpython builds, e.g. the PGO and LTO build of ``--optimized-hostpython``
+with the default one: compiling the stdlib (as the python bundle does), and
+an offline pip resolution (as every pip install does).
+
+Run as a script, this compares the pythons given::
+
+    python -m pythonforandroid.hostbench PYTHON [PYTHON...]
+"""
+
+from collections import namedtuple
+from os import environ
+from os.path import join
+import glob
+import subprocess
+import sys
+import tempfile
+import time
+
+
+class HostBenchmark(namedtuple('HostBenchmark', [
+        'python', 'compileall', 'pip_resolve'])):
+    '''The median times (in seconds) ``python`` takes to compile the stdlib
+    and to resolve pip offline (``None`` when pip isn't bundled).'''
+
+    def speedup(self, baseline):
+        '''How many times faster than the :class:`HostBenchmark`
+        ``baseline`` each step is, as a :class:`HostBenchmark`.'''
+        return HostBenchmark(
+            self.python, baseline.compileall / self.compileall,
+            None if None in (self.pip_resolve, baseline.pip_resolve) else
+            baseline.pip_resolve / self.pip_resolve)
+
+    def __str__(self):
+        return '{}: compileall of the stdlib {:.2f} s, pip resolution {}'.format(
+            self.python, self.compileall,
+            'n/a' if self.pip_resolve is None else '{:.2f} s'.format(
+                self.pip_resolve))
+
+
+def median_time(args, env=None, runs=3):
+    '''The median time (in seconds) of ``runs`` runs of the command
+    ``args``.'''
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call(args, env=env, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def stdlib_dir(python):
+    return subprocess.check_output([
+        python, '-I', '-c',
+        'import sysconfig; print(sysconfig.get_paths()["stdlib"])'],
+        text=True).strip()
+
+
+def benchmark_compileall(python, source_dir=None, runs=3):
+    '''The median time ``python`` takes to compile ``source_dir`` (its
+    stdlib by default) from scratch, in a single process.'''
+    source_dir = source_dir or stdlib_dir(python)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(environ, PYTHONPYCACHEPREFIX=cache_dir)
+        return median_time(
+            [python, '-m', 'compileall', '-q', '-f', '-j', '1', '-x',
+             r'[/\\](test|tests|idlelib|tkinter|turtledemo)[/\\]',
+             source_dir], env, runs)
+
+
+def benchmark_pip_resolve(python, runs=3):
+    '''The median time ``python`` takes to resolve the install of pip with
+    the pip wheel ensurepip bundles, offline, or ``None`` if there's none.'''
+    wheels_dir = join(stdlib_dir(python), 'ensurepip', '_bundled')
+    wheels = glob.glob(join(wheels_dir, 'pip-*.whl'))
+    if not wheels:
+        return None
+    env = dict(environ, PIP_DISABLE_PIP_VERSION_CHECK='1',
+               PIP_NO_CACHE_DIR='1', PYTHONDONTWRITEBYTECODE='1')
+    return median_time(
+        [python, join(wheels[0], 'pip'), 'install', '--dry-run', '--quiet',
+         '--ignore-installed', '--no-index', '--find-links', wheels_dir,
+         'pip'], env, runs)
+
+
+def benchmark_hostpython(python, runs=3):
+    '''The :class:`HostBenchmark` of ``python``.'''
+    return HostBenchmark(python, benchmark_compileall(python, runs=runs),
+                         benchmark_pip_resolve(python, runs))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: python -m pythonforandroid.hostbench PYTHON...')
+    results = [benchmark_hostpython(python) for python in sys.argv[1:]]
+    for result in results:
+        print(result)
+        if result is not results[0]:
+            speedup = result.speedup(results[0])
+            print('  {:.2f}x the compileall speed of {}{}'.format(
+                speedup.compileall, results[0].python,
+                '' if speedup.pip_resolve is None else
+                ', {:.2f}x its pip resolution speed'.format(
+                    speedup.pip_resolve)))
@@ -0,0 +1,213 @@
+"""
+Helpers for the link and optimization profiles (``--link-profile`` and
+``--opt-profile``), and a report of what they change in the libraries of a
+dist: their size, the relocations the dynamic linker applies when loading
+them, and the symbols they export.
+
+The flags of the profiles are in :class:`~pythonforandroid.archs.Arch`
+(:attr:`~pythonforandroid.archs.Arch.load_cflags`,
+:meth:`~pythonforandroid.archs.Arch.get_load_ldflags`,
+:attr:`~pythonforandroid.archs.Arch.opt_cflags` and
+:attr:`~pythonforandroid.archs.Arch.opt_ldflags`).
+"""
+
+from collections import namedtuple
+from os.path import exists, getsize, join, relpath
+import json
+import os
+import struct
+
+
+LINK_PROFILES = ['default', 'load']
+'''The link profiles: ``default``, and ``load``, trading link time for
+smaller libraries that load faster (packed relocations, GNU hash, hidden
+visibility, unused and identical sections dropped).'''
+
+OPT_PROFILES = ['default', 'speed', 'size', 'lto']
+'''The optimization profiles: ``default``, leaving the optimization level to
+each recipe, ``speed`` (``-O3``), ``size`` (``-Os``) and ``lto`` (``-O2`` and
+ThinLTO).'''
+
+
+def profile_choices(link_profile, opt_profile):
+    '''The names of the non-default profiles among ``link_profile`` and
+    ``opt_profile``, e.g. ``['link_load', 'opt_lto']``, which the dirs of
+    the builds made with them are named after, so that a build with other
+    profiles never reuses them.'''
+    choices = []
+    if link_profile != 'default':
+        choices.append('link_' + link_profile)
+    if opt_profile != 'default':
+        choices.append('opt_' + opt_profile)
+    return choices
+
+
+ELF_MAGIC = b'\x7fELF'
+
+SHT_RELA = 4
+SHT_REL = 9
+SHT_DYNSYM = 11
+SHT_RELR = 19
+SHT_ANDROID_REL = 0x60000001
+SHT_ANDROID_RELA = 0x60000002
+SHT_ANDROID_RELR = 0x6fffff00
+
+RELOCATION_SECTIONS = (SHT_RELA, SHT_REL, SHT_RELR, SHT_ANDROID_REL,
+                       SHT_ANDROID_RELA, SHT_ANDROID_RELR)
+'''The types of the sections of dynamic relocations, standard or packed.'''
+
+
+class LibraryStats(namedtuple('LibraryStats', [
+        'size', 'relocations', 'relocations_size', 'exported_symbols'])):
+    '''The size of a library, the number of its dynamic relocations and the
+    size they take in it, and the number of symbols it exports.'''
+
+    def __str__(self):
+        return '{:.1f} KiB, {} relocations ({:.1f} KiB), {} symbols'.format(
+            self.size / 1024, self.relocations, self.relocations_size / 1024,
+            self.exported_symbols)
+
+
+def read_sleb128(data, offset):
+    '''The signed LEB128 number at ``offset`` of ``data``, and the offset
+    after it.'''
+    result = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    if byte & 0x40:
+        result -= 1 << shift
+    return result, offset
+
+
+def count_relocations(sh_type, data, word_size, entsize):
+    '''The number of relocations of the section of type ``sh_type`` with the
+    content ``data``.'''
+    if sh_type in (SHT_REL, SHT_RELA):
+        return len(data) // entsize if entsize else 0
+    if sh_type in (SHT_RELR, SHT_ANDROID_RELR):
+        # an address, or a bitmap of the words following the previous one
+        word_format = '<Q' if word_size == 8 else '<I'
+        count = 0
+        for (word,) in struct.iter_unpack(word_format, data):
+            count += 1 if not word & 1 else bin(word >> 1).count('1')
+        return count
+    # the Android packed relocations: APS2, then their count
+    if not data.startswith(b'APS2'):
+        return 0
+    return read_sleb128(data, 4)[0]
+
+
+def library_stats(filen):
+    '''The :class:`LibraryStats` of the shared library ``filen``, or ``None``
+    if it is not a little endian ELF file.'''
+    with open(filen, 'rb') as fileh:
+        data = fileh.read()
+    if not data.startswith(ELF_MAGIC) or len(data) < 64 or data[5] != 1:
+        return None
+    if data[4] == 2:
+        word_size = 8
+        header_format, section_format = '<HHIQQQIHHHHHH', '<IIQQQQIIQQ'
+        symbol_format, shndx_field = '<IBBHQQ', 3
+    else:
+        word_size = 4
+        header_format, section_format = '<HHIIIIIHHHHHH', '<IIIIIIIIII'
+        symbol_format, shndx_field = '<IIIBBH', 5
+    header = struct.unpack_from(header_format, data, 16)
+    shoff, shentsize, shnum = header[5], header[10], header[11]
+
+    relocations = relocations_size = exported_symbols = 0
+    for i in range(shnum):
+        section = struct.unpack_from(section_format, data, shoff + i * shentsize)
+        sh_type, offset, size, entsize = (
+            section[1], section[4], section[5], section[9])
+        content = data[offset:offset + size]
+        if sh_type in RELOCATION_SECTIONS:
+            relocations += count_relocations(
+                sh_type, content, word_size, entsize)
+            relocations_size += size
+        elif sh_type == SHT_DYNSYM and entsize:
+            exported_symbols += sum(
+                1 for symbol in struct.iter_unpack(
+                    symbol_format, content[:size - size % entsize])
+                if symbol[shndx_field] != 0)
+    return LibraryStats(getsize(filen), relocations, relocations_size,
+                        exported_symbols)
+
+
+def collect_library_stats(base_dir, dirs):
+    '''The :class:`LibraryStats` of the ``.so`` files of ``dirs``, by path
+    relative to ``base_dir``.'''
+    stats = {}
+    for dirn in dirs:
+        for dirpath, dirnames, filenames in os.walk(dirn):
+            for filename in filenames:
+                filen = join(dirpath, filename)
+                if not filename.endswith('.so') or os.path.islink(filen):
+                    continue
+                library = library_stats(filen)
+                if library is not None:
+                    stats[relpath(filen, base_dir)] = library
+    return stats
+
+
+def read_library_stats(filen):
+    if not exists(filen):
+        return None
+    with open(filen) as fileh:
+        return {name: LibraryStats(*values)
+                for name, values in json.load(fileh).items()}
+
+
+def write_library_stats(filen, stats):
+    with open(filen, 'w') as fileh:
+        json.dump({name: list(values) for name, values in stats.items()},
+                  fileh, indent=1, sort_keys=True)
+
+
+def write_link_report(report_fn, stats, baseline=None, comments=()):
+    '''Write a report of the :class:`LibraryStats` ``stats`` of the libraries
+    of a dist, with their changes from those of ``baseline`` (the same for
+    another build, if any), largest libraries first. ``comments`` are
+    written at the top. Returns the totals of ``stats`` and of ``baseline``
+    (``None`` without one), as :class:`LibraryStats`.'''
+    def delta(value, base_value, unit=1, fmt='{:+.0f}'):
+        if base_value is None:
+            return ''
+        return ' (' + fmt.format((value - base_value) / unit) + ')'
+
+    def total(libraries):
+        return LibraryStats(*(sum(values) for values in zip(
+            *libraries))) if libraries else LibraryStats(0, 0, 0, 0)
+
+    totals = total(list(stats.values()))
+    base_totals = None if baseline is None else total(list(baseline.values()))
+    baseline = baseline or {}
+    with open(report_fn, 'w') as fileh:
+        for comment in comments:
+            fileh.write('# {}\n'.format(comment))
+        fileh.write('# {} libraries: {}{}\n'.format(
+            len(stats), totals,
+            ', changed from the baseline: {:+.1f} KiB, {:+} relocations, '
+            '{:+} symbols'.format(
+                (totals.size - base_totals.size) / 1024,
+                totals.relocations - base_totals.relocations,
+                totals.exported_symbols - base_totals.exported_symbols)
+            if base_totals is not None else ''))
+        for name, library in sorted(
+                stats.items(), key=lambda item: (-item[1].size, item[0])):
+            base = baseline.get(name) or LibraryStats(None, None, None, None)
+            fileh.write(
+                '{:<50} {:>9.1f} KiB{} {:>7} relocations{} '
+                '{:>6} symbols{}\n'.format(
+                    name, library.size / 1024,
+                    delta(library.size, base.size, 1024, '{:+.1f}'),
+                    library.relocations,
+                    delta(library.relocations, base.relocations),
+                    library.exported_symbols,
+                    delta(library.exported_symbols, base.exported_symbols)))
+    return totals, base_totals
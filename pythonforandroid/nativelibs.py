@@ -0,0 +1,132 @@
+"""
+Helpers to compute, when packaging, the order the app loads its native
+libraries in: the ``NEEDED`` entries of each library are read from its ELF
+dynamic section, so that the app loads exactly the libraries it needs, each
+one after those it depends on, instead of scanning its native library
+directory for known names on every launch.
+"""
+
+from os import listdir
+from os.path import isfile, join
+from fnmatch import fnmatch
+import struct
+
+
+ELF_MAGIC = b'\x7fELF'
+
+SHT_SYMTAB = 2
+SHT_DYNAMIC = 6
+DT_NULL = 0
+DT_NEEDED = 1
+
+_ELF_FORMATS = {
+    # EI_CLASS: (e_shoff, e_shentsize/e_shnum, section header, dyn entry)
+    1: ('<32xI', '<46xHH', '<IIIIIIIIII', '<iI'),
+    2: ('<40xQ', '<58xHH', '<IIQQQQIIQQ', '<qQ'),
+}
+
+
+def read_needed(filen):
+    '''
+    Return the libraries the ELF shared library ``filen`` needs (its
+    ``DT_NEEDED`` entries, e.g. ``['libpython3.11.so', 'libc.so']``), or
+    ``None`` if it is not a little endian ELF file (e.g. one of the payloads
+    shipped as ``.so`` files).
+    '''
+    with open(filen, 'rb') as fileh:
+        data = fileh.read()
+    if data[:4] != ELF_MAGIC or data[5] != 1 or data[4] not in _ELF_FORMATS:
+        return None
+    shoff_fmt, shnum_fmt, section_fmt, dyn_fmt = _ELF_FORMATS[data[4]]
+    shoff, = struct.unpack_from(shoff_fmt, data)
+    shentsize, shnum = struct.unpack_from(shnum_fmt, data)
+
+    sections = [struct.unpack_from(section_fmt, data, shoff + i * shentsize)
+                for i in range(shnum)]
+    needed = []
+    for section in sections:
+        if section[1] != SHT_DYNAMIC:
+            continue
+        offset, size, link = section[4], section[5], section[6]
+        # the dynamic section links to its string table
+        strtab = sections[link][4]
+        for pos in range(offset, offset + size,
+                         struct.calcsize(dyn_fmt)):
+            tag, value = struct.unpack_from(dyn_fmt, data, pos)
+            if tag == DT_NULL:
+                break
+            if tag == DT_NEEDED:
+                start = strtab + value
+                needed.append(
+                    data[start:data.index(b'\0', start)].decode('utf-8'))
+    return needed
+
+
+def read_symbols(filen):
+    '''
+    Return the names of the symbols of the ELF file ``filen`` (those of its
+    ``.symtab``, static ones included), which is empty once it is stripped,
+    or ``None`` if it is not a little endian ELF file.
+    '''
+    with open(filen, 'rb') as fileh:
+        data = fileh.read()
+    if data[:4] != ELF_MAGIC or data[5] != 1 or data[4] not in _ELF_FORMATS:
+        return None
+    shoff_fmt, shnum_fmt, section_fmt, _ = _ELF_FORMATS[data[4]]
+    shoff, = struct.unpack_from(shoff_fmt, data)
+    shentsize, shnum = struct.unpack_from(shnum_fmt, data)
+
+    sections = [struct.unpack_from(section_fmt, data, shoff + i * shentsize)
+                for i in range(shnum)]
+    symbols = set()
+    for section in sections:
+        if section[1] != SHT_SYMTAB:
+            continue
+        offset, size, link, entsize = (
+            section[4], section[5], section[6], section[9])
+        # the symbol table links to its string table
+        strtab = sections[link][4]
+        for pos in range(offset, offset + size, entsize):
+            # st_name comes first, for both ELF classes
+            name, = struct.unpack_from('<I', data, pos)
+            if name:
+                start = strtab + name
+                symbols.add(data[start:data.index(b'\0', start)].decode(
+                    'utf-8', 'replace'))
+    return symbols
+
+
+def library_load_order(libs_dir, roots):
+    '''
+    Return the libraries of ``libs_dir`` the app has to load for the
+    libraries matching the patterns ``roots`` (e.g. ``'libssl*.so'``), with
+    the libraries of ``libs_dir`` they need: each library comes after those
+    it depends on, in the order of ``roots`` otherwise. Libraries that are
+    not in ``libs_dir`` (those of the system) are left to the dynamic
+    linker.
+    '''
+    needed = {}
+    for name in sorted(listdir(libs_dir)):
+        if name.endswith('.so') and isfile(join(libs_dir, name)):
+            deps = read_needed(join(libs_dir, name))
+            if deps is not None:
+                needed[name] = deps
+
+    order = []
+    visiting = set()
+
+    def visit(name):
+        if name in order or name in visiting or name not in needed:
+            return
+        # a dependency cycle is broken at the library visited first
+        visiting.add(name)
+        for dep in needed[name]:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for pattern in roots:
+        for name in needed:
+            if fnmatch(name, pattern):
+                visit(name)
+    return order
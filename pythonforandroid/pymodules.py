@@ -0,0 +1,175 @@
+"""
+Helpers to link the extension modules of the recipes into a single
+``libpymodules.so`` (``--biglink``), instead of a ``.so`` per module.
+
+With ``--biglink``, the recipes link their extension modules with
+``tools/liblink``: the object files of each module are linked into a
+relocatable object in ``objects_<recipe>``, and the ``.so`` that gets
+installed in the site-packages is a placeholder naming this object. The
+objects are then linked into ``libpymodules.so``, and the placeholders are
+replaced in the python bundle by a generated meta path finder
+(``_p4a_pymodules.py``) loading the modules from it.
+"""
+
+from os.path import basename, exists, getsize, join, relpath
+import hashlib
+import json
+import os
+import pprint
+
+
+PYMODULES_LIBRARY = 'libpymodules.so'
+'''The library the extension modules are linked into.'''
+
+PYMODULES_FINDER = '_p4a_pymodules.py'
+'''The generated module, in the site-packages, finding the extension modules
+of :data:`PYMODULES_LIBRARY`.'''
+
+PLACEHOLDER_MARKER = b'P4A_BIGLINK '
+'''How the placeholders ``tools/liblink`` writes instead of an extension
+module start, followed by the name of its object.'''
+
+# The finder, written with the table of its modules. start.c installs it
+# when libpymodules.so is in the native libs directory.
+FINDER_SOURCE = """\
+'''
+The extension modules linked into libpymodules.so with --biglink, by
+module: their path relative to the site-packages, which is their __file__.
+Generated by python-for-android (see pythonforandroid/pymodules.py).
+'''
+
+import sys
+from importlib.machinery import ExtensionFileLoader, ModuleSpec, PathFinder
+from os.path import dirname, join
+
+MODULES = {modules}
+
+
+class PyModulesLoader(ExtensionFileLoader):
+    def __init__(self, name, path, filen):
+        super().__init__(name, path)
+        self.filen = filen
+
+    def exec_module(self, module):
+        module.__file__ = self.filen
+        super().exec_module(module)
+
+
+class PyModulesFinder:
+    def __init__(self, library, modules=MODULES, site_packages=None):
+        self.library = library
+        self.modules = modules
+        self.site_packages = site_packages or dirname(__file__)
+
+    def find_spec(self, fullname, path=None, target=None):
+        filen = self.modules.get(fullname)
+        if filen is None:
+            return None
+        loader = PyModulesLoader(
+            fullname, self.library, join(self.site_packages, filen))
+        return ModuleSpec(fullname, loader, origin=self.library)
+
+    def invalidate_caches(self):
+        pass
+
+
+def install(library, meta_path=None):
+    if meta_path is None:
+        meta_path = sys.meta_path
+    finder = PyModulesFinder(library)
+    position = len(meta_path)
+    for i, other in enumerate(meta_path):
+        if other is PathFinder:
+            position = i
+            break
+    meta_path.insert(position, finder)
+    return finder
+"""
+
+
+def read_placeholder(filen):
+    '''The name of the object of the placeholder ``filen``, or ``None`` if it
+    is not a placeholder.'''
+    with open(filen, 'rb') as fileh:
+        data = fileh.read(256)
+    if not data.startswith(PLACEHOLDER_MARKER):
+        return None
+    return data[len(PLACEHOLDER_MARKER):].decode().strip()
+
+
+def module_name(filen):
+    '''The name of the extension module of the path ``filen`` (relative to
+    the site-packages), e.g. ``kivy._event`` for
+    ``kivy/_event.cpython-314-aarch64-linux-android.so``.'''
+    parts = filen.split(os.sep)
+    parts[-1] = parts[-1].split('.', 1)[0]
+    return '.'.join(parts)
+
+
+def find_placeholders(site_packages):
+    '''The placeholders of the site-packages dir ``site_packages``, by
+    module: their path relative to it, and the name of their object.'''
+    modules = {}
+    for dirpath, dirnames, filenames in os.walk(site_packages):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            filen = join(dirpath, filename)
+            if not filename.endswith('.so') or getsize(filen) > 256:
+                continue
+            obj = read_placeholder(filen)
+            if obj is not None:
+                rel = relpath(filen, site_packages)
+                modules[module_name(rel)] = (rel, obj)
+    return modules
+
+
+def init_function(module):
+    '''The init function the extension ``module`` exports.'''
+    return 'PyInit_' + module.rsplit('.', 1)[-1]
+
+
+def split_modules(modules):
+    '''Split ``modules`` (names) in those that can be linked together and
+    those that can't, because another one has the same init function.'''
+    by_init = {}
+    for module in sorted(modules):
+        by_init.setdefault(init_function(module), []).append(module)
+    linked = [names[0] for names in by_init.values() if len(names) == 1]
+    separate = [name for names in by_init.values() if len(names) > 1
+                for name in names]
+    return sorted(linked), sorted(separate)
+
+
+def objects_digest(objects, link_args=()):
+    '''A digest of the object files ``objects`` (and their ``.libs``), and of
+    the ``link_args``, that changes whenever they have to be linked again.'''
+    state = [list(link_args)]
+    for obj in sorted(objects):
+        stat = os.stat(obj)
+        libs = obj[:-len('.o')] + '.libs'
+        with open(libs) as fileh:
+            state.append([obj, stat.st_size, stat.st_mtime_ns, fileh.read()])
+    return hashlib.sha256(json.dumps(state).encode()).hexdigest()
+
+
+def write_finder(filen, modules):
+    '''Write the finder module ``filen`` for the modules of ``modules``: the
+    relative paths of their placeholders, by name.'''
+    with open(filen, 'w') as fileh:
+        fileh.write(FINDER_SOURCE.format(
+            modules=pprint.pformat(modules, indent=4)))
+
+
+def is_placeholder(filen):
+    return (filen.endswith('.so') and exists(filen) and
+            getsize(filen) <= 256 and read_placeholder(filen) is not None)
+
+
+def object_filens(objects_dirs, name):
+    '''The relocatable object named ``name`` in one of ``objects_dirs``, and
+    its ``.libs``, or ``None``.'''
+    for objects_dir in objects_dirs:
+        obj = join(objects_dir, basename(name) + '.o')
+        if exists(obj) and exists(obj[:-len('.o')] + '.libs'):
+            return obj
+    return None
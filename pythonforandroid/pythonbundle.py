@@ -0,0 +1,455 @@
+"""
+Helpers to lay out the python bundle (``_python_bundle``) that is shipped
+inside the app: writing the ``stdlib.zip``, describing its contents,
+pruning the stdlib and site-packages down to the modules an app uses and
+choosing what can be imported in place.
+"""
+
+from collections import namedtuple
+from fnmatch import fnmatch
+from os import environ
+from os.path import basename, exists, getsize, join, normpath, sep
+import ast
+import re
+import struct
+import subprocess
+import time
+import zipfile
+
+
+ZIP_COMPRESSIONS = {
+    'stored': zipfile.ZIP_STORED,
+    'deflated': zipfile.ZIP_DEFLATED,
+}
+'''The compressions supported for the entries of a zip bundle.'''
+
+ZIP_ALIGNMENT_EXTRA_ID = 0xd935
+'''The id of the zip extra field used to pad the entries, as zipalign does.'''
+
+INFLATE_BYTES_PER_SECOND = 50 * 1024 * 1024
+'''Rough zlib inflate throughput of a single low-end device core. This is
+only used to estimate the decompression cost of a zip bundle.'''
+
+IMPORTTIME_RE = re.compile(r'import time:\s+\d+\s+\|\s+\d+\s+\|\s*(\S+)')
+'''Matches a line of ``python -X importtime`` output. The match is not
+anchored so that lines prefixed by logcat are matched too.'''
+
+STDLIB_ALWAYS_KEEP = [
+    '_collections_abc', '_sitebuiltins', 'abc', 'codecs', 'encodings',
+    'genericpath', 'importlib', 'io', 'os', 'posixpath', 'site', 'stat',
+    'traceback', 'zipimport',
+]
+'''Stdlib modules that are never pruned: the interpreter needs them to
+start (some are imported before ``-X importtime`` starts reporting) and
+the p4a bootstrap imports them before the app runs.'''
+
+
+class ZipBundleReport(namedtuple('ZipBundleReport', [
+        'name', 'entries', 'stored', 'deflated',
+        'size', 'uncompressed_size', 'inflate_size'])):
+    '''What :func:`write_zip_bundle` wrote. ``inflate_size`` is the
+    uncompressed size of the deflated entries, which zipimport has to
+    inflate every time one of them is imported.'''
+
+    @property
+    def estimated_inflate_ms(self):
+        return 1000.0 * self.inflate_size / INFLATE_BYTES_PER_SECOND
+
+    def __str__(self):
+        return (
+            '{name}: {entries} entries ({deflated} deflated, {stored} '
+            'stored), {size:.1f} MiB ({uncompressed_size:.1f} MiB '
+            'uncompressed), estimated decompression cost {ms:.0f} ms'.format(
+                name=self.name, entries=self.entries,
+                deflated=self.deflated, stored=self.stored,
+                size=self.size / 1024 / 1024,
+                uncompressed_size=self.uncompressed_size / 1024 / 1024,
+                ms=self.estimated_inflate_ms))
+
+
+def zip_date_time():
+    '''The timestamp given to every zip entry: ``SOURCE_DATE_EPOCH`` if set
+    (for reproducible builds), otherwise the zip epoch. The timestamps
+    don't matter to zipimport, which never checks them for a .pyc without
+    source.'''
+    if 'SOURCE_DATE_EPOCH' in environ:
+        timestamp = max(int(environ['SOURCE_DATE_EPOCH']), 315532800)
+        return time.gmtime(timestamp)[:6]
+    return (1980, 1, 1, 0, 0, 0)
+
+
+def read_import_order(filen):
+    '''Read a module list, one module name per line, ignoring blank lines
+    and ``#`` comments.'''
+    with open(filen) as fileh:
+        lines = [line.split('#', 1)[0].strip() for line in fileh]
+    return [line for line in lines if line]
+
+
+def module_arcnames(module):
+    '''The paths a module may have inside a zip bundle.'''
+    base = module.replace('.', '/')
+    return [base + '.pyc', base + '/__init__.pyc',
+            base + '.py', base + '/__init__.py']
+
+
+def order_zip_entries(arcnames, import_order=None):
+    '''Return ``arcnames`` sorted, with the modules of ``import_order``
+    (a list of module names) first and in that order.'''
+    remaining = set(arcnames)
+    ordered = []
+    for module in import_order or []:
+        for arcname in module_arcnames(module):
+            if arcname in remaining:
+                ordered.append(arcname)
+                remaining.remove(arcname)
+    return ordered + sorted(remaining)
+
+
+def write_zip_bundle(zip_fn, base_dir, filens, compression='deflated',
+                     stored_patterns=(), import_order=None, align=0):
+    '''
+    Write the files ``filens`` (relative to ``base_dir``) in the zip
+    ``zip_fn`` and return a :class:`ZipBundleReport`.
+
+    See :func:`write_zip` for the options.
+    '''
+    files = {normpath(filen).replace(sep, '/'): join(base_dir, filen)
+             for filen in filens}
+    return write_zip(zip_fn, files, compression=compression,
+                     stored_patterns=stored_patterns,
+                     import_order=import_order, align=align)
+
+
+def write_zip(zip_fn, files, compression='deflated', stored_patterns=(),
+              import_order=None, align=0):
+    '''
+    Write the zip ``zip_fn`` from ``files``, a dict of the path in the zip of
+    each file to the path of the file to write there, and return a
+    :class:`ZipBundleReport`.
+
+    The zip is deterministic: entries are sorted (after those listed in
+    ``import_order``), get a fixed timestamp and permissions, and the source
+    files are left untouched. Each entry is compressed with ``compression``
+    (one of :data:`ZIP_COMPRESSIONS`) unless it matches one of the
+    ``stored_patterns``, in which case it is stored uncompressed. If
+    ``align`` is set, the data of the stored entries starts at a multiple
+    of ``align`` bytes in the zip, like zipalign does.
+    '''
+    if compression not in ZIP_COMPRESSIONS:
+        raise ValueError('Unknown zip compression {!r}, expected one of {}'
+                         .format(compression, ', '.join(ZIP_COMPRESSIONS)))
+    date_time = zip_date_time()
+    stored = deflated = uncompressed_size = inflate_size = 0
+    with zipfile.ZipFile(zip_fn, 'w') as zf:
+        for arcname in order_zip_entries(files, import_order):
+            with open(files[arcname], 'rb') as fileh:
+                data = fileh.read()
+            zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+            zinfo.external_attr = 0o644 << 16
+            if any(fnmatch(arcname, pattern) for pattern in stored_patterns):
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = ZIP_COMPRESSIONS[compression]
+            if align and zinfo.compress_type == zipfile.ZIP_STORED:
+                zinfo.extra = zip_alignment_extra(
+                    zf.fp.tell(), arcname, align)
+            zf.writestr(zinfo, data)
+            # the padding only belongs in the local header: the central
+            # directory record, written on close, is a plain one
+            zinfo.extra = b''
+            uncompressed_size += len(data)
+            if zinfo.compress_type == zipfile.ZIP_STORED:
+                stored += 1
+            else:
+                deflated += 1
+                inflate_size += len(data)
+    return ZipBundleReport(
+        name=zip_fn.rsplit('/', 1)[-1], entries=len(files),
+        stored=stored, deflated=deflated, size=getsize(zip_fn),
+        uncompressed_size=uncompressed_size, inflate_size=inflate_size)
+
+
+def zip_alignment_extra(header_offset, arcname, align):
+    '''The extra field (of the type zipalign uses) that pads the local header
+    of the zip entry ``arcname`` written at ``header_offset``, so that its
+    data starts at a multiple of ``align``.'''
+    # the local header is 30 bytes, then the name, then the extra field
+    data_offset = header_offset + 30 + len(arcname.encode('utf-8')) + 4
+    padding = -data_offset % align
+    return struct.pack('<HH', ZIP_ALIGNMENT_EXTRA_ID, padding) + b'\0' * padding
+
+
+def parse_import_trace(lines):
+    '''Return the modules imported in an ``-X importtime`` trace (an
+    iterable of lines), in import order and without duplicates.'''
+    modules = []
+    seen = set()
+    for line in lines:
+        match = IMPORTTIME_RE.search(line)
+        if match is None:
+            continue
+        module = match.group(1)
+        if module in seen:
+            continue
+        seen.add(module)
+        modules.append(module)
+    return modules
+
+
+def read_import_trace(filen):
+    '''Read the modules of an ``-X importtime`` trace saved in ``filen``,
+    e.g. a host run's stderr or a device logcat.'''
+    with open(filen, errors='replace') as fileh:
+        return parse_import_trace(fileh)
+
+
+def capture_import_trace(python, entrypoint, timeout=60, env=None):
+    '''Run ``entrypoint`` with ``python -X importtime`` and return the
+    modules it imported.
+
+    The app is killed after ``timeout`` seconds, and whatever it imported
+    until then (or until it failed, e.g. on a module that only exists on
+    the device) is returned.
+    '''
+    try:
+        proc = subprocess.run(
+            [python, '-X', 'importtime', entrypoint],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, timeout=timeout, env=env)
+        stderr = proc.stderr
+    except subprocess.TimeoutExpired as exc:
+        stderr = exc.stderr or b''
+    return parse_import_trace(stderr.decode('utf-8', 'replace').splitlines())
+
+
+def module_name(filen):
+    '''The module (or, for data files, the package) a file of a python
+    tree belongs to, or ``None`` for a data file at the top level.'''
+    parts = normpath(filen).replace(sep, '/').split('/')
+    if parts[-1].endswith('.so'):
+        # e.g. _ctypes.cpython-311-aarch64-linux-android.so
+        base = parts[-1].split('.', 1)[0]
+    elif parts[-1].endswith(('.py', '.pyc')):
+        base = parts[-1].rsplit('.', 1)[0]
+    else:
+        base = None
+    if base is not None and base != '__init__':
+        return '.'.join(parts[:-1] + [base])
+    if len(parts) == 1:
+        return None
+    return '.'.join(parts[:-1])
+
+
+def is_module_file(filen):
+    return filen.endswith(('.py', '.pyc', '.so'))
+
+
+def split_in_place_files(filens, on_disk=()):
+    '''
+    Split the files of a site-packages tree between those that can be
+    imported in place from a zip and those that must be extracted, and
+    return them as ``(in_place, extracted)``.
+
+    zipimport can't load extension modules, and a package is imported from
+    a single location, so a top level package holding an extension module
+    is extracted whole. So are the top level modules listed in ``on_disk``,
+    e.g. packages opening their data files next to ``__file__``.
+    '''
+    def top_level(filen):
+        parts = normpath(filen).replace(sep, '/').split('/')
+        if len(parts) > 1:
+            return parts[0]
+        return module_name(filen) or filen
+
+    on_disk = set(on_disk)
+    on_disk.update(top_level(filen) for filen in filens
+                   if filen.endswith('.so'))
+    in_place = []
+    extracted = []
+    for filen in filens:
+        if top_level(filen) in on_disk:
+            extracted.append(filen)
+        else:
+            in_place.append(filen)
+    return in_place, extracted
+
+
+def prune_stdlib(filens, imported, keep=()):
+    '''
+    Split the stdlib files ``filens`` into those to ship and those to drop,
+    returning ``(kept, dropped)``.
+
+    A file is kept if its module was ``imported`` (a list of module names,
+    as returned by :func:`parse_import_trace`), is the parent package of an
+    imported module, or is in ``keep`` or :data:`STDLIB_ALWAYS_KEEP`. A
+    module listed in ``keep`` is kept with all its submodules, which is the
+    way to ship modules that are imported lazily or only on the device.
+    '''
+    wanted = set()
+    for module in imported:
+        wanted.update(parent_modules(module))
+    whole = set(keep) | set(STDLIB_ALWAYS_KEEP)
+    kept = []
+    dropped = []
+    for filen in filens:
+        module = module_name(filen)
+        if (module is None or module in wanted or
+                any(module == name or module.startswith(name + '.')
+                    for name in whole)):
+            kept.append(filen)
+        else:
+            dropped.append(filen)
+    return kept, dropped
+
+
+def parent_modules(module):
+    '''``module`` and all its parent packages, e.g. ``['a', 'a.b', 'a.b.c']``
+    for ``'a.b.c'``.'''
+    parts = module.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def find_imports(source, module, is_package=False):
+    '''
+    Return the modules that the python ``source`` of ``module`` may import.
+
+    Every import statement counts, wherever it is (functions, ``try``
+    blocks...), relative imports are resolved, ``from a import b`` gives
+    both ``a`` and ``a.b`` (which may be a submodule), and so do
+    ``importlib.import_module()`` and ``__import__()`` calls with a literal
+    module name. Raises :class:`SyntaxError` if the source can't be parsed.
+    '''
+    package = module if is_package else module.rpartition('.')[0]
+    imports = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                parts = package.split('.')
+                base = '.'.join(parts[:len(parts) - node.level + 1])
+                if node.module:
+                    base = '{}.{}'.format(base, node.module).strip('.')
+            else:
+                base = node.module
+            imports.add(base)
+            imports.update('{}.{}'.format(base, alias.name)
+                           for alias in node.names)
+        elif (isinstance(node, ast.Call) and node.args and
+                isinstance(node.args[0], ast.Constant) and
+                isinstance(node.args[0].value, str)):
+            func = node.func
+            name = getattr(func, 'id', getattr(func, 'attr', None))
+            if name in ('import_module', '__import__'):
+                imports.add(node.args[0].value)
+    return imports
+
+
+def read_module_source(base_dir, filens):
+    '''The source of a module made of ``filens``, or ``None`` if there is
+    none, e.g. for an extension module or a .pyc shipped without its
+    source.'''
+    for filen in filens:
+        source_fn = join(base_dir, filen)
+        if source_fn.endswith('.pyc'):
+            source_fn = source_fn[:-1]
+        if source_fn.endswith('.py') and exists(source_fn):
+            with open(source_fn, 'rb') as fileh:
+                return fileh.read()
+    return None
+
+
+def shake_python_tree(base_dir, filens, seeds, keep=()):
+    '''
+    Split the files ``filens`` of a python tree (e.g. site-packages, with
+    paths relative to ``base_dir``) into those reachable from the modules
+    ``seeds`` and those which aren't, returning ``(kept, dropped)``.
+
+    The module graph is followed from the ``seeds`` through the imports
+    found by :func:`find_imports`; the source of each module is read from
+    its .py file, even if only its .pyc is in ``filens``. Reaching a module
+    reaches its parent packages too. Modules listed in ``keep`` are
+    reachable with all their submodules, which is the way to ship modules
+    imported dynamically (e.g. from a string built at runtime). Since the
+    imports of a module can't be known without its source, reaching an
+    extension module reaches all the modules of its package, and reaching
+    a module without source reaches its whole top level package.
+
+    Data files are kept if the package they are in is reachable. Files
+    which aren't in a package, like the ``*.dist-info`` directories, are
+    always kept.
+    '''
+    modules = {}
+    for filen in filens:
+        if is_module_file(filen):
+            modules.setdefault(module_name(filen), []).append(filen)
+    packages = {module_name(filen) for filen in filens
+                if basename(filen).startswith('__init__.')}
+
+    def expand(name):
+        return [module for module in modules
+                if module == name or module.startswith(name + '.')]
+
+    reached = set()
+    todo = list(seeds)
+    for name in keep:
+        todo.extend(expand(name))
+    while todo:
+        module = todo.pop()
+        if module not in modules or module in reached:
+            continue
+        reached.add(module)
+        todo.extend(parent_modules(module))
+        source = read_module_source(base_dir, modules[module])
+        if any(filen.endswith('.so') for filen in modules[module]):
+            package = module.rpartition('.')[0]
+            todo.extend(sibling for sibling in modules
+                        if sibling.rpartition('.')[0] == package)
+        if source is None:
+            if not any(filen.endswith('.so') for filen in modules[module]):
+                todo.extend(expand(module.split('.')[0]))
+            continue
+        try:
+            todo.extend(find_imports(
+                source, module, is_package=module in packages))
+        except (SyntaxError, ValueError):
+            todo.extend(expand(module.split('.')[0]))
+
+    kept = []
+    dropped = []
+    for filen in filens:
+        module = module_name(filen)
+        if not is_module_file(filen):
+            # a data file belongs to the package it is in, if any
+            owners = [package for package in parent_modules(module or '')
+                      if package in packages]
+            module = owners[-1] if owners else None
+        if module is None or module in reached:
+            kept.append(filen)
+        else:
+            dropped.append(filen)
+    return kept, dropped
+
+
+def write_prune_report(report_fn, base_dir, kept, dropped, comments=()):
+    '''Write a report of what was pruned from a python tree, i.e. the
+    ``dropped`` files grouped by top level module with their sizes, so that
+    it can be checked for modules the app may still need. ``comments`` are
+    written at the top. Returns the total size of the ``dropped`` files.'''
+    sizes = {}
+    for filen in dropped:
+        top = (module_name(filen) or filen).split('.')[0]
+        count, size = sizes.get(top, (0, 0))
+        sizes[top] = (count + 1, size + getsize(join(base_dir, filen)))
+    total = sum(size for _, size in sizes.values())
+    with open(report_fn, 'w') as fileh:
+        for comment in comments:
+            fileh.write('# {}\n'.format(comment))
+        fileh.write('# kept {} files, dropped {} files ({:.1f} KiB)\n'.format(
+            len(kept), len(dropped), total / 1024))
+        for top, (count, size) in sorted(
+                sizes.items(), key=lambda item: (-item[1][1], item[0])):
+            fileh.write('{:<30} {:>5} files {:>10.1f} KiB\n'.format(
+                top, count, size / 1024))
+    return total
@@ -21,6 +21,7 @@ except ImportError:
 
 import packaging.version
 
+from pythonforandroid.linkprofile import profile_choices
 from pythonforandroid.logger import (
     logger, info, warning, debug, shprint, info_main, error)
 from pythonforandroid.util import (
@@ -161,6 +162,16 @@ class Recipe(metaclass=RecipeMeta):
     Minimum ndk api recipe will support.
     '''
 
+    load_link_profile = True
+    '''Whether the recipe is built with the load-optimized link profile when
+    ``--link-profile=load`` is given. Set it to ``False`` for the recipes
+    its flags break.'''
+
+    unsupported_opt_profiles = []
+    '''The optimization profiles (``--opt-profile``) the recipe can't be
+    built with, e.g. ``['lto']``: it is built with the ``default`` one
+    instead.'''
+
     def get_stl_library(self, arch):
         return join(
             arch.ndk_lib_dir,
@@ -350,9 +361,11 @@ class Recipe(metaclass=RecipeMeta):
         built.
 
         This returns a different directory depending on what
-        alternative or optional dependencies are being built.
+        alternative or optional dependencies are being built, and on the
+        non-default link and optimization profiles the recipe is built with.
         '''
-        dir_name = self.get_dir_name()
+        dir_name = '-'.join([self.get_dir_name()] + profile_choices(
+            self.link_profile, self.opt_profile))
         return join(self.ctx.build_dir, 'other_builds',
                     dir_name, '{}__ndk_target_{}'.format(arch, self.ctx.ndk_api))
 
@@ -529,12 +542,49 @@ class Recipe(metaclass=RecipeMeta):
             else:
                 info('{} is already unpacked, skipping'.format(self.name))
 
+    @property
+    def link_profile(self):
+        '''The link profile the recipe is built with, see
+        :attr:`load_link_profile`.'''
+        if not self.load_link_profile:
+            return 'default'
+        return self.ctx.link_profile
+
+    @property
+    def opt_profile(self):
+        '''The optimization profile the recipe is built with, see
+        :attr:`unsupported_opt_profiles`.'''
+        if self.ctx.opt_profile in self.unsupported_opt_profiles:
+            return 'default'
+        return self.ctx.opt_profile
+
+    def get_cmake_opt_args(self, arch):
+        '''The ``cmake`` arguments giving the flags of the optimization
+        profile of the recipe to a ``Release`` build, whose own flags come
+        after those of the env.'''
+        cflags = arch.opt_cflags.get(self.opt_profile)
+        if not cflags:
+            return []
+        args = [
+            '-DCMAKE_{}_FLAGS_RELEASE={}'.format(
+                lang, ' '.join(['-DNDEBUG'] + cflags))
+            for lang in ('C', 'CXX')]
+        ldflags = arch.opt_ldflags.get(self.opt_profile)
+        if ldflags:
+            args.extend(
+                '-DCMAKE_{}_LINKER_FLAGS_RELEASE={}'.format(
+                    kind, ' '.join(ldflags))
+                for kind in ('SHARED', 'MODULE', 'EXE'))
+        return args
+
     def get_recipe_env(self, arch=None, with_flags_in_cc=True):
         """Return the env specialized for the recipe
         """
         if arch is None:
             arch = self.filtered_archs[0]
-        env = arch.get_env(with_flags_in_cc=with_flags_in_cc)
+        env = arch.get_env(with_flags_in_cc=with_flags_in_cc,
+                           link_profile=self.link_profile,
+                           opt_profile=self.opt_profile)
 
         for proxy_key in ['HTTP_PROXY', 'http_proxy', 'HTTPS_PROXY', 'https_proxy']:
             if proxy_key in environ:
@@ -886,6 +936,13 @@ class PythonRecipe(Recipe):
     hostpython_prerequisites = ['setuptools']
     '''List of hostpython packages required to build a recipe'''
 
+    hidden_visibility = False
+    '''If True, the native code of the recipe is compiled with
+    ``-fvisibility=hidden`` by the load-optimized link profile. Only set it
+    for the recipes whose libraries are all python extension modules, which
+    still export their ``PyInit_*``: a shared library loaded with ctypes or
+    cffi's ABI mode needs its symbols exported.'''
+
     _host_recipe = None
 
     def __init__(self, *args, **kwargs):
@@ -985,6 +1042,9 @@ class PythonRecipe(Recipe):
         host_env = self.get_hostrecipe_env(arch)
         env['PYTHONPATH'] = host_env["PYTHONPATH"]
 
+        if self.link_profile == 'load' and self.hidden_visibility:
+            env['CFLAGS'] += ' ' + ' '.join(arch.extension_cflags)
+
         if not self.call_hostpython_via_targetpython:
             env['CFLAGS'] += ' -I{}'.format(
                 self.ctx.python_recipe.include_root(arch.arch)
@@ -1032,14 +1092,13 @@ class PythonRecipe(Recipe):
 
     def get_hostrecipe_env(self, arch=None):
         env = environ.copy()
-        _python_path = self._host_recipe.get_path_to_python()
-        libdir = glob.glob(join(_python_path, "build", "lib*"))
-        env['PYTHONPATH'] = self._host_recipe.site_dir + ":" + join(
-            _python_path, "Modules") + ":" + (libdir[0] if libdir else "")
+        env['PYTHONPATH'] = self._host_recipe.python_path
         return env
 
     @property
     def hostpython_site_dir(self):
+        if self._host_recipe.uses_system_python:
+            return self._host_recipe.site_dir
         return join(dirname(self.real_hostpython_location), 'Lib', 'site-packages')
 
     def install_hostpython_package(self, arch):
@@ -1237,6 +1296,12 @@ class CythonRecipe(PythonRecipe):
                             'objects_{}'.format(self.name))
         env['LIBLINK_PATH'] = liblink_path
         ensure_dir(liblink_path)
+        if self.ctx.biglink and not self.ctx.copy_libs:
+            # the extension modules are linked into libpymodules.so later,
+            # see pythonforandroid/pymodules.py
+            env['LDSHARED'] = join(self.ctx.root_dir, 'tools', 'liblink.sh')
+            env['LDCXXSHARED'] = env['LDSHARED']
+            env['LD'] = join(self.ctx.ndk.llvm_bin_dir, 'ld.lld')
 
         return env
 
@@ -1368,6 +1433,7 @@ class MesonRecipe(PyProjectRecipe):
                 "c_link_args": self.sanitize_flags(env["LDFLAGS"]),
                 "cpp_link_args": self.sanitize_flags(env["LDFLAGS"]),
                 "fortran_link_args": self.sanitize_flags(env["LDFLAGS"]),
+                **self.get_meson_opt_options(),
             },
             "properties": {
                 "needs_exe_wrapper": True,
@@ -1391,6 +1457,13 @@ class MesonRecipe(PyProjectRecipe):
             }
         }
 
+    def get_meson_opt_options(self):
+        '''The meson built-in options of the optimization profile of the
+        recipe, besides its flags, that are in the ``*_args``.'''
+        if self.opt_profile == 'lto':
+            return {"b_lto": True, "b_lto_mode": "thin"}
+        return {}
+
     def write_build_options(self, arch):
         """Writes python dict to meson config file"""
         option_data = ""
@@ -1399,12 +1472,12 @@ class MesonRecipe(PyProjectRecipe):
             data_chunk = "[{}]".format(key)
             for subkey in build_options[key].keys():
                 value = build_options[key][subkey]
-                if isinstance(value, int):
+                if isinstance(value, bool):
+                    value = "true" if value else "false"
+                elif isinstance(value, int):
                     value = str(value)
                 elif isinstance(value, str):
                     value = "'{}'".format(value)
-                elif isinstance(value, bool):
-                    value = "true" if value else "false"
                 elif isinstance(value, list):
                     value = "['" + "', '".join(value) + "']"
                 data_chunk += "\n" + subkey + " = " + value
@@ -1446,6 +1519,13 @@ class RustCompiledComponentsRecipe(PyProjectRecipe):
         "x86": "i686-linux-android",
     }
 
+    # rustc optimization levels of the optimization profiles
+    RUST_OPT_LEVELS = {
+        "speed": "3",
+        "size": "s",
+        "lto": "2",
+    }
+
     call_hostpython_via_targetpython = False
 
     def get_recipe_env(self, arch, **kwargs):
@@ -1473,6 +1553,12 @@ class RustCompiledComponentsRecipe(PyProjectRecipe):
         env["RUSTFLAGS"] = "-Clink-args=-L{} -L{}".format(
             self.ctx.get_libs_dir(arch.arch), join(realpython_dir, "android-build")
         )
+        if self.opt_profile in self.RUST_OPT_LEVELS:
+            env["RUSTFLAGS"] += " -Copt-level={}".format(
+                self.RUST_OPT_LEVELS[self.opt_profile])
+        if self.opt_profile == "lto":
+            # cargo passes -Cembed-bitcode=no, that -Clto can't be used with
+            env["CARGO_PROFILE_RELEASE_LTO"] = "thin"
 
         env["PYO3_CROSS_LIB_DIR"] = realpath(glob.glob(join(
             realpython_dir, "android-build", "build",
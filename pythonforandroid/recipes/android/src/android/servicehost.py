@@ -0,0 +1,255 @@
+'''
+Service host
+============
+
+With ``--service-host``, the services of the app share a single process and
+a single ``libpython``: the first one to start runs this module, and each
+service entrypoint then runs on its own thread, in its own subinterpreter
+(with its own GIL, python 3.14+), instead of paying for a process and a
+python runtime per service.
+
+The requests are read from the pipe ``P4A_SERVICE_HOST_FD``, one JSON object
+per line, written by ``PythonService.java``: to start a service (``name``,
+``entrypoint``, ``argument``), or to stop it (``"action": "stop"`` and
+``name``), when it is stopped with ``stopService()``.
+
+Python code can't be interrupted from the outside, so a hosted service is
+asked to stop, and it has to observe it: its entrypoint runs with the globals
+``__service_stop__``, set on a stop request (``is_set()``,
+``wait(timeout=None)``), ``__service_name__`` and ``__service_argument__``. A
+service started again while running (e.g. restarted after a stop) is asked to
+stop, and started with its new argument once it has ended.
+
+A subinterpreter only imports the extension modules that support it
+(multi-phase init), e.g. not the ``android`` module itself: a service that
+needs them has to run in its own process. Without subinterpreters (python
+older than 3.14), the services run on threads of the main interpreter, and
+share its environment: ``sys.argv`` and ``PYTHON_SERVICE_ARGUMENT`` are then
+left alone, each service gets its argument in ``__service_argument__``.
+'''
+
+import json
+import os
+import queue
+import sys
+import threading
+
+try:
+    from concurrent import interpreters
+except ImportError:  # python < 3.14
+    interpreters = None
+
+
+SERVICE_HOST_FD = 'P4A_SERVICE_HOST_FD'
+'''The environment variable holding the read end of the request pipe.'''
+
+APP_ZIP = 'libpyapp.so'
+'''The zip the app code is imported from in place, with ``--private-zip``.'''
+
+STOP_TIMEOUT = 10
+'''How long (in seconds) a running service started again has to end, after
+being asked to stop, before it is not restarted.'''
+
+# Runs a service entrypoint. This is source code, as it runs in a new
+# interpreter, which can't import this module (the android package needs
+# the android extension module).
+SERVICE_CODE = '''\
+import os
+import queue
+import sys
+
+
+class _StopRequest:
+    """Set when the service is asked to stop, from the queue stop."""
+
+    def __init__(self, stop):
+        self._stop = stop
+        self._set = False
+
+    def is_set(self):
+        if not self._set:
+            try:
+                self._stop.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                self._set = True
+        return self._set
+
+    def wait(self, timeout=None):
+        if not self._set:
+            try:
+                self._stop.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                self._set = True
+        return self._set
+
+
+def _run_service(name, entrypoint, argument, path, isolated, stop):
+    if isolated:
+        # a new interpreter starts with the sys.path of the configuration,
+        # and has its own sys.argv and os.environ
+        sys.path[:] = path
+        sys.argv = [entrypoint]
+        os.environ['PYTHON_NAME'] = name
+        os.environ['PYTHON_SERVICE_ARGUMENT'] = argument
+        try:
+            import androidembed
+        except ImportError:
+            pass
+        else:
+            # like the stdout of the main interpreter, see start.c
+            sys.stdout = sys.stderr = androidembed.LogWriter(
+                name, flush_interval=float(
+                    os.environ.get('P4A_LOG_FLUSH_INTERVAL_MS', 100)) / 1000,
+                rate=float(os.environ.get('P4A_LOG_RATE_LIMIT', 0)))
+    service_globals = {
+        '__service_name__': name,
+        '__service_argument__': argument,
+        '__service_stop__': _StopRequest(stop),
+    }
+
+    import runpy
+    if entrypoint.endswith('.py') and os.path.exists(entrypoint + 'c'):
+        entrypoint += 'c'
+    elif entrypoint.endswith('.pyc') and not os.path.exists(entrypoint):
+        entrypoint = entrypoint[:-1]
+    if os.path.exists(entrypoint):
+        runpy.run_path(entrypoint, service_globals, run_name='__main__')
+        return
+
+    # imported in place from the app zip (--private-zip)
+    import zipimport
+    directory, module = os.path.split(os.path.normpath(entrypoint))
+    module = module.rsplit('.', 1)[0]
+    for entry in path:
+        if not entry.endswith(%(app_zip)r):
+            continue
+        loader = zipimport.zipimporter(os.path.join(entry, directory))
+        namespace = dict(
+            service_globals, __name__='__main__', __loader__=loader,
+            __file__=loader.get_filename(module))
+        exec(loader.get_code(module), namespace)
+        return
+    raise FileNotFoundError('Service entrypoint not found: ' + entrypoint)
+''' % {'app_zip': APP_ZIP}
+
+
+def service_code(name, entrypoint, argument, path, isolated=True):
+    '''The code running the service ``name``, whose entrypoint is the file
+    ``entrypoint`` (relative to the app dir) with ``sys.path`` ``path``. It
+    runs with the queue of its stop requests as the global ``_stop``.'''
+    return SERVICE_CODE + (
+        '_run_service({!r}, {!r}, {!r}, {!r}, {!r}, _stop)\n'.format(
+            name, entrypoint, argument, list(path), isolated))
+
+
+class ServiceHost:
+    '''Runs each service it is asked to start on its own thread, in a new
+    subinterpreter if ``use_interpreters`` (the default when available).'''
+
+    def __init__(self, use_interpreters=None, stop_timeout=STOP_TIMEOUT):
+        if use_interpreters is None:
+            use_interpreters = interpreters is not None
+        self.use_interpreters = use_interpreters
+        self.stop_timeout = stop_timeout
+        self.threads = {}
+        self.stops = {}
+        self.errors = {}
+
+    def start(self, name, entrypoint, argument=''):
+        '''Start the service ``name``. If it is running, it is asked to stop,
+        and started again once it has ended.'''
+        previous = self.threads.get(name)
+        if previous is not None and previous.is_alive():
+            print('Service {} is already running, restarting it'.format(name))
+            self.stop(name)
+        else:
+            previous = None
+        stop = (interpreters.create_queue() if self.use_interpreters else
+                queue.Queue())
+        thread = threading.Thread(
+            target=self._run, args=(name, entrypoint, argument, stop, previous),
+            name='service_' + name, daemon=True)
+        self.threads[name] = thread
+        self.stops[name] = stop
+        thread.start()
+        return thread
+
+    def stop(self, name):
+        '''Ask the service ``name`` to stop, which sets its
+        ``__service_stop__``. Returns whether it was running.'''
+        thread = self.threads.get(name)
+        if thread is None or not thread.is_alive():
+            print('Service {} is not running'.format(name))
+            return False
+        print('Stopping service {}'.format(name))
+        self.stops[name].put(True)
+        return True
+
+    def _run(self, name, entrypoint, argument, stop, previous=None):
+        if previous is not None:
+            previous.join(self.stop_timeout)
+            if previous.is_alive():
+                self.errors[name] = TimeoutError(
+                    'Service {} still running'.format(name))
+                print('Service {} did not stop within {} s, not restarting '
+                      'it with the argument {!r}'.format(
+                          name, self.stop_timeout, argument))
+                return
+        code = service_code(name, entrypoint, argument, sys.path,
+                            isolated=self.use_interpreters)
+        try:
+            if self.use_interpreters:
+                interp = interpreters.create()
+                try:
+                    interp.prepare_main(_stop=stop)
+                    interp.exec(code)
+                finally:
+                    interp.close()
+            else:
+                exec(code, {'__name__': 'service_' + name, '_stop': stop})
+        except BaseException as e:
+            self.errors[name] = e
+            print('Service {} failed: {!r}'.format(name, e))
+        else:
+            print('Service {} ended'.format(name))
+
+    def serve(self, requests):
+        '''Start the services of ``requests``, an iterable of JSON lines,
+        until it is exhausted.'''
+        for line in requests:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                name = request['name']
+                if request.get('action', 'start') == 'stop':
+                    self.stop(name)
+                    continue
+                entrypoint = request['entrypoint']
+            except (ValueError, KeyError):
+                print('Invalid service host request: {!r}'.format(line))
+                continue
+            print('Starting service {} ({})'.format(name, entrypoint))
+            self.start(name, entrypoint, request.get('argument', ''))
+
+    def join(self, timeout=None):
+        for thread in list(self.threads.values()):
+            thread.join(timeout)
+
+
+def main():
+    host = ServiceHost()
+    print('Service host started, {}'.format(
+        'each service in a subinterpreter' if host.use_interpreters else
+        'subinterpreters not available, each service in a thread'))
+    with os.fdopen(int(os.environ[SERVICE_HOST_FD])) as requests:
+        host.serve(requests)
+    host.join()
+
+
+if __name__ == '__main__':
+    main()
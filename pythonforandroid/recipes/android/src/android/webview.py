@@ -0,0 +1,42 @@
+'''
+WebView
+=======
+
+With the webview bootstrap, the app page is loaded once the web server
+started by the app answers on ``--port``. Calling :func:`server_ready` once
+the server socket listens has it loaded right away, instead of on the next
+connection attempt::
+
+    from werkzeug.serving import make_server
+    from android.webview import server_ready
+
+    server = make_server('127.0.0.1', 5000, app)
+    server_ready()
+    server.serve_forever()
+'''
+
+import os
+
+
+READY_FD = 'P4A_WEBVIEW_READY_FD'
+'''The environment variable holding the write end of the readiness pipe.'''
+
+
+def server_ready():
+    '''
+    Tell the webview bootstrap that the web server listens. Returns whether
+    it was told, i.e. ``False`` when not running in the webview bootstrap or
+    when it was told already.
+    '''
+    fd = os.environ.pop(READY_FD, None)
+    if not fd:
+        return False
+    try:
+        fd = int(fd)
+        try:
+            os.write(fd, b'1')
+        finally:
+            os.close(fd)
+    except (ValueError, OSError):
+        return False
+    return True
@@ -1,17 +1,25 @@
 import sh
 import os
+import glob
+import hashlib
+import json
+import subprocess
 
+from functools import lru_cache
 from multiprocessing import cpu_count
 from pathlib import Path
-from os.path import join
+from os.path import exists, isdir, join, realpath
 
 from packaging.version import Version
-from pythonforandroid.logger import shprint
+from pythonforandroid.hostbench import benchmark_hostpython
+from pythonforandroid.logger import info, shprint, warning
 from pythonforandroid.recipe import Recipe
 from pythonforandroid.util import (
     BuildInterruptingException,
+    build_platform,
     current_directory,
     ensure_dir,
+    rmdir,
 )
 from pythonforandroid.prerequisites import OpenSSLPrerequisite
 
@@ -23,6 +31,57 @@ SETUP_DIST_NOT_FIND_MESSAGE = (
     'Could not find Setup.dist or Setup in Python build'
 )
 
+# Run on a system python with the modules to check as arguments, printing
+# its version, release level and the modules it can't import
+SYSTEM_PYTHON_CHECK = '''
+import json, sys
+missing = []
+for module in sys.argv[1:]:
+    try:
+        __import__(module)
+    except ImportError:
+        missing.append(module)
+print(json.dumps([sys.version_info[:3], sys.version_info.releaselevel,
+                  missing]))
+'''
+
+
+@lru_cache()
+def get_lib_dynload(python):
+    '''The directory of the stdlib extension modules of ``python``.'''
+    return subprocess.check_output(
+        [python, '-I', '-c',
+         'import sysconfig; print(sysconfig.get_config_var("DESTSHARED"))'],
+        universal_newlines=True).strip()
+
+
+def check_system_python(python, version, modules):
+    '''
+    Check whether the system ``python`` can replace the hostpython of
+    ``version``: it must have the same major.minor version, be a final
+    release (the bytecode of pre-releases can differ) and import
+    ``modules``. Returns its version (``None`` if it doesn't run) and why it
+    can't, or ``None`` if it can.
+    '''
+    try:
+        output = subprocess.check_output(
+            [python, '-I', '-c', SYSTEM_PYTHON_CHECK] + list(modules),
+            stderr=subprocess.DEVNULL, universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, 'it does not run'
+    python_version, release_level, missing = json.loads(output)
+    python_version = '.'.join(map(str, python_version))
+    wanted = Version(version)
+    if Version(python_version).release[:2] != wanted.release[:2]:
+        return python_version, 'it is not python {}.{}'.format(
+            wanted.major, wanted.minor)
+    if release_level != 'final':
+        return python_version, 'it is a {} release'.format(release_level)
+    if missing:
+        return python_version, 'it lacks the modules {}'.format(
+            ', '.join(missing))
+    return python_version, None
+
 
 class HostPython3Recipe(Recipe):
     '''
@@ -48,6 +107,26 @@ class HostPython3Recipe(Recipe):
 
     patches = ["fix_ensurepip.patch"]
 
+    system_python_unneeded_patches = ["fix_ensurepip.patch"]
+    '''The :attr:`patches` a system python can be reused without, since it
+    can't have them: ``fix_ensurepip.patch`` keeps ensurepip from seeing the
+    site-packages of the python, which the venv of a system python doesn't
+    see anyway. With other patches, a system python is never reused.'''
+
+    system_venv_subdir = 'system-venv'
+    '''The sub build directory of the venv of the system python reused
+    instead of compiling the hostpython, with ``--system-hostpython``.'''
+
+    system_python_modules = ['ssl', 'ctypes', 'venv', 'ensurepip']
+    '''The modules a system python must have to be reused as the hostpython:
+    pip needs ``ssl`` and many build backends ``ctypes``, and the venv and its
+    pip are made with ``venv`` and ``ensurepip``.'''
+
+    optimized_configure_args = ['--enable-optimizations', '--with-lto']
+    '''The configure args of the hostpython built with
+    ``--optimized-hostpython``: profile guided optimizations (PGO, trained on
+    the python test suite) and link time optimizations.'''
+
     @property
     def _exe_name(self):
         '''
@@ -74,17 +153,160 @@ class HostPython3Recipe(Recipe):
         return env
 
     def should_build(self, arch):
+        if self.uses_system_python and not self.ctx.system_hostpython:
+            info('Not reusing the system python of the hostpython venv '
+                 'without --system-hostpython')
+            rmdir(join(self.get_build_dir(), self.system_venv_subdir))
         if Path(self.python_exe).exists():
+            if self.ctx.system_hostpython and not self.uses_system_python:
+                info('Not reusing a system python as the hostpython {}: it '
+                     'is already compiled'.format(self.version))
             # no need to build, but we must set hostpython for our Context
             self.ctx.hostpython = self.python_exe
             return False
+        if self.ctx.system_hostpython and self.reuse_system_python():
+            self.ctx.hostpython = self.python_exe
+            return False
+        return True
+
+    @property
+    def uses_system_python(self):
+        '''Whether the hostpython is the venv of a system python.'''
+        return exists(join(
+            self.get_build_dir(), self.system_venv_subdir, 'pyvenv.cfg'))
+
+    def find_system_pythons(self):
+        '''The system pythons that may replace the hostpython: the
+        ``--system-hostpython`` one, or with ``auto`` the ``pythonX.Y`` and
+        ``pythonX`` of the ``PATH``.'''
+        if self.ctx.system_hostpython != 'auto':
+            return [self.ctx.system_hostpython]
+        version = Version(self.version)
+        names = ['python{}.{}'.format(version.major, version.minor),
+                 'python{}'.format(version.major)]
+        pythons = []
+        for name in names:
+            for path_dir in os.environ.get('PATH', '').split(os.pathsep):
+                python = join(path_dir, name)
+                if os.access(python, os.X_OK) and realpath(python) not in [
+                        realpath(other) for other in pythons]:
+                    pythons.append(python)
+        return pythons
+
+    def reuse_system_python(self):
+        '''
+        Make the hostpython a venv of a matching system python instead of
+        compiling it (``--system-hostpython``), preferring the pinned
+        :attr:`version`, and log why each system python was or wasn't
+        reused. Returns whether it was.
+        '''
+        patches = [patch[0] if isinstance(patch, (tuple, list)) else patch
+                   for patch in self.patches]
+        needed = [patch for patch in patches
+                  if patch not in self.system_python_unneeded_patches]
+        if needed:
+            info('Not reusing a system python as the hostpython {}: it '
+                 'lacks the patches {} of the recipe'.format(
+                     self.version, ', '.join(needed)))
+            return False
+        pythons = self.find_system_pythons()
+        if not pythons:
+            info('No system python{} in the PATH'.format(
+                Version(self.version).major))
+        matching = []
+        for python in pythons:
+            python_version, reason = check_system_python(
+                python, self.version, self.system_python_modules)
+            if reason is None:
+                matching.append((python_version != self.version,
+                                 len(matching), python, python_version))
+            info('System python {}{}: {}'.format(
+                python, '' if python_version is None else
+                ' ({})'.format(python_version),
+                'can replace the hostpython {}'.format(self.version)
+                if reason is None else
+                'can\'t replace the hostpython {}, {}'.format(
+                    self.version, reason)))
+        if not matching:
+            info('No system python can replace the hostpython {}, '
+                 'compiling it'.format(self.version))
+            return False
+        _, _, python, python_version = min(matching)
+
+        venv_dir = join(self.get_build_dir(), self.system_venv_subdir)
+        rmdir(venv_dir)
+        try:
+            shprint(sh.Command(python), '-m', 'venv', '--without-pip',
+                    venv_dir)
+            ensure_dir(self.site_root)
+            shprint(
+                sh.Command(self.python_exe), '-m', 'ensurepip', '--root',
+                self.site_root, '-U',
+                _env={'HOME': '/tmp', 'PATH': self.local_bin})
+        except sh.ErrorReturnCode:
+            warning('Could not make a venv of the system python {}, '
+                    'compiling the hostpython instead'.format(python))
+            rmdir(venv_dir)
+            return False
+        self.fix_pip_shebangs()
+        info('Reusing the system python {} ({}) as the hostpython {}, in a '
+             'venv, instead of compiling it{}'.format(
+                 python, python_version, self.version,
+                 ', without the patches {} of the recipe, which the venv '
+                 'does not need'.format(', '.join(patches))
+                 if patches else ''))
         return True
 
-    def get_build_container_dir(self, arch=None):
+    def get_build_container_dir(self, arch=None, optimized=None):
+        '''
+        .. note:: The hostpython built with ``--optimized-hostpython`` (or
+            ``optimized``) is slow to build and doesn't depend on the target
+            arch nor on the dist, so it is kept in the storage dir, out of the
+            build dir, to be reused by all the builds with the same version,
+            patches and frozen modules (see :meth:`get_optimized_build_key`).
+        '''
         choices = self.check_recipe_choices()
         dir_name = '-'.join([self.name] + choices)
+        if optimized is None:
+            optimized = self.ctx.optimized_hostpython
+        if optimized:
+            if self.ctx.freeze_startup_modules:
+                dir_name += '-frozen'
+            return join(self.ctx.storage_dir, 'hostpython_builds',
+                        '{}-{}-{}'.format(dir_name, self.version,
+                                          self.get_optimized_build_key()))
         return join(self.ctx.build_dir, 'other_builds', dir_name, 'desktop')
 
+    def get_optimized_build_key(self):
+        '''
+        A digest of what the optimized hostpython is built from besides its
+        version: the patches of the recipe, and, when the startup modules
+        are frozen, the ``--frozen-modules`` and the import trace the others
+        are selected from (``--stdlib-import-trace``, or the default one).
+        '''
+        digest = hashlib.sha256()
+        for patch in self.patches:
+            if isinstance(patch, (tuple, list)):
+                patch = patch[0]
+            digest.update(Path(self.get_recipe_dir(), patch).read_bytes())
+        if self.ctx.freeze_startup_modules:
+            digest.update('\n'.join(sorted(self.ctx.frozen_modules)).encode())
+            import_trace = self.ctx.stdlib_import_trace or Recipe.get_recipe(
+                'python3', self.ctx).startup_import_trace
+            if import_trace == 'host':
+                # captured on the hostpython itself
+                digest.update(b'host')
+            else:
+                digest.update(Path(import_trace).read_bytes())
+        return digest.hexdigest()[:12]
+
+    def clean_build(self, arch=None):
+        if self.ctx.optimized_hostpython:
+            # not in the build dir, so the base method doesn't find it
+            rmdir(self.get_build_container_dir())
+            return
+        super().clean_build(arch)
+
     def get_build_dir(self, arch=None):
         '''
         .. note:: Unlike other recipes, the hostpython build dir doesn't
@@ -93,10 +315,48 @@ class HostPython3Recipe(Recipe):
         return join(self.get_build_container_dir(), self.name)
 
     def get_path_to_python(self):
+        if self.uses_system_python:
+            return join(self.get_build_dir(), self.system_venv_subdir, 'bin')
         return join(self.get_build_dir(), self.build_subdir)
 
+    def get_build_lib_dir(self):
+        '''
+        The directory of the stdlib extension modules of the hostpython
+        (``BUILDLIB_PATH``): ``build/lib.*`` for the compiled one, the
+        ``lib-dynload`` of a reused system python.
+        '''
+        if self.uses_system_python:
+            return get_lib_dynload(self.python_exe)
+        version = Version(self.version)
+        return join(self.get_path_to_python(), 'build', 'lib.{}-{}.{}'.format(
+            build_platform, version.major, version.minor))
+
+    @property
+    def python_path(self):
+        '''
+        The ``PYTHONPATH`` pip and the host packages run with: the
+        :attr:`site_dir`, and the ``Modules`` and ``build/lib.*`` dirs of the
+        compiled hostpython, which a reused system python doesn't have.
+        '''
+        python_path = self.get_path_to_python()
+        build_dirs = [join(python_path, 'Modules')] + sorted(
+            glob.glob(join(python_path, 'build', 'lib*')))[:1]
+        return ':'.join(
+            [self.site_dir] + [dirn for dirn in build_dirs if isdir(dirn)])
+
+    @property
+    def site_prefix(self):
+        '''The prefix pip installs into, under :attr:`site_root`: the venv's
+        own for a system python.'''
+        if self.uses_system_python:
+            return join(self.get_build_dir(), self.system_venv_subdir)
+        return '/usr/local'
+
     @property
     def site_root(self):
+        if self.uses_system_python:
+            return join(
+                self.get_build_dir(), self.system_venv_subdir, 'root')
         return join(self.get_path_to_python(), "root")
 
     @property
@@ -105,14 +365,14 @@ class HostPython3Recipe(Recipe):
 
     @property
     def local_bin(self):
-        return join(self.site_root, "usr/local/bin/")
+        return join(self.site_root, self.site_prefix.lstrip('/'), "bin/")
 
     @property
     def site_dir(self):
         p_version = Version(self.version)
         return join(
-            self.site_root,
-            f"usr/local/lib/python{p_version.major}.{p_version.minor}/site-packages/"
+            self.site_root, self.site_prefix.lstrip('/'),
+            f"lib/python{p_version.major}.{p_version.minor}/site-packages/"
         )
 
     @property
@@ -155,7 +415,11 @@ class HostPython3Recipe(Recipe):
         build_configured = False
         with current_directory(build_dir):
             if not Path('config.status').exists():
-                shprint(sh.Command(join(recipe_build_dir, 'configure')), _env=env)
+                configure_args = []
+                if self.ctx.optimized_hostpython:
+                    configure_args = self.optimized_configure_args
+                shprint(sh.Command(join(recipe_build_dir, 'configure')),
+                        *configure_args, _env=env)
                 build_configured = True
 
         with current_directory(recipe_build_dir):
@@ -174,22 +438,20 @@ class HostPython3Recipe(Recipe):
                         SETUP_DIST_NOT_FIND_MESSAGE
                     )
 
-            shprint(sh.make, '-j', str(cpu_count()), '-C', build_dir, _env=env)
-
-            # make a copy of the python executable giving it the name we want,
-            # because we got different python's executable names depending on
-            # the fs being case-insensitive (Mac OS X, Cygwin...) or
-            # case-sensitive (linux)...so this way we will have an unique name
-            # for our hostpython, regarding the used fs
-            for exe_name in ['python.exe', 'python']:
-                exe = join(self.get_path_to_python(), exe_name)
-                if Path(exe).is_file():
-                    shprint(sh.cp, exe, self.python_exe)
-                    break
+            self.make_python(env, build_dir)
 
         ensure_dir(self.site_root)
         self.ctx.hostpython = self.python_exe
 
+        if self.ctx.freeze_startup_modules:
+            # the same modules as the target python, so that the startup
+            # time they save can be measured on the host. Frozen once built:
+            # the freeze script runs on the hostpython, as does the capture
+            # of --stdlib-import-trace=host
+            if Recipe.get_recipe('python3', self.ctx).freeze_startup_modules(
+                    recipe_build_dir, self.python_exe):
+                self.make_python(env, build_dir)
+
         if build_configured:
 
             shprint(
@@ -198,5 +460,55 @@ class HostPython3Recipe(Recipe):
             )
             self.fix_pip_shebangs()
 
+            if self.ctx.optimized_hostpython:
+                self.benchmark_optimized_build()
+
+    def make_python(self, env, build_dir):
+        '''Build the hostpython in ``build_dir``, and copy it to
+        :attr:`python_exe`.'''
+        shprint(sh.make, '-j', str(cpu_count()), '-C', build_dir, _env=env)
+
+        # make a copy of the python executable giving it the name we want,
+        # because we got different python's executable names depending on
+        # the fs being case-insensitive (Mac OS X, Cygwin...) or
+        # case-sensitive (linux)...so this way we will have an unique name
+        # for our hostpython, regarding the used fs
+        for exe_name in ['python.exe', 'python']:
+            exe = join(self.get_path_to_python(), exe_name)
+            if Path(exe).is_file():
+                shprint(sh.cp, exe, self.python_exe)
+                break
+
+    def benchmark_optimized_build(self):
+        '''
+        Log the time the optimized hostpython takes for the host steps of the
+        builds, and its speedup over the regular hostpython, if it was built
+        too. A benchmark failing is only logged: the build goes on.
+        '''
+        try:
+            optimized = benchmark_hostpython(self.python_exe)
+        except (OSError, subprocess.CalledProcessError) as e:
+            warning('Could not benchmark the optimized hostpython: {}'.format(e))
+            return
+        info('Optimized hostpython: {}'.format(optimized))
+        regular_exe = join(
+            self.get_build_container_dir(optimized=False), self.name,
+            self.build_subdir, self._exe_name)
+        if not Path(regular_exe).exists():
+            return
+        try:
+            regular = benchmark_hostpython(regular_exe)
+        except (OSError, subprocess.CalledProcessError) as e:
+            warning('Could not benchmark the regular hostpython: {}'.format(e))
+            return
+        speedup = optimized.speedup(regular)
+        info('Regular hostpython: {}'.format(regular))
+        info('The optimized hostpython is {:.2f}x as fast to compile the '
+             'stdlib{}'.format(
+                 speedup.compileall,
+                 '' if speedup.pip_resolve is None else
+                 ', {:.2f}x as fast to resolve with pip'.format(
+                     speedup.pip_resolve)))
+
 
 recipe = HostPython3Recipe()
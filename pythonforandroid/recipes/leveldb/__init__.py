@@ -29,6 +29,7 @@ class LevelDBRecipe(Recipe):
                         join(self.ctx.ndk_dir, 'build', 'cmake',
                              'android.toolchain.cmake')),
                     '-DCMAKE_BUILD_TYPE=Release',
+                    *self.get_cmake_opt_args(arch),
 
                     '-DBUILD_SHARED_LIBS=1',
 
@@ -34,6 +34,7 @@ class LibgeosRecipe(Recipe):
                              'android.toolchain.cmake')),
                     '-DCMAKE_INSTALL_PREFIX={}'.format(install_target),
                     '-DCMAKE_BUILD_TYPE=Release',
+                    *self.get_cmake_opt_args(arch),
 
                     '-DGEOS_ENABLE_TESTS=OFF',
 
@@ -31,6 +31,7 @@ class LibOpenBlasRecipe(Recipe):
                 "-DCMAKE_ANDROID_NDK=" + self.ctx.ndk_dir,
                 "-DCMAKE_ANDROID_API={api}".format(api=self.ctx.ndk_api),
                 "-DCMAKE_BUILD_TYPE=Release",
+                *self.get_cmake_opt_args(arch),
                 "-DBUILD_SHARED_LIBS=ON",
                 "-DC_LAPACK=ON",
                 "-DTARGET={target}".format(
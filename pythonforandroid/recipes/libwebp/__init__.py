@@ -37,6 +37,7 @@ class LibwebpRecipe(Recipe):
                     f'-DCMAKE_TOOLCHAIN_FILE={toolchain_file}',
                     f'-DCMAKE_INSTALL_PREFIX={install_dir}',
                     '-DCMAKE_BUILD_TYPE=Release',
+                    *self.get_cmake_opt_args(arch),
 
                     '-DBUILD_SHARED_LIBS=1',
 
@@ -1,13 +1,29 @@
 import glob
+import json
+import os
+import re
 import sh
 import subprocess
 
-from os import environ, utime
-from os.path import dirname, exists, join, isfile
+from multiprocessing import cpu_count
+from os.path import dirname, exists, getsize, join, isfile
 import shutil
 
 from packaging.version import Version
+from pythonforandroid.builtinmodules import (
+    DEFAULT_BUILTIN_MODULES, BuiltinModulesReport, extension_filens,
+    extensions_size, read_setup_modules, remove_module_objects,
+    select_builtin_modules, write_setup_local)
+from pythonforandroid.frozenmodules import (
+    find_freeze_script, freeze_modules, measure_frozen_startup,
+    select_frozen_modules)
 from pythonforandroid.logger import info, shprint, warning
+from pythonforandroid.nativelibs import read_symbols
+from pythonforandroid.pymodules import is_placeholder
+from pythonforandroid.pythonbundle import (
+    capture_import_trace, find_imports, module_name, prune_stdlib, read_import_order,
+    read_import_trace, shake_python_tree, write_prune_report,
+    write_zip_bundle)
 from pythonforandroid.recipe import Recipe, TargetPythonRecipe
 from pythonforandroid.util import (
     current_directory,
@@ -102,6 +118,8 @@ class Python3Recipe(TargetPythonRecipe):
         '--without-static-libpython',
         '--without-readline',
         '--without-ensurepip',
+        # configure can't run its check of the compiler when cross compiling
+        '--with-computed-gotos',
 
         # Android prefix
         '--prefix={prefix}',
@@ -126,6 +144,18 @@ class Python3Recipe(TargetPythonRecipe):
     recipe does).
     '''
 
+    configured_args_filen = 'p4a_configure_args.json'
+    '''Where the arguments python was configured with are kept in its build
+    dir, so that it is configured again when they change.'''
+
+    opt_profile_configure_args = {
+        'lto': ['--with-lto=thin'],
+    }
+    '''The configure arguments of the optimization profiles
+    (``--opt-profile``). With ``lto``, configure gives the LTO flags to the
+    build of python only, and not to the extension modules built with its
+    ``sysconfig``.'''
+
     MIN_NDK_API = 21
     '''Sets the minimal ndk api number needed to use the recipe.
 
@@ -152,6 +182,36 @@ class Python3Recipe(TargetPythonRecipe):
     ]
     '''The file extensions that we want to blacklist for our python bundle'''
 
+    stdlib_zip_compression = 'deflated'
+    '''How the stdlib.zip entries are compressed, ``'deflated'`` or
+    ``'stored'``, unless ``--stdlib-zip-compression`` is given. Stored
+    entries make the zip bigger, but zipimport doesn't have to inflate them
+    on every import at startup.'''
+
+    stdlib_zip_stored_patterns = []
+    '''Patterns (matched against the paths inside stdlib.zip) of the entries
+    that are stored uncompressed whatever :attr:`stdlib_zip_compression` is,
+    e.g. ``['encodings/*', 'io.pyc']`` for modules imported on every start.
+    Those of ``--stdlib-zip-stored`` are added to them.'''
+
+    stdlib_zip_import_order = None
+    '''A file listing, one per line, the stdlib modules in the order they are
+    imported at startup, unless ``--stdlib-zip-import-order`` is given. Those
+    modules are laid out first in stdlib.zip, so that the cold-start reads
+    are sequential. Without it, the order of the import trace is used, see
+    :meth:`get_stdlib_zip_import_order`.'''
+
+    startup_import_trace = join(dirname(__file__), 'startup_import_trace.txt')
+    '''The startup import trace (``python -X importtime``) of a minimal app,
+    which the stdlib modules frozen into libpython with
+    ``--freeze-startup-modules`` are chosen from when no
+    ``--stdlib-import-trace`` is given.'''
+
+    builtin_extension_modules = DEFAULT_BUILTIN_MODULES
+    '''The stdlib extension modules built into libpython with
+    ``--builtin-extension-modules``, besides the ``--builtin-modules``. They
+    are imported without extracting and loading their own ``.so``.'''
+
     site_packages_dir_blacklist = {
         '__pycache__',
         'tests'
@@ -241,6 +301,13 @@ class Python3Recipe(TargetPythonRecipe):
                 '-DANDROID'
             ]
         )
+        if self.link_profile == 'load':
+            # python already hides what is not its API
+            env['CFLAGS'] += ' ' + ' '.join(arch.load_cflags)
+        if self.opt_profile in self.opt_profile_configure_args:
+            env['LLVM_AR'] = self.ctx.ndk.llvm_ar
+        elif self.opt_profile in arch.opt_cflags:
+            env['CFLAGS'] += ' ' + ' '.join(arch.opt_cflags[self.opt_profile])
 
         env['LDFLAGS'] = env.get('LDFLAGS', '')
         if shutil.which('lld') is not None:
@@ -347,26 +414,56 @@ class Python3Recipe(TargetPythonRecipe):
             join(recipe_build_dir,
                  'config.guess'))().strip()
 
+        frozen_modules = []
+        if self.ctx.freeze_startup_modules:
+            frozen_modules = self.freeze_startup_modules(recipe_build_dir)
+
+        configure_args = ' '.join(
+            self.configure_args +
+            self.opt_profile_configure_args.get(
+                self.opt_profile, [])).format(
+                    android_host=env['HOSTARCH'],
+                    android_build=android_build,
+                    python_host_bin=join(self.get_recipe(
+                        'host' + self.name, self.ctx
+                    ).get_path_to_python(), "python3"),
+                    prefix=sys_prefix,
+                    exec_prefix=sys_exec_prefix).split(' ')
+
         with current_directory(build_dir):
-            if not exists('config.status'):
+            if self.needs_configure(configure_args):
                 shprint(
                     sh.Command(join(recipe_build_dir, 'configure')),
-                    *(' '.join(self.configure_args).format(
-                                    android_host=env['HOSTARCH'],
-                                    android_build=android_build,
-                                    python_host_bin=join(self.get_recipe(
-                                        'host' + self.name, self.ctx
-                                    ).get_path_to_python(), "python3"),
-                                    prefix=sys_prefix,
-                                    exec_prefix=sys_exec_prefix)).split(' '),
+                    *configure_args,
                     _env=env)
+                with open(self.configured_args_filen, 'w') as fileh:
+                    json.dump(configure_args, fileh)
+            self.check_computed_gotos('pyconfig.h')
+
+            builtin_lines = []
+            if self.ctx.builtin_extension_modules:
+                builtin_lines = self.select_builtin_modules()
+            if builtin_lines and self.ctx.builtin_modules_size_report:
+                modules = [line.split()[0] for line in builtin_lines]
+                # built as extensions first, for the size report
+                self.make_python(env, [])
+                libpython_size = getsize(self._libpython)
+                modules_size = sum(
+                    extensions_size(lib_dir, modules)
+                    for lib_dir in glob.glob(join('build', 'lib.*')))
+                self.make_python(env, builtin_lines)
+                info(str(BuiltinModulesReport(
+                    modules, libpython_size, getsize(self._libpython),
+                    modules_size)))
+            else:
+                self.make_python(env, builtin_lines)
+                if builtin_lines:
+                    info('{} extension modules built into libpython: '
+                         '{}'.format(len(builtin_lines), ', '.join(
+                             line.split()[0] for line in builtin_lines)))
+
+            self.check_built_computed_gotos(self._libpython)
 
-            shprint(
-                sh.make,
-                'all',
-                'INSTSONAME={lib_name}'.format(lib_name=self._libpython),
-                _env=env
-            )
             # rename executable
             if isfile("python"):
                 sh.cp('python', 'libpythonbin.so')
@@ -377,6 +474,154 @@ class Python3Recipe(TargetPythonRecipe):
             # better way, although this is probably acceptable
             sh.cp('pyconfig.h', join(recipe_build_dir, 'Include'))
 
+        if frozen_modules:
+            self.measure_frozen_startup(frozen_modules)
+
+    def needs_configure(self, configure_args):
+        '''
+        Whether python has to be configured, with ``configure_args``, in the
+        build dir: when it was never configured, or with other arguments
+        (e.g. in a build dir configured by an older version of this recipe,
+        before :attr:`configured_args_filen` was written). Runs in the build
+        dir.
+        '''
+        if not exists('config.status'):
+            return True
+        try:
+            with open(self.configured_args_filen) as fileh:
+                configured_args = json.load(fileh)
+        except (OSError, ValueError):
+            configured_args = None
+        if configured_args != configure_args:
+            info('python3 was configured with other arguments, configuring '
+                 'it again')
+            return True
+        return False
+
+    def check_computed_gotos(self, pyconfig_h):
+        '''
+        Check that the configured python dispatches its bytecode with
+        computed gotos (a jump table) rather than a switch, see
+        ``--with-computed-gotos`` in :attr:`configure_args`. Warns otherwise
+        (e.g. with a compiler that lacks them): python still works, its
+        interpreter loop is only slower.
+        '''
+        with open(pyconfig_h) as fileh:
+            pyconfig = fileh.read()
+        if (re.search(r'^#define USE_COMPUTED_GOTOS 0', pyconfig, re.M) or
+                not re.search(r'^#define (HAVE|USE)_COMPUTED_GOTOS 1',
+                              pyconfig, re.M)):
+            warning('python3 is configured without computed gotos, which '
+                    'makes its interpreter loop slower')
+            return False
+        info('python3 is configured with computed gotos')
+        return True
+
+    def check_built_computed_gotos(self, libpython):
+        '''
+        Check that the built ``libpython`` has the jump table of the
+        computed gotos of its interpreter loop (``opcode_targets``, only
+        built with them), since pyconfig.h doesn't tell whether the
+        compiler used them. Nothing is checked if the library has no
+        symbols left.
+        '''
+        symbols = read_symbols(libpython)
+        if not symbols:
+            return None
+        if not any('opcode_targets' in symbol for symbol in symbols):
+            warning('{} was built without computed gotos, which makes its '
+                    'interpreter loop slower'.format(libpython))
+            return False
+        info('{} is built with computed gotos'.format(libpython))
+        return True
+
+    def select_builtin_modules(self):
+        '''
+        The ``Modules/Setup.stdlib`` lines of the extension modules built
+        into libpython with ``--builtin-extension-modules``: those of
+        :attr:`builtin_extension_modules` and ``--builtin-modules`` the
+        configured build makes as extensions. Runs in the build dir.
+        '''
+        modules = list(self.builtin_extension_modules)
+        modules.extend(module for module in self.ctx.builtin_modules
+                       if module not in modules)
+        lines, missing = select_builtin_modules(
+            join('Modules', 'Setup.stdlib'), modules)
+        if missing:
+            warning('Not building into libpython the extension modules that '
+                    'python does not build as extensions: {}'.format(
+                        ', '.join(missing)))
+        return lines
+
+    def make_python(self, env, builtin_lines):
+        '''
+        Build python, with the extension modules of ``builtin_lines``
+        (``Modules/Setup`` lines) built into libpython. Runs in the build dir.
+        '''
+        setup_local = join('Modules', 'Setup.local')
+        previous = list(read_setup_modules(setup_local, 'static').values())
+        if (builtin_lines or previous) and write_setup_local(
+                setup_local, builtin_lines):
+            # their objects are compiled with other flags when built in
+            remove_module_objects('Modules', set(previous + builtin_lines))
+        shprint(
+            sh.make,
+            '-j', str(cpu_count()),
+            'all',
+            'INSTSONAME={lib_name}'.format(lib_name=self._libpython),
+            _env=env
+        )
+        # left over by a build making them extensions
+        modules = [line.split()[0] for line in builtin_lines]
+        for lib_dir in glob.glob(join('build', 'lib.*')):
+            for filen in extension_filens(lib_dir, modules):
+                os.remove(filen)
+
+    def freeze_startup_modules(self, source_dir, python=None):
+        '''
+        Freeze into the interpreter built from the CPython source
+        ``source_dir`` the pure python stdlib modules imported at startup
+        (according to ``--stdlib-import-trace``, or else to
+        :attr:`startup_import_trace`) and the ``--frozen-modules``, and return
+        the modules frozen in addition to the ones CPython freezes already.
+
+        The freeze script is run with ``python``, the hostpython by default:
+        it may need a python as recent as the one it is part of.
+        '''
+        if find_freeze_script(source_dir) is None:
+            warning('Freezing the startup modules needs python 3.11+, '
+                    'skipping it')
+            return []
+        if self.ctx.stdlib_import_trace:
+            imported = self.get_stdlib_import_trace()
+        else:
+            imported = read_import_trace(self.startup_import_trace)
+        modules = select_frozen_modules(
+            join(source_dir, 'Lib'), imported, extra=self.ctx.frozen_modules)
+        modules = freeze_modules(
+            source_dir, modules, python or self.ctx.hostpython)
+        info('Freezing {} startup modules into the interpreter: {}'.format(
+            len(modules), ', '.join(modules)))
+        return modules
+
+    def measure_frozen_startup(self, modules):
+        '''
+        Log the startup time gained by the frozen ``modules``, measured on the
+        hostpython, if it was built with the same modules frozen.
+        '''
+        hostpython = self.ctx.hostpython
+        check = ('import _imp, sys\n'
+                 'sys.exit(not all(map(_imp.is_frozen, sys.argv[1:])))')
+        if subprocess.call([hostpython, '-X', 'frozen_modules=on', '-c',
+                            check] + modules) != 0:
+            warning('The hostpython is not built with the same frozen '
+                    'modules, clean it to measure the startup time gained')
+            return
+        off, on = measure_frozen_startup(hostpython, modules)
+        info('Startup importing the frozen modules on the hostpython: '
+             '{:.1f} ms frozen, {:.1f} ms from the stdlib ({:+.1f} ms)'.format(
+                 on, off, on - off))
+
     def compile_python_files(self, dir):
         '''
         Compile the python files (recursively) for the python files inside
@@ -385,11 +630,117 @@ class Python3Recipe(TargetPythonRecipe):
         .. note:: python2 compiles the files into extension .pyo, but in
             python3, and as of Python 3.5, the .pyo filename extension is no
             longer used...uses .pyc (https://www.python.org/dev/peps/pep-0488)
+
+        With :attr:`~pythonforandroid.build.Context.unchecked_hash_pycs`, the
+        .pyc files are unchecked hash-based ones (PEP 552).
         '''
         args = [self.ctx.hostpython]
         args += ['-OO', '-m', 'compileall', '-b', '-f', dir]
+        if self.ctx.unchecked_hash_pycs:
+            args[-1:-1] = ['--invalidation-mode', 'unchecked-hash']
         subprocess.call(args)
 
+    def get_stdlib_import_trace(self):
+        """
+        Return the modules listed in the import trace the stdlib is pruned
+        with, capturing it first by running the app on the hostpython if
+        :attr:`~pythonforandroid.build.Context.stdlib_import_trace` is
+        ``'host'``.
+        """
+        if self.ctx.stdlib_import_trace != 'host':
+            info('Reading the import trace {}'.format(
+                self.ctx.stdlib_import_trace))
+            imported = read_import_trace(self.ctx.stdlib_import_trace)
+        else:
+            if not self.ctx.app_dir:
+                raise BuildInterruptingException(
+                    'Capturing the stdlib import trace on the host needs the '
+                    'app, please set --private')
+            entrypoint = join(self.ctx.app_dir, 'main.py')
+            info('Capturing the import trace of {}'.format(entrypoint))
+            imported = capture_import_trace(self.ctx.hostpython, entrypoint)
+        if not imported:
+            raise BuildInterruptingException(
+                'No import found in the stdlib import trace, was it '
+                'recorded with python -X importtime?')
+        info('{} modules imported in the trace'.format(len(imported)))
+        return imported
+
+    def get_stdlib_zip_import_order(self, imported=None):
+        '''
+        The stdlib modules laid out first in stdlib.zip, in that order: those
+        of ``--stdlib-zip-import-order`` or :attr:`stdlib_zip_import_order`,
+        or else the modules ``imported`` of ``--stdlib-import-trace``, or
+        else those of :attr:`startup_import_trace`.
+        '''
+        import_order = (self.ctx.stdlib_zip_import_order or
+                        self.stdlib_zip_import_order)
+        if import_order:
+            return read_import_order(import_order)
+        if imported is not None:
+            return imported
+        return read_import_trace(self.startup_import_trace)
+
+    def prune_stdlib_filens(self, arch, stdlib_filens, imported):
+        """
+        Drop the stdlib files not needed by the modules ``imported``, and
+        write in the dist the report of what was dropped as well as the
+        list of the modules kept, which can be edited and passed back with
+        ``--stdlib-keep``.
+        """
+        kept, dropped = prune_stdlib(
+            stdlib_filens, imported, keep=self.ctx.stdlib_keep)
+        dist_dir = self.ctx.bootstrap.dist_dir
+        report_fn = join(dist_dir, 'stdlib_prune_report_{}.txt'.format(
+            arch.arch))
+        dropped_size = write_prune_report(report_fn, '.', kept, dropped, [
+            'stdlib pruned with an import trace of {} modules'.format(
+                len(imported)),
+            'add a module to the keep-list (--stdlib-keep) if the app '
+            'imports it lazily'])
+        kept_modules = sorted({module_name(filen) for filen in kept} - {None})
+        with open(join(dist_dir, 'stdlib_keep_list.txt'), 'w') as fileh:
+            fileh.write('\n'.join(kept_modules) + '\n')
+        info('Pruned the stdlib: dropped {} of {} files ({:.1f} KiB), see {}'
+             .format(len(dropped), len(stdlib_filens),
+                     dropped_size / 1024, report_fn))
+        return kept
+
+    def shake_site_packages(self, arch, filens):
+        """
+        Drop the site-packages files that can't be reached from the app's
+        code (its ``main.py``, services and other modules) or from the
+        ``--site-packages-keep`` list, and write in the dist the report of
+        what was dropped for each package.
+        """
+        if not self.ctx.app_dir:
+            raise BuildInterruptingException(
+                'Tree shaking the site-packages needs the app, please set '
+                '--private')
+        seeds = set()
+        for app_filen in walk_valid_filens(self.ctx.app_dir, [], []):
+            if not app_filen.endswith('.py'):
+                continue
+            with open(app_filen, 'rb') as fileh:
+                source = fileh.read()
+            try:
+                seeds.update(find_imports(source, '__main__'))
+            except (SyntaxError, ValueError):
+                warning('Could not parse {}, its imports are ignored'.format(
+                    app_filen))
+        kept, dropped = shake_python_tree(
+            '.', filens, seeds, keep=self.ctx.site_packages_keep)
+        report_fn = join(self.ctx.bootstrap.dist_dir,
+                         'site_packages_report_{}.txt'.format(arch.arch))
+        dropped_size = write_prune_report(report_fn, '.', kept, dropped, [
+            'site-packages files unreachable from the app',
+            'add a module to the keep-list (--site-packages-keep) if the '
+            'app imports it dynamically'])
+        info('Tree shaken the site-packages: dropped {} of {} files '
+             '({:.1f} KiB), see {}'.format(
+                 len(dropped), len(filens), dropped_size / 1024, report_fn))
+        return kept
+
     def create_python_bundle(self, dirn, arch):
         """
         Create a packaged python bundle in the target directory, by
@@ -415,6 +766,12 @@ class Python3Recipe(TargetPythonRecipe):
         ensure_dir(modules_dir)
         module_filens = (glob.glob(join(modules_build_dir, '*.so')) +
                          glob.glob(join(modules_build_dir, '*' + c_ext)))
+        # those of the modules built into libpython are stale
+        builtin_filens = extension_filens(modules_build_dir, read_setup_modules(
+            join(self.get_build_dir(arch.arch), 'android-build', 'Modules',
+                 'Setup.local'), 'static'))
+        module_filens = [filen for filen in module_filens
+                         if filen not in builtin_filens]
         info("Copy {} files into the bundle".format(len(module_filens)))
         for filen in module_filens:
             info(" - copy {}".format(filen))
@@ -425,14 +782,20 @@ class Python3Recipe(TargetPythonRecipe):
         with current_directory(join(self.get_build_dir(arch.arch), 'Lib')):
             stdlib_filens = list(walk_valid_filens(
                 '.', self.stdlib_dir_blacklist, self.stdlib_filen_blacklist))
-            if 'SOURCE_DATE_EPOCH' in environ:
-                # for reproducible builds
-                stdlib_filens.sort()
-                timestamp = int(environ['SOURCE_DATE_EPOCH'])
-                for filen in stdlib_filens:
-                    utime(filen, (timestamp, timestamp))
+            imported = None
+            if self.ctx.stdlib_import_trace:
+                imported = self.get_stdlib_import_trace()
+                stdlib_filens = self.prune_stdlib_filens(
+                    arch, stdlib_filens, imported)
             info("Zip {} files into the bundle".format(len(stdlib_filens)))
-            shprint(sh.zip, '-X', stdlib_zip, *stdlib_filens)
+            report = write_zip_bundle(
+                stdlib_zip, '.', stdlib_filens,
+                compression=(self.ctx.stdlib_zip_compression or
+                             self.stdlib_zip_compression),
+                stored_patterns=(self.stdlib_zip_stored_patterns +
+                                 self.ctx.stdlib_zip_stored_patterns),
+                import_order=self.get_stdlib_zip_import_order(imported))
+        info(str(report))
 
         # copy the site-packages into place
         ensure_dir(join(dirn, 'site-packages'))
@@ -443,6 +806,10 @@ class Python3Recipe(TargetPythonRecipe):
                 '.', self.site_packages_dir_blacklist,
                 self.site_packages_filen_blacklist,
                 excluded_dir_exceptions=self.site_packages_excluded_dir_exceptions))
+            # with --biglink, the extension modules are in libpymodules.so
+            filens = [filen for filen in filens if not is_placeholder(filen)]
+            if self.ctx.site_packages_tree_shaking:
+                filens = self.shake_site_packages(arch, filens)
             info("Copy {} files into the site-packages".format(len(filens)))
             for filen in filens:
                 info(" - copy {}".format(filen))
@@ -0,0 +1,114 @@
+"""
+Helpers to read the startup phases an app logs on launch (the
+``P4A_STARTUP_TRACE`` logcat line written by start.c) and to compare the
+startup of several runs, see ``p4a startup_report``.
+"""
+
+from collections import namedtuple
+import json
+import re
+
+
+STARTUP_TRACE_RE = re.compile(r'P4A_STARTUP_TRACE (\{.*\})')
+'''Matches the startup trace in a logcat line, whatever the logcat format.'''
+
+ENTRYPOINT_PHASE = 'entrypoint'
+'''The phase marking the first line of the entrypoint.'''
+
+
+StartupPhase = namedtuple('StartupPhase', ['name', 'start_ms', 'duration_ms'])
+'''A startup phase, with its start relative to the first recorded one.'''
+
+
+def parse_startup_traces(lines):
+    '''Return the startup trace of each app launch logged in ``lines`` (an
+    iterable of logcat lines), as lists of :class:`StartupPhase`.'''
+    runs = []
+    for line in lines:
+        match = STARTUP_TRACE_RE.search(line)
+        if match is None:
+            continue
+        try:
+            phases = json.loads(match.group(1))['phases']
+        except (ValueError, KeyError):
+            # e.g. a line cut by logcat
+            continue
+        if not phases:
+            continue
+        origin = min(phase['start_ns'] for phase in phases)
+        runs.append([
+            StartupPhase(
+                phase['name'],
+                (phase['start_ns'] - origin) / 1e6,
+                (phase['end_ns'] - phase['start_ns']) / 1e6)
+            for phase in phases])
+    return runs
+
+
+def read_startup_traces(filen):
+    '''The startup traces of the saved logcat output ``filen``.'''
+    with open(filen, errors='replace') as fileh:
+        return parse_startup_traces(fileh)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def summarize_runs(runs):
+    '''Return the median duration of each phase over ``runs`` (by phase
+    name, in the order of the first run), with the median time to the
+    entrypoint as the ``total``.'''
+    durations = {}
+    for run in runs:
+        for phase in run:
+            durations.setdefault(phase.name, []).append(phase.duration_ms)
+    summary = {name: median(values) for name, values in durations.items()
+               if name != ENTRYPOINT_PHASE}
+    totals = [phase.start_ms for run in runs for phase in run
+              if phase.name == ENTRYPOINT_PHASE]
+    if totals:
+        summary['total'] = median(totals)
+    return summary
+
+
+def format_startup_report(traces):
+    '''
+    Format the per-phase breakdown of ``traces``, a list of ``(label, runs)``
+    with the startup traces of each saved logcat output. With several
+    traces, each one is compared with the first.
+    '''
+    lines = []
+    summaries = [(label, runs, summarize_runs(runs))
+                 for label, runs in traces]
+    names = []
+    for _, _, summary in summaries:
+        names.extend(name for name in summary
+                     if name not in names and name != 'total')
+    names.append('total')
+
+    header = '{:<24}'.format('phase (median ms)')
+    for index, (label, runs, _) in enumerate(summaries):
+        column = '{} ({} runs)'.format(label, len(runs))
+        header += ' {:>24}'.format(column[-24:])
+        if index:
+            header += ' {:>9}'.format('delta')
+    lines.append(header)
+    for name in names:
+        line = '{:<24}'.format(name)
+        base = summaries[0][2].get(name)
+        for index, (_, _, summary) in enumerate(summaries):
+            value = summary.get(name)
+            line += ' {:>24}'.format(
+                '-' if value is None else '{:.1f}'.format(value))
+            if index:
+                if value is None or base is None:
+                    line += ' {:>9}'.format('-')
+                else:
+                    line += ' {:>+9.1f}'.format(value - base)
+        lines.append(line)
+    return '\n'.join(lines)
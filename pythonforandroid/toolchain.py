@@ -33,13 +33,17 @@ from pythonforandroid.build import Context, build_recipes, project_has_setup_py
 from pythonforandroid.distribution import Distribution, pretty_log_dists
 from pythonforandroid.entrypoints import main
 from pythonforandroid.graph import get_recipe_order_and_bootstrap
+from pythonforandroid.linkprofile import LINK_PROFILES, OPT_PROFILES
 from pythonforandroid.logger import (logger, info, warning, setup_color,
                                      Out_Style, Out_Fore,
                                      info_notify, info_main, shprint)
 from pythonforandroid.pythonpackage import get_dep_names_of_package
+from pythonforandroid.pythonbundle import read_import_order
 from pythonforandroid.recipe import Recipe
 from pythonforandroid.recommendations import (
     RECOMMENDED_NDK_API, RECOMMENDED_TARGET_API, print_recommendations)
+from pythonforandroid.startuptrace import (
+    format_startup_report, read_startup_traces)
 from pythonforandroid.util import (
     current_directory,
     BuildInterruptingException,
@@ -192,6 +196,19 @@ class NoAbbrevParser(argparse.ArgumentParser):
         return []
 
 
+def read_module_lists(values):
+    """Return the module names of the ``values`` of an option like
+    ``--stdlib-keep``, each being either a comma separated list of modules
+    or a file listing one module per line."""
+    modules = []
+    for value in values:
+        if exists(value):
+            modules.extend(read_import_order(value))
+        else:
+            modules.extend(split_argument_list(value))
+    return modules
+
+
 class ToolchainCL:
 
     def __init__(self):
@@ -349,6 +366,136 @@ class ToolchainCL:
             description='Copy libraries instead of using biglink (Android 4.3+)'
         )
 
+        add_boolean_option(
+            generic_parser, ['biglink'],
+            default=False,
+            description=('Whether to link the extension modules of the '
+                         'Cython recipes into a single libpymodules.so, '
+                         'instead of a .so per module'))
+
+        generic_parser.add_argument(
+            '--link-profile', dest='link_profile', default='default',
+            choices=LINK_PROFILES,
+            help=('How the native code is compiled and linked: "load" packs '
+                  'the relocations, uses the GNU hash, hides the symbols of '
+                  'the extension modules and drops the unused and identical '
+                  'sections, for smaller libraries that load faster'))
+
+        generic_parser.add_argument(
+            '--opt-profile', dest='opt_profile', default='default',
+            choices=OPT_PROFILES,
+            help=('How the native code of all the recipes is optimized: '
+                  '"speed" (-O3), "size" (-Os) or "lto" (-O2 and ThinLTO), '
+                  'instead of the optimization level of each recipe'))
+
+        add_boolean_option(
+            generic_parser, ['optimized-hostpython'],
+            default=False,
+            description=('Whether to build the hostpython with profile guided '
+                         'and link time optimizations, which is slow but '
+                         'speeds up the host side of the builds. It is kept '
+                         'in the storage dir and shared by all the dists'))
+
+        generic_parser.add_argument(
+            '--system-hostpython', dest='system_hostpython', default=None,
+            help=('Reuse a system python, through a venv, instead of '
+                  'compiling the hostpython, if it has the same major.minor '
+                  'version and the ssl, ctypes and venv modules: its path, '
+                  'or "auto" to look for it in the PATH'))
+
+        generic_parser.add_argument(
+            '--stdlib-import-trace', dest='stdlib_import_trace', default=None,
+            help=('Prune the stdlib to the modules imported in this trace: a '
+                  'file with the output of python -X importtime (e.g. a '
+                  'device logcat), or "host" to capture it by running the '
+                  'main.py of --private on the hostpython'))
+
+        generic_parser.add_argument(
+            '--stdlib-keep', dest='stdlib_keep', action='append', default=[],
+            help=('Stdlib modules (comma separated, or a file listing one per '
+                  'line) kept with their submodules when pruning the stdlib '
+                  'with --stdlib-import-trace. Can be used multiple times'))
+
+        generic_parser.add_argument(
+            '--stdlib-zip-compression', dest='stdlib_zip_compression',
+            default=None, choices=['deflated', 'stored'],
+            help=('How the stdlib.zip entries are compressed: stored entries '
+                  'make the zip bigger, but are not inflated on every import '
+                  'at startup. Defaults to deflated'))
+
+        generic_parser.add_argument(
+            '--stdlib-zip-stored', dest='stdlib_zip_stored',
+            action='append', default=[],
+            help=('Patterns (comma separated) of the paths inside stdlib.zip '
+                  'of the entries stored uncompressed whatever '
+                  '--stdlib-zip-compression is, e.g. "encodings/*,io.pyc". '
+                  'Can be used multiple times'))
+
+        generic_parser.add_argument(
+            '--stdlib-zip-import-order', dest='stdlib_zip_import_order',
+            default=None,
+            help=('A file listing, one per line, the stdlib modules laid out '
+                  'first in stdlib.zip, in that order. Defaults to the order '
+                  'of --stdlib-import-trace, or else of a trace recorded with '
+                  'a minimal app'))
+
+        add_boolean_option(
+            generic_parser, ['site-packages-tree-shaking'],
+            default=False,
+            description=('Whether to drop the site-packages modules and data '
+                         'files that the app code can\'t import'))
+
+        generic_parser.add_argument(
+            '--site-packages-keep', dest='site_packages_keep',
+            action='append', default=[],
+            help=('Site-packages modules (comma separated, or a file listing '
+                  'one per line) kept with their submodules when tree shaking '
+                  'the site-packages. Can be used multiple times'))
+
+        add_boolean_option(
+            generic_parser, ['freeze-startup-modules'],
+            default=False,
+            description=('Whether to freeze the stdlib modules imported at '
+                         'startup into libpython (python 3.11+), chosen from '
+                         '--stdlib-import-trace or else a recorded trace'))
+
+        generic_parser.add_argument(
+            '--frozen-modules', dest='frozen_modules',
+            action='append', default=[],
+            help=('Stdlib modules (comma separated, or a file listing one per '
+                  'line) frozen into libpython with --freeze-startup-modules '
+                  'besides the startup ones. Can be used multiple times'))
+
+        add_boolean_option(
+            generic_parser, ['builtin-extension-modules'],
+            default=False,
+            description=('Whether to build the common stdlib extension '
+                         'modules into libpython (python 3.11+), instead of '
+                         'as separate .so files'))
+
+        generic_parser.add_argument(
+            '--builtin-modules', dest='builtin_modules',
+            action='append', default=[],
+            help=('Stdlib extension modules (comma separated, or a file '
+                  'listing one per line) built into libpython with '
+                  '--builtin-extension-modules besides the common ones. Can '
+                  'be used multiple times'))
+
+        add_boolean_option(
+            generic_parser, ['builtin-modules-size-report'],
+            default=False,
+            description=('Whether to log the size saved by '
+                         '--builtin-extension-modules, which builds python '
+                         'a second time to measure it'))
+
+        add_boolean_option(
+            generic_parser, ['unchecked-hash-pycs'],
+            default=False,
+            description=('Whether to compile the stdlib, the site-packages '
+                         'and the app to unchecked hash-based .pyc files '
+                         '(PEP 552), imported without checking their source '
+                         'and independent of the file mtimes'))
+
         self._read_configuration()
 
         subparsers = parser.add_subparsers(dest='subparser_name',
@@ -557,6 +704,16 @@ class ToolchainCL:
             subparsers,
             'logcat', help='Run logcat from the given SDK',
             parents=[generic_parser])
+        parser_startup_report = add_parser(
+            subparsers,
+            'startup_report', aliases=['startup-report'],
+            help=('Print the startup phases logged by the app in saved '
+                  'logcat outputs, comparing them if there are several'),
+            parents=[generic_parser])
+        parser_startup_report.add_argument(
+            'logcat_files', nargs='+',
+            help='Saved logcat outputs, e.g. of the app before and after a '
+            'change')
         add_parser(
             subparsers,
             'build_status', aliases=['build-status'],
@@ -576,6 +733,8 @@ class ToolchainCL:
             args.unknown_args += ["--release"]
         if getattr(args, "with_debug_symbols", False):
             args.unknown_args += ["--with-debug-symbols"]
+        if getattr(args, "unchecked_hash_pycs", False):
+            args.unknown_args += ["--unchecked-hash-pycs"]
         if getattr(args, "ignore_setup_py", False):
             args.use_setup_py = False
         if getattr(args, "activity_class_name", "org.kivy.android.PythonActivity") != 'org.kivy.android.PythonActivity':
@@ -668,6 +827,35 @@ class ToolchainCL:
 
         self.ctx.local_recipes = realpath(args.local_recipes)
         self.ctx.copy_libs = args.copy_libs
+        self.ctx.biglink = args.biglink
+        self.ctx.link_profile = args.link_profile
+        self.ctx.opt_profile = args.opt_profile
+        self.ctx.optimized_hostpython = args.optimized_hostpython
+        self.ctx.system_hostpython = args.system_hostpython
+        self.ctx.stdlib_import_trace = args.stdlib_import_trace
+        if args.stdlib_import_trace not in (None, 'host'):
+            self.ctx.stdlib_import_trace = realpath(args.stdlib_import_trace)
+        self.ctx.stdlib_keep = read_module_lists(args.stdlib_keep)
+        self.ctx.stdlib_zip_compression = args.stdlib_zip_compression
+        self.ctx.stdlib_zip_stored_patterns = [
+            pattern for value in args.stdlib_zip_stored
+            for pattern in split_argument_list(value)]
+        self.ctx.stdlib_zip_import_order = args.stdlib_zip_import_order
+        if args.stdlib_zip_import_order is not None:
+            self.ctx.stdlib_zip_import_order = realpath(
+                args.stdlib_zip_import_order)
+        self.ctx.site_packages_tree_shaking = args.site_packages_tree_shaking
+        self.ctx.site_packages_keep = read_module_lists(
+            args.site_packages_keep)
+        self.ctx.freeze_startup_modules = args.freeze_startup_modules
+        self.ctx.frozen_modules = read_module_lists(args.frozen_modules)
+        self.ctx.builtin_extension_modules = args.builtin_extension_modules
+        self.ctx.builtin_modules = read_module_lists(args.builtin_modules)
+        self.ctx.builtin_modules_size_report = (
+            args.builtin_modules_size_report)
+        self.ctx.unchecked_hash_pycs = args.unchecked_hash_pycs
+        if getattr(args, 'private', None):
+            self.ctx.app_dir = realpath(args.private)
 
         self.ctx.activity_class_name = args.activity_class_name
         self.ctx.service_class_name = args.service_class_name
@@ -1213,6 +1401,19 @@ class ToolchainCL:
     def recommendations(self, args):
         print_recommendations()
 
+    def startup_report(self, args):
+        """Print the per-phase breakdown of the app startups found in the
+        saved logcat outputs, see :mod:`pythonforandroid.startuptrace`."""
+        traces = []
+        for filen in args.logcat_files:
+            runs = read_startup_traces(filen)
+            if not runs:
+                raise BuildInterruptingException(
+                    'No startup trace found in {}, is the app built with '
+                    'this version of python-for-android?'.format(filen))
+            traces.append((basename(filen), runs))
+        print(format_startup_report(traces))
+
     def build_status(self, _args):
         """Print the status of the specified build. """
         print('{Style.BRIGHT}Bootstraps whose core components are probably '
@@ -46,7 +46,7 @@ def recursively_include(results, directory, patterns):
 
 recursively_include(package_data, 'pythonforandroid/recipes',
                     ['*.patch', 'Setup*', '*.pyx', '*.py', '*.c', '*.h',
-                     '*.mk', '*.jam', '*.diff', ])
+                     '*.mk', '*.jam', '*.diff', '*.txt', ])
 recursively_include(package_data, 'pythonforandroid/bootstraps',
                     [
                         '*.properties', '*.xml', '*.java', '*.tmpl', '*.txt',
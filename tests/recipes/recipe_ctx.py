@@ -1,5 +1,3 @@
-import os
-
 from pythonforandroid.bootstrap import Bootstrap
 from pythonforandroid.distribution import Distribution
 from pythonforandroid.recipe import Recipe
@@ -7,6 +5,8 @@ from pythonforandroid.build import Context
 from pythonforandroid.archs import ArchAarch_64
 from pythonforandroid.androidndk import AndroidNDK
 
+from tests.storage_dir import STORAGE_DIR
+
 
 class RecipeCtx:
     """
@@ -38,7 +38,7 @@ class RecipeCtx:
         self.ctx._sdk_dir = "/opt/android/android-sdk"
         self.ctx._ndk_dir = "/opt/android/android-ndk"
         self.ctx.ndk = AndroidNDK(self.ctx._ndk_dir)
-        self.ctx.setup_dirs(os.getcwd())
+        self.ctx.setup_dirs(STORAGE_DIR)
         self.ctx.bootstrap = Bootstrap().get_bootstrap("sdl2", self.ctx)
         self.ctx.bootstrap.distribution = Distribution.get_distribution(
             self.ctx, name="sdl2", recipes=self.recipes, archs=[self.TEST_ARCH],
@@ -1,11 +1,21 @@
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tempfile
 import unittest
 
+from contextlib import ExitStack
 from os.path import join
 from unittest import mock
 
 from pythonforandroid.recipes.hostpython3 import (
     HOSTPYTHON_VERSION_UNSET_MESSAGE, SETUP_DIST_NOT_FIND_MESSAGE,
+    check_system_python,
 )
+from pythonforandroid.recipe import Recipe
 from pythonforandroid.util import BuildInterruptingException
 from tests.recipes.recipe_lib_test import RecipeCtx
 
@@ -162,3 +172,246 @@ class TestHostPython3Recipe(RecipeCtx, unittest.TestCase):
         self.assertEqual(e.exception.args[0], SETUP_DIST_NOT_FIND_MESSAGE)
         mock_makedirs.assert_called()
         mock_chdir.assert_called()
+
+    @mock.patch("pythonforandroid.util.chdir")
+    @mock.patch("pythonforandroid.util.makedirs")
+    def test_build_arch_freeze_host_import_trace(
+            self, mock_makedirs, mock_chdir):
+        """
+        With ``--freeze-startup-modules --stdlib-import-trace=host``, the
+        modules are frozen once the hostpython is built: the import trace is
+        captured, and the freeze script run, on it.
+        """
+        python3 = Recipe.get_recipe("python3", self.recipe.ctx)
+        source_dir = self.recipe.get_build_dir(self.arch.arch)
+        mock_capture = mock.Mock(return_value=["os", "enum"])
+        mock_freeze = mock.Mock(
+            side_effect=lambda source_dir, modules, python: modules)
+        with ExitStack() as stack:
+            # the recipes are shared, with the context of their first test
+            for ctx in {id(ctx): ctx for ctx in (
+                    self.recipe.ctx, python3.ctx)}.values():
+                for name, value in (("freeze_startup_modules", True),
+                                    ("stdlib_import_trace", "host"),
+                                    ("app_dir", "/app"),
+                                    ("frozen_modules", []),
+                                    ("hostpython", None)):
+                    stack.enter_context(
+                        mock.patch.object(ctx, name, value, create=True))
+            # the recipe module is loaded from its file, patch its globals
+            stack.enter_context(mock.patch.dict(
+                python3.freeze_startup_modules.__globals__, {
+                    "find_freeze_script": mock.Mock(return_value=join(
+                        source_dir, "Tools/build/freeze_modules.py")),
+                    "freeze_modules": mock_freeze,
+                    "capture_import_trace": mock_capture,
+                }))
+            stack.enter_context(mock.patch(
+                "pythonforandroid.frozenmodules.exists", return_value=True))
+            mock_path_exists = stack.enter_context(mock.patch(
+                "pythonforandroid.recipes.hostpython3.Path.exists"))
+            mock_path_exists.side_effect = [
+                False,  # "config.status" not exists, so we trigger.configure
+                False,  # "Modules/Setup.dist" shouldn't exist (3.8+ case)
+                True,  # "Modules/Setup" exists, so we skip raise exception
+            ]
+            stack.enter_context(mock.patch(
+                "pythonforandroid.recipes.hostpython3.sh.Command"))
+            mock_make = stack.enter_context(mock.patch(
+                "pythonforandroid.recipes.hostpython3.sh.make"))
+            stack.enter_context(mock.patch(
+                "pythonforandroid.recipes.hostpython3.Path.is_file"))
+            stack.enter_context(mock.patch(
+                "pythonforandroid.recipes.hostpython3.sh.cp"))
+            self.recipe.build_arch(self.arch)
+
+        mock_capture.assert_called_once_with(
+            self.recipe.python_exe, join("/app", "main.py"))
+        mock_freeze.assert_called_once_with(
+            source_dir, ["os", "enum"], self.recipe.python_exe)
+        # built again with the frozen modules
+        self.assertEqual(mock_make.call_count, 2)
+
+    @mock.patch("pythonforandroid.util.chdir")
+    @mock.patch("pythonforandroid.util.makedirs")
+    def test_build_arch_optimized(self, mock_makedirs, mock_chdir):
+        # the recipe is shared, with the context of the first test
+        ctx = self.recipe.ctx
+        ctx.optimized_hostpython = True
+        self.addCleanup(setattr, ctx, "optimized_hostpython", False)
+        # built out of the build dir, to be shared by all the dists
+        build_dir = self.recipe.get_build_dir(self.arch.arch)
+        self.assertEqual(build_dir, join(
+            ctx.storage_dir, "hostpython_builds",
+            "hostpython3-{}-{}".format(
+                self.recipe.version, self.recipe.get_optimized_build_key()),
+            "hostpython3"))
+        self.assertNotEqual(
+            self.recipe.get_build_container_dir(optimized=False),
+            self.recipe.get_build_container_dir())
+        with mock.patch(
+            "pythonforandroid.util.exists", return_value=True
+        ), mock.patch("pythonforandroid.util.shutil.rmtree") as mock_rmtree:
+            self.recipe.clean_build()
+        mock_rmtree.assert_called_once_with(
+            self.recipe.get_build_container_dir(), False)
+
+        with mock.patch(
+            "pythonforandroid.recipes.hostpython3.Path.exists"
+        ) as mock_path_exists, mock.patch(
+            "pythonforandroid.recipes.hostpython3.sh.Command"
+        ) as mock_sh_command, mock.patch(
+            "pythonforandroid.recipes.hostpython3.sh.make"
+        ), mock.patch(
+            "pythonforandroid.recipes.hostpython3.Path.is_file"
+        ), mock.patch(
+            "pythonforandroid.recipes.hostpython3.sh.cp"
+        ), mock.patch.object(
+            self.recipe, "benchmark_optimized_build"
+        ) as mock_benchmark:
+            mock_path_exists.side_effect = [
+                False,  # "config.status" not exists, so we trigger.configure
+                False,  # "Modules/Setup.dist" shouldn't exist (3.8+ case)
+                True,  # "Modules/Setup" exists, so we skip raise exception
+            ]
+            self.recipe.build_arch(self.arch)
+
+        mock_sh_command.assert_any_call(join(build_dir, "configure"))
+        configure_args = mock_sh_command.return_value.call_args_list[0][0]
+        self.assertEqual(
+            configure_args, ("--enable-optimizations", "--with-lto"))
+        mock_benchmark.assert_called_once_with()
+
+    def test_optimized_build_key(self):
+        ctx = self.recipe.ctx
+        key = self.recipe.get_optimized_build_key()
+        self.assertEqual(key, self.recipe.get_optimized_build_key())
+        with mock.patch.object(ctx, "freeze_startup_modules", True):
+            frozen_key = self.recipe.get_optimized_build_key()
+            with mock.patch.object(ctx, "frozen_modules", ["json"]):
+                self.assertNotEqual(
+                    frozen_key, self.recipe.get_optimized_build_key())
+            with mock.patch.object(ctx, "stdlib_import_trace", "host"):
+                self.assertNotEqual(
+                    frozen_key, self.recipe.get_optimized_build_key())
+        self.assertNotEqual(key, frozen_key)
+        with mock.patch.object(self.recipe, "patches", []):
+            self.assertNotEqual(key, self.recipe.get_optimized_build_key())
+
+    def test_benchmark_optimized_build_failure(self):
+        # a failing benchmark is logged, without stopping the build
+        with mock.patch.dict(
+            self.recipe.benchmark_optimized_build.__globals__, {
+                "benchmark_hostpython": mock.Mock(
+                    side_effect=subprocess.CalledProcessError(1, "python")),
+                "warning": mock.Mock(),
+            }
+        ) as recipe_globals:
+            self.recipe.benchmark_optimized_build()
+            recipe_globals["warning"].assert_called_once()
+
+    def test_check_system_python(self):
+        version = "{}.{}.{}".format(*sys.version_info[:3])
+        self.assertEqual(
+            check_system_python(sys.executable, version, ["json"]),
+            (version, None))
+        self.assertEqual(
+            check_system_python(sys.executable, "2.7.18", ["json"]),
+            (version, "it is not python 2.7"))
+        self.assertEqual(
+            check_system_python(
+                sys.executable, version, ["json", "p4a_missing_module"]),
+            (version, "it lacks the modules p4a_missing_module"))
+        self.assertEqual(
+            check_system_python("/nonexistent/python3", version, []),
+            (None, "it does not run"))
+
+    @mock.patch("pythonforandroid.util.chdir")
+    def test_should_build_system_python(self, mock_chdir):
+        ctx = self.recipe.ctx
+        hostpython_version = self.recipe.version
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.addCleanup(setattr, ctx, "system_hostpython", None)
+        self.addCleanup(setattr, self.recipe, "_version", hostpython_version)
+        self.recipe._version = "{}.{}.0".format(*sys.version_info[:2])
+        ctx.system_hostpython = sys.executable
+
+        with mock.patch.object(
+            self.recipe, "get_build_dir", return_value=temp_dir
+        ), mock.patch.object(
+            self.recipe, "find_system_pythons", return_value=[
+                "/nonexistent/python3", sys.executable]
+        ):
+            if importlib.util.find_spec("ensurepip") is None:
+                self.skipTest("the python has no ensurepip")
+            self.assertFalse(self.recipe.should_build(self.arch))
+            self.assertTrue(self.recipe.uses_system_python)
+            venv_dir = join(temp_dir, "system-venv")
+            self.assertEqual(
+                self.recipe.python_exe, join(venv_dir, "bin", "python3"))
+            self.assertEqual(ctx.hostpython, self.recipe.python_exe)
+            self.assertTrue(self.recipe.site_dir.startswith(
+                join(venv_dir, "root", venv_dir.lstrip("/"), "lib")))
+            # pip runs on the venv python, from the site dir
+            output = subprocess.check_output(
+                [self.recipe._pip, "--version"], universal_newlines=True,
+                env=dict(os.environ, PYTHONPATH=self.recipe.site_dir))
+            self.assertIn(self.recipe.site_dir.rstrip("/"), output)
+            # none of the dirs of the compiled hostpython
+            self.assertEqual(self.recipe.python_path, self.recipe.site_dir)
+            self.assertEqual(
+                self.recipe.get_build_lib_dir(),
+                sysconfig.get_config_var("DESTSHARED"))
+
+            # dropped without --system-hostpython
+            ctx.system_hostpython = None
+            with mock.patch(
+                "pythonforandroid.recipes.hostpython3.Path.exists",
+                return_value=False
+            ):
+                self.assertTrue(self.recipe.should_build(self.arch))
+            self.assertFalse(self.recipe.uses_system_python)
+
+    def test_system_python_needs_patches(self):
+        ctx = self.recipe.ctx
+        self.addCleanup(setattr, ctx, "system_hostpython", None)
+        ctx.system_hostpython = sys.executable
+        with mock.patch.object(
+            self.recipe, "patches",
+            self.recipe.patches + [("fix_other.patch", lambda *args: True)]
+        ), mock.patch.object(
+            self.recipe, "find_system_pythons"
+        ) as mock_find_system_pythons:
+            self.assertFalse(self.recipe.reuse_system_python())
+        mock_find_system_pythons.assert_not_called()
+
+    def test_python_path(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        build_dir = join(temp_dir, "native-build")
+        os.makedirs(join(build_dir, "Modules"))
+        with mock.patch.object(
+            self.recipe, "get_build_dir", return_value=temp_dir
+        ):
+            # no empty entry for the missing build/lib.*
+            self.assertEqual(self.recipe.python_path, ":".join([
+                self.recipe.site_dir, join(build_dir, "Modules")]))
+            lib_dir = self.recipe.get_build_lib_dir()
+            os.makedirs(lib_dir)
+            self.assertEqual(self.recipe.python_path, ":".join([
+                self.recipe.site_dir, join(build_dir, "Modules"), lib_dir]))
+
+    def test_should_build_no_system_python(self):
+        ctx = self.recipe.ctx
+        self.addCleanup(setattr, ctx, "system_hostpython", None)
+        ctx.system_hostpython = "auto"
+        with mock.patch.object(
+            self.recipe, "find_system_pythons",
+            return_value=[sys.executable]
+        ), mock.patch(
+            "pythonforandroid.recipes.hostpython3.Path.exists",
+            return_value=False
+        ):
+            # a python of another version
+            self.assertTrue(self.recipe.should_build(self.arch))
@@ -1,3 +1,7 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 from os.path import join
@@ -6,8 +10,10 @@ from unittest import mock
 from pythonforandroid.recipes.python3 import (
     NDK_API_LOWER_THAN_SUPPORTED_MESSAGE,
 )
-from pythonforandroid.util import BuildInterruptingException, build_platform
+from pythonforandroid.util import (
+    BuildInterruptingException, build_platform, current_directory)
 from tests.recipes.recipe_lib_test import RecipeCtx
+from tests.test_nativelibs import make_elf
 
 
 class TestPython3Recipe(RecipeCtx, unittest.TestCase):
@@ -51,6 +57,17 @@ class TestPython3Recipe(RecipeCtx, unittest.TestCase):
             [hostpy, '-OO', '-m', 'compileall', '-b', '-f', fake_compile_dir],
         )
 
+    @mock.patch("pythonforandroid.recipes.python3.subprocess.call")
+    def test_compile_python_files_unchecked_hash(self, mock_subprocess):
+        fake_compile_dir = '/fake/compile/dir'
+        hostpy = self.recipe.ctx.hostpython = '/fake/hostpython3'
+        self.recipe.ctx.unchecked_hash_pycs = True
+        self.recipe.compile_python_files(fake_compile_dir)
+        mock_subprocess.assert_called_once_with(
+            [hostpy, '-OO', '-m', 'compileall', '-b', '-f',
+             '--invalidation-mode', 'unchecked-hash', fake_compile_dir],
+        )
+
     @mock.patch("pythonforandroid.recipe.Recipe.check_recipe_choices")
     @mock.patch("shutil.which")
     def test_get_recipe_env(
@@ -94,7 +111,9 @@ class TestPython3Recipe(RecipeCtx, unittest.TestCase):
         # specific `build_arch` mocks
         with mock.patch(
                 "builtins.open",
-                mock.mock_open(read_data="#define ZLIB_VERSION 1.1\nfoo")
+                mock.mock_open(read_data=(
+                    "#define ZLIB_VERSION 1.1\n#define HAVE_COMPUTED_GOTOS 1\n"
+                    "foo"))
         ) as mock_open_zlib, mock.patch(
             "pythonforandroid.recipes.python3.sh.Command"
         ) as mock_sh_command, mock.patch(
@@ -127,6 +146,189 @@ class TestPython3Recipe(RecipeCtx, unittest.TestCase):
         mock_makedirs.assert_called()
         mock_chdir.assert_called()
 
+    @mock.patch("pythonforandroid.util.chdir")
+    @mock.patch("pythonforandroid.util.makedirs")
+    @mock.patch("shutil.which")
+    def test_build_arch_builtin_modules(
+            self, mock_shutil_which, mock_makedirs, mock_chdir):
+        mock_shutil_which.return_value = self.expected_compiler
+        ctx = self.recipe.ctx
+        self.addCleanup(setattr, ctx, "builtin_extension_modules", False)
+        self.addCleanup(setattr, ctx, "builtin_modules_size_report", False)
+        ctx.builtin_extension_modules = True
+        builtin_lines = ["_json _json.c", "math mathmodule.c"]
+
+        for size_report, builds in ((False, [builtin_lines]),
+                                    (True, [[], builtin_lines])):
+            ctx.builtin_modules_size_report = size_report
+            with mock.patch(
+                    "builtins.open",
+                    mock.mock_open(read_data=(
+                        "#define ZLIB_VERSION 1.1\n"
+                        "#define HAVE_COMPUTED_GOTOS 1\n"))
+            ), mock.patch(
+                "pythonforandroid.recipes.python3.sh.Command"
+            ), mock.patch(
+                "pythonforandroid.recipes.python3.sh.cp"
+            ), mock.patch.dict(
+                # the recipe module is loaded from its file
+                self.recipe.build_arch.__globals__,
+                {"getsize": mock.Mock(return_value=1024)}
+            ), mock.patch.object(
+                self.recipe, "select_builtin_modules",
+                return_value=builtin_lines
+            ), mock.patch.object(
+                self.recipe, "make_python"
+            ) as mock_make_python:
+                self.recipe.build_arch(self.arch)
+            # python is only built a second time for the size report
+            self.assertEqual(
+                [call[0][1] for call in mock_make_python.call_args_list],
+                builds)
+
+    def test_freeze_startup_modules(self):
+        source_dir = self.recipe.get_build_dir(self.arch.arch)
+        self.recipe.ctx.frozen_modules = ["json.decoder"]
+        lib_files = {
+            join(source_dir, "Lib", filen)
+            for filen in ("os.py", "enum.py", "json/decoder.py")}
+        mock_freeze_modules = mock.Mock(
+            side_effect=lambda source_dir, modules, python: [
+                module for module in modules if module != "os"])
+        # the recipe module is loaded from its file, patch its globals
+        with mock.patch.dict(self.recipe.freeze_startup_modules.__globals__, {
+            "find_freeze_script": mock.Mock(return_value=join(
+                source_dir, "Tools/build/freeze_modules.py")),
+            "freeze_modules": mock_freeze_modules,
+        }), mock.patch(
+            "pythonforandroid.frozenmodules.exists",
+            side_effect=lib_files.__contains__,
+        ), mock.patch.object(
+            self.recipe.ctx, "hostpython", "/hostpython/python3"
+        ):
+            modules = self.recipe.freeze_startup_modules(source_dir)
+        self.assertEqual(modules, ["enum", "json.decoder"])
+        args, kwargs = mock_freeze_modules.call_args
+        self.assertEqual(args[0], source_dir)
+        self.assertEqual(args[1], ["os", "enum", "json.decoder"])
+        # run on the hostpython, recent enough for the freeze script
+        self.assertEqual(args[2], "/hostpython/python3")
+
+    def test_stdlib_zip_import_order(self):
+        ctx = self.recipe.ctx
+        # the startup of a minimal app by default
+        import_order = self.recipe.get_stdlib_zip_import_order()
+        self.assertIn("encodings", import_order)
+        self.assertEqual(
+            self.recipe.get_stdlib_zip_import_order(["os", "json"]),
+            ["os", "json"])
+
+        order_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, order_dir)
+        order_fn = join(order_dir, "import_order.txt")
+        with open(order_fn, "w") as fileh:
+            fileh.write("encodings\n# a comment\nio\n")
+        self.addCleanup(setattr, ctx, "stdlib_zip_import_order", None)
+        ctx.stdlib_zip_import_order = order_fn
+        self.assertEqual(
+            self.recipe.get_stdlib_zip_import_order(["os", "json"]),
+            ["encodings", "io"])
+
+    @mock.patch("pythonforandroid.recipes.python3.sh.make")
+    def test_make_python_builtin_modules(self, mock_make):
+        build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, build_dir)
+        files = ["Modules/Setup.local", "Modules/_json.o",
+                 "Modules/mathmodule.o", "Modules/arraymodule.o",
+                 "build/lib.android/_json.so", "build/lib.android/math.so"]
+        for filen in files:
+            os.makedirs(join(build_dir, os.path.dirname(filen)), exist_ok=True)
+            with open(join(build_dir, filen), "w") as fileh:
+                fileh.write("*static*\n_json _json.c\n")
+
+        with current_directory(build_dir):
+            self.recipe.make_python({}, ["math mathmodule.c"])
+        mock_make.assert_called_once()
+        # the objects of the modules switching are rebuilt
+        remaining = sorted(
+            join(dirpath, filen)[len(build_dir) + 1:]
+            for dirpath, _, filens in os.walk(build_dir) for filen in filens)
+        self.assertEqual(remaining, [
+            "Modules/Setup.local", "Modules/arraymodule.o",
+            "build/lib.android/_json.so"])
+        with open(join(build_dir, "Modules", "Setup.local")) as fileh:
+            self.assertIn("*static*\nmath mathmodule.c\n", fileh.read())
+        # built in parallel
+        self.assertEqual(mock_make.call_args[0][:3], ("-j", str(os.cpu_count()), "all"))
+
+    def test_check_computed_gotos(self):
+        build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, build_dir)
+        pyconfig_h = join(build_dir, "pyconfig.h")
+        for defines, enabled in (
+                ("#define HAVE_COMPUTED_GOTOS 1\n"
+                 "/* #undef USE_COMPUTED_GOTOS */\n", True),
+                ("#define HAVE_COMPUTED_GOTOS 1\n"
+                 "#define USE_COMPUTED_GOTOS 1\n", True),
+                ("/* #undef HAVE_COMPUTED_GOTOS */\n"
+                 "/* #undef USE_COMPUTED_GOTOS */\n", False),
+                ("#define HAVE_COMPUTED_GOTOS 1\n"
+                 "#define USE_COMPUTED_GOTOS 0\n", False)):
+            with open(pyconfig_h, "w") as fileh:
+                fileh.write(defines)
+            self.assertEqual(
+                self.recipe.check_computed_gotos(pyconfig_h), enabled)
+
+    def test_check_built_computed_gotos(self):
+        build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, build_dir)
+        libpython = join(build_dir, "libpython3.11.so")
+        for symbols, enabled in (
+                (["Py_Initialize", "_PyEval_EvalFrameDefault.opcode_targets"],
+                 True),
+                (["Py_Initialize"], False),
+                # stripped: can't tell
+                ([], None)):
+            make_elf(libpython, ["libc.so"], symbols=symbols)
+            self.assertEqual(
+                self.recipe.check_built_computed_gotos(libpython), enabled)
+
+    def test_needs_configure(self):
+        build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, build_dir)
+        args = ["--host=aarch64-linux-android", "--with-computed-gotos"]
+        with current_directory(build_dir):
+            self.assertTrue(self.recipe.needs_configure(args))
+            # configured before the arguments were recorded
+            open("config.status", "w").close()
+            self.assertTrue(self.recipe.needs_configure(args))
+            with open(self.recipe.configured_args_filen, "w") as fileh:
+                json.dump(args[:1], fileh)
+            self.assertTrue(self.recipe.needs_configure(args))
+            with open(self.recipe.configured_args_filen, "w") as fileh:
+                json.dump(args, fileh)
+            self.assertFalse(self.recipe.needs_configure(args))
+
+    @mock.patch("shutil.which")
+    @mock.patch("pythonforandroid.build.ensure_dir")
+    def test_lto_opt_profile(self, mock_ensure_dir, mock_shutil_which):
+        mock_shutil_which.return_value = self.expected_compiler
+        self.assertIn("--with-computed-gotos", self.recipe.configure_args)
+        self.recipe.ctx.opt_profile = "lto"
+        self.addCleanup(setattr, self.recipe.ctx, "opt_profile", "default")
+        env = self.recipe.get_recipe_env(self.arch)
+        # configure gives -flto to python only
+        self.assertNotIn("-flto", env["CFLAGS"])
+        self.assertEqual(env["LLVM_AR"], self.recipe.ctx.ndk.llvm_ar)
+        self.assertEqual(
+            self.recipe.opt_profile_configure_args[self.recipe.opt_profile],
+            ["--with-lto=thin"])
+
+        self.recipe.ctx.opt_profile = "speed"
+        env = self.recipe.get_recipe_env(self.arch)
+        self.assertIn("-O3", env["CFLAGS"])
+        self.assertNotIn("LLVM_AR", env)
+
     def test_build_arch_wrong_ndk_api(self):
         # we check ndk_api using recipe's ctx
         self.recipe.ctx.ndk_api = 20
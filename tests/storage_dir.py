@@ -0,0 +1,11 @@
+"""
+The storage dir of the contexts the tests set up: a temporary directory, so
+that they never write into the build dir of the repository, removed once
+they have run.
+"""
+import atexit
+import shutil
+import tempfile
+
+STORAGE_DIR = tempfile.mkdtemp(prefix='p4a-tests-')
+atexit.register(shutil.rmtree, STORAGE_DIR, ignore_errors=True)
@@ -0,0 +1,250 @@
+"""
+Tests the androidembed module of start.c (androidembed.h), built on the host
+with a stub log sink, writing the log entries to the file descriptor
+ANDROIDEMBED_STUB_LOG_FD, or nowhere.
+
+Run as a script, this benchmarks androidembed.LogWriter against the LogFile
+class start.c used before, that logged each line with androidembed.log().
+"""
+
+import importlib.util
+import io
+import os
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import time
+
+import pytest
+
+SRC_DIR = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "pythonforandroid", "bootstraps",
+    "common", "build", "jni", "application", "src"))
+
+STUB_SINK = r"""
+#define PY_SSIZE_T_CLEAN
+#include "Python.h"
+#include <stdio.h>
+
+#define ANDROID_LOG_INFO 4
+
+static int stub_log_fd = -2;
+
+static int stub_log_write(int prio, const char *tag, const char *text) {
+  if (stub_log_fd == -2) {
+    const char *fd = getenv("ANDROIDEMBED_STUB_LOG_FD");
+    stub_log_fd = fd != NULL ? atoi(fd) : -1;
+  }
+  if (stub_log_fd >= 0) {
+    dprintf(stub_log_fd, "%d\x1f%s\x1f%s%c", prio, tag ? tag : "", text, 0);
+  }
+  return 1;
+}
+
+#define P4A_LOG_SINK stub_log_write
+#include "androidembed.h"
+
+PyMODINIT_FUNC PyInit_androidembed(void) {
+  return initandroidembed();
+}
+"""
+
+
+class LogFile(io.IOBase):
+    """The stdout of start.c before androidembed.LogWriter."""
+
+    def __init__(self, androidembed):
+        self.androidembed = androidembed
+        self.__buffer = ''
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        s = self.__buffer + s
+        lines = s.split('\n')
+        for line in lines[:-1]:
+            self.androidembed.log(line.replace('\x00', ''))
+        self.__buffer = lines[-1]
+
+
+def build_androidembed(build_dir):
+    """Build androidembed with the stub sink in build_dir, and import it."""
+    include = sysconfig.get_paths()["include"]
+    compiler = (sysconfig.get_config_var("CC") or "cc").split()[0]
+    if (shutil.which(compiler) is None or
+            not os.path.exists(os.path.join(include, "Python.h"))):
+        return None
+    source = os.path.join(build_dir, "androidembed_host.c")
+    with open(source, "w") as fileh:
+        fileh.write(STUB_SINK)
+    module = os.path.join(
+        build_dir, "androidembed" + sysconfig.get_config_var("EXT_SUFFIX"))
+    subprocess.check_call([
+        compiler, "-shared", "-fPIC", "-O2", "-I" + include, "-I" + SRC_DIR,
+        source, "-o", module, "-lpthread"])
+    spec = importlib.util.spec_from_file_location("androidembed", module)
+    androidembed = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(androidembed)
+    return androidembed
+
+
+@pytest.fixture(scope="module")
+def androidembed():
+    build_dir = tempfile.mkdtemp()
+    try:
+        module = build_androidembed(build_dir)
+    finally:
+        shutil.rmtree(build_dir)
+    if module is None:
+        pytest.skip("needs a C compiler and the python headers")
+    return module
+
+
+@pytest.fixture(scope="module")
+def log_file():
+    # the stub sink reads ANDROIDEMBED_STUB_LOG_FD once
+    environ = dict(os.environ)
+    with tempfile.TemporaryFile() as fileh:
+        os.environ["ANDROIDEMBED_STUB_LOG_FD"] = str(fileh.fileno())
+        os.environ["PYTHON_NAME"] = "python"
+        yield fileh
+    os.environ.clear()
+    os.environ.update(environ)
+
+
+@pytest.fixture
+def log_entries(log_file):
+    """The entries logged by the stub sink, as (priority, tag, text)."""
+    def entries():
+        log_file.seek(0)
+        records = log_file.read().decode().split("\0")[:-1]
+        log_file.seek(0)
+        log_file.truncate()
+        return [tuple(int(field) if i == 0 else field
+                      for i, field in enumerate(record.split("\x1f")))
+                for record in records]
+
+    entries()
+    return entries
+
+
+def test_log(androidembed, log_entries):
+    androidembed.log("first")
+    androidembed.log("second", "tag")
+    assert log_entries() == [(4, "python", "first"), (4, "tag", "second")]
+
+
+def test_lines_are_coalesced(androidembed, log_entries):
+    writer = androidembed.LogWriter(flush_interval=60)
+    for i in range(3):
+        print("line", i, file=writer)
+    writer.write("partial")
+    assert log_entries() == []
+    writer.flush()
+    assert log_entries() == [(4, "python", "line 0\nline 1\nline 2")]
+    writer.close()
+    assert log_entries() == [(4, "python", "partial")]
+    assert writer.entries == 2
+    assert writer.closed
+    with pytest.raises(ValueError):
+        writer.write("closed")
+
+
+def test_flush_interval(androidembed, log_entries):
+    writer = androidembed.LogWriter("tag", flush_interval=0.01)
+    writer.write("first\nsecond\n")
+    deadline = time.time() + 5
+    while not writer.entries and time.time() < deadline:
+        time.sleep(0.01)
+    assert log_entries() == [(4, "tag", "first\nsecond")]
+    writer.close()
+
+
+def test_no_flush_interval(androidembed, log_entries):
+    writer = androidembed.LogWriter(flush_interval=0)
+    writer.write("first\nsec")
+    writer.write("ond\n\x00third")
+    assert log_entries() == [(4, "python", "first"), (4, "python", "second")]
+    writer.close()
+    assert log_entries() == [(4, "python", "third")]
+
+
+def test_buffer_size(androidembed, log_entries):
+    writer = androidembed.LogWriter(buffer_size=8, flush_interval=60)
+    writer.write("abc\ndefghijklm\n")
+    assert log_entries() == [(4, "python", "abc"), (4, "python", "defghijk")]
+    writer.close()
+    assert log_entries() == [(4, "python", "lm")]
+
+
+def test_long_lines_are_split(androidembed, log_entries):
+    writer = androidembed.LogWriter(buffer_size=20000, flush_interval=60)
+    lines = ["x" * 3000, "y" * 3000, "é" * 5000]
+    writer.write("\n".join(lines) + "\n")
+    writer.flush()
+    entries = [text for _, _, text in log_entries()]
+    assert all(len(text.encode()) <= 4000 for text in entries)
+    # split at the new lines, and else between characters
+    assert entries[:2] == lines[:2]
+    assert "".join(entries[2:]) == lines[2]
+    writer.close()
+
+
+def test_rate_limit(androidembed, log_entries):
+    writer = androidembed.LogWriter(flush_interval=60, rate=2)
+    writer.write("1\n2\n3\n4\n")
+    writer.flush()
+    assert log_entries() == [(4, "python", "1\n2")]
+    assert writer.dropped == 2
+    time.sleep(0.6)
+    writer.write("5\n")
+    writer.close()
+    assert log_entries() == [
+        (4, "python", "[2 lines dropped by the log rate limit]"),
+        (4, "python", "5")]
+
+
+def test_file_interface(androidembed):
+    writer = androidembed.LogWriter()
+    assert writer.writable() and not writer.readable()
+    assert not writer.isatty()
+    assert writer.encoding == "utf-8"
+    with pytest.raises(io.UnsupportedOperation):
+        writer.fileno()
+    with pytest.raises(TypeError):
+        writer.write(b"bytes")
+    writer.close()
+
+
+def benchmark(androidembed, lines=200000):
+    line = "some log line, as printed by a verbose library"
+    for name, writer in (("LogFile", LogFile(androidembed)),
+                         ("LogWriter", androidembed.LogWriter())):
+        start = time.perf_counter()
+        for _ in range(lines):
+            print(line, file=writer)
+        writer.flush()
+        elapsed = time.perf_counter() - start
+        print("{:10} {:.0f} ns per line{}".format(
+            name, elapsed * 1e9 / lines,
+            ", {} log entries".format(writer.entries)
+            if hasattr(writer, "entries") else ""))
+        writer.close()
+
+
+if __name__ == "__main__":
+    os.environ.pop("ANDROIDEMBED_STUB_LOG_FD", None)
+    build_dir = tempfile.mkdtemp()
+    try:
+        module = build_androidembed(build_dir)
+    finally:
+        shutil.rmtree(build_dir)
+    if module is None:
+        sys.exit("needs a C compiler and the python headers")
+    benchmark(module)
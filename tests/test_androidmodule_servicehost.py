@@ -0,0 +1,157 @@
+from unittest.mock import MagicMock
+import io
+import json
+import os
+import queue
+import sys
+import zipfile
+
+import time
+
+import pytest
+
+# Import the tested android.servicehost module, without android._android
+# (it is android-only / not compilable on desktop)
+android_module_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__),
+    "..", "pythonforandroid", "recipes", "android", "src"
+))
+sys.path.insert(0, android_module_folder)
+sys.modules['android._android'] = MagicMock()
+import android.servicehost as servicehost  # noqa: E402
+sys.path.remove(android_module_folder)
+
+
+SERVICE = '''\
+import os
+with open(os.path.join({out!r}, {name!r}), 'w') as fileh:
+    fileh.write(' '.join([__name__, __service_name__, __service_argument__]))
+'''
+
+# Runs until it is asked to stop
+STOPPABLE_SERVICE = '''\
+import os
+out = os.path.join({out!r}, __service_argument__)
+open(out + '.started', 'w').close()
+__service_stop__.wait()
+assert __service_stop__.is_set()
+open(out + '.stopped', 'w').close()
+'''
+
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # the services set sys.argv when they run in a subinterpreter
+    monkeypatch.setattr(sys, 'argv', list(sys.argv))
+    (tmp_path / 'out').mkdir()
+    (tmp_path / 'service').mkdir()
+    return tmp_path
+
+
+def write_service(app_dir, name, filen):
+    path = app_dir / filen
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(SERVICE.format(out=str(app_dir / 'out'), name=name))
+
+
+def requests(*services):
+    return io.StringIO(''.join(
+        json.dumps({'name': name, 'entrypoint': entrypoint,
+                    'argument': name + '-arg'}) + '\n'
+        for name, entrypoint in services))
+
+
+def wait_for(path, timeout=10):
+    for _ in range(int(timeout * 100)):
+        if path.exists():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_serve_threads(app_dir):
+    write_service(app_dir, 'worker', 'service/worker.py')
+    write_service(app_dir, 'pong', 'service/pong.py')
+    host = servicehost.ServiceHost(use_interpreters=False)
+    host.serve(requests(('worker', 'service/worker.py'),
+                        ('pong', 'service/pong.py')))
+    host.join(10)
+    assert host.errors == {}
+    # each its own argument, though they share the interpreter
+    assert (app_dir / 'out' / 'worker').read_text() == (
+        '__main__ worker worker-arg')
+    assert (app_dir / 'out' / 'pong').read_text() == '__main__ pong pong-arg'
+
+
+def test_stop_and_restart(app_dir):
+    (app_dir / 'service' / 'loop.py').write_text(
+        STOPPABLE_SERVICE.format(out=str(app_dir / 'out')))
+    out = app_dir / 'out'
+    host = servicehost.ServiceHost(use_interpreters=False)
+    host.start('loop', 'service/loop.py', 'first')
+    assert wait_for(out / 'first.started')
+
+    # started again: stopped, then started with its new argument
+    host.serve(io.StringIO(json.dumps({
+        'name': 'loop', 'entrypoint': 'service/loop.py',
+        'argument': 'second'}) + '\n'))
+    assert wait_for(out / 'second.started')
+    assert (out / 'first.stopped').exists()
+
+    host.serve(io.StringIO(json.dumps(
+        {'action': 'stop', 'name': 'loop'}) + '\n'))
+    host.join(10)
+    assert (out / 'second.stopped').exists()
+    assert not host.threads['loop'].is_alive()
+    assert host.errors == {}
+    assert not host.stop('loop')
+
+
+def test_restart_timeout(app_dir):
+    (app_dir / 'service' / 'deaf.py').write_text(
+        'import time\ntime.sleep(0.5)\n')
+    host = servicehost.ServiceHost(use_interpreters=False, stop_timeout=0.05)
+    host.start('deaf', 'service/deaf.py', 'first')
+    host.start('deaf', 'service/deaf.py', 'second')
+    host.join(10)
+    # the service didn't observe the stop request, it isn't restarted
+    assert isinstance(host.errors['deaf'], TimeoutError)
+
+
+def test_serve_invalid_request(app_dir):
+    host = servicehost.ServiceHost(use_interpreters=False)
+    host.serve(io.StringIO('not json\n\n{"entrypoint": "main.py"}\n'))
+    assert host.threads == {}
+
+
+def test_missing_entrypoint(app_dir):
+    host = servicehost.ServiceHost(use_interpreters=False)
+    host.start('missing', 'service/missing.py')
+    host.join(10)
+    assert isinstance(host.errors['missing'], FileNotFoundError)
+
+
+def test_entrypoint_from_app_zip(app_dir):
+    app_zip = str(app_dir / servicehost.APP_ZIP)
+    with zipfile.ZipFile(app_zip, 'w') as zf:
+        zf.writestr('service/zipped.py', SERVICE.format(
+            out=str(app_dir / 'out'), name='zipped'))
+    code = servicehost.service_code(
+        'zipped', 'service/zipped.py', 'arg', [app_zip], isolated=False)
+    exec(code, {'_stop': queue.Queue()})
+    assert (app_dir / 'out' / 'zipped').read_text() == (
+        '__main__ zipped arg')
+
+
+@pytest.mark.skipif(servicehost.interpreters is None,
+                    reason='needs subinterpreters (python 3.14+)')
+def test_serve_interpreters(app_dir):
+    write_service(app_dir, 'worker', 'service/worker.py')
+    host = servicehost.ServiceHost()
+    assert host.use_interpreters
+    host.serve(requests(('worker', 'service/worker.py')))
+    host.join(10)
+    assert host.errors == {}
+    assert (app_dir / 'out' / 'worker').read_text() == (
+        '__main__ worker worker-arg')
@@ -0,0 +1,39 @@
+from unittest.mock import MagicMock
+import os
+import sys
+
+# Import the tested android.webview module, without android._android
+# (it is android-only / not compilable on desktop)
+android_module_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__),
+    "..", "pythonforandroid", "recipes", "android", "src"
+))
+sys.path.insert(0, android_module_folder)
+sys.modules['android._android'] = MagicMock()
+import android.webview as webview  # noqa: E402
+sys.path.remove(android_module_folder)
+
+
+def test_server_ready(monkeypatch):
+    read_fd, write_fd = os.pipe()
+    monkeypatch.setenv(webview.READY_FD, str(write_fd))
+    try:
+        assert webview.server_ready()
+        assert os.read(read_fd, 1) == b'1'
+        # the write end is closed, the launcher sees the end of the pipe
+        assert os.read(read_fd, 1) == b''
+        # only the first call signals
+        assert webview.READY_FD not in os.environ
+        assert not webview.server_ready()
+    finally:
+        os.close(read_fd)
+
+
+def test_server_ready_without_pipe(monkeypatch):
+    monkeypatch.delenv(webview.READY_FD, raising=False)
+    assert not webview.server_ready()
+
+
+def test_server_ready_invalid_fd(monkeypatch):
+    monkeypatch.setenv(webview.READY_FD, 'invalid')
+    assert not webview.server_ready()
@@ -18,6 +18,8 @@ from pythonforandroid.archs import (
 )
 from pythonforandroid.androidndk import AndroidNDK
 
+from tests.storage_dir import STORAGE_DIR
+
 expected_env_gcc_keys = {
     "CFLAGS",
     "LDFLAGS",
@@ -54,7 +56,7 @@ class ArchSetUpBaseClass(object):
         self.ctx._sdk_dir = "/opt/android/android-sdk"
         self.ctx._ndk_dir = "/opt/android/android-ndk"
         self.ctx.ndk = AndroidNDK(self.ctx._ndk_dir)
-        self.ctx.setup_dirs(os.getcwd())
+        self.ctx.setup_dirs(STORAGE_DIR)
         self.ctx.bootstrap = Bootstrap().get_bootstrap("sdl2", self.ctx)
         self.ctx.bootstrap.distribution = Distribution.get_distribution(
             self.ctx,
@@ -363,3 +365,63 @@ class TestArchAArch64(ArchSetUpBaseClass, unittest.TestCase):
         # For x86_64 we expect to find an extra key in`environment`
         for flag in {"CFLAGS", "CXXFLAGS", "CC", "CXX"}:
             self.assertIn("-march=armv8-a", env[flag])
+
+    @mock.patch("shutil.which")
+    @mock.patch("pythonforandroid.build.ensure_dir")
+    def test_load_link_profile(self, mock_ensure_dir, mock_shutil_which):
+        """
+        Test that the flags of the load-optimized link profile are only given
+        with `--link-profile=load`, and pack the relocations the ndk api
+        supports.
+        """
+        mock_shutil_which.return_value = self.expected_compiler
+        arch = ArchAarch_64(self.ctx)
+        self.assertNotIn("-ffunction-sections", arch.get_env()["CFLAGS"])
+        self.assertNotIn("--gc-sections", arch.get_env()["LDFLAGS"])
+
+        self.ctx.link_profile = "load"
+        env = arch.get_env()
+        for flag in {"CFLAGS", "CXXFLAGS", "CC", "CXX"}:
+            self.assertIn("-ffunction-sections -fdata-sections", env[flag])
+        for flag in {"LDFLAGS", "LDSHARED"}:
+            self.assertIn(
+                "-Wl,--hash-style=gnu -Wl,--gc-sections -Wl,--icf=safe",
+                env[flag])
+        self.assertNotIn("--pack-dyn-relocs", env["LDFLAGS"])
+        self.assertNotIn(
+            "--gc-sections",
+            arch.get_env(link_profile="default")["LDFLAGS"])
+
+        for ndk_api, packing in (
+                (23, ["-Wl,--pack-dyn-relocs=android"]),
+                (28, ["-Wl,--pack-dyn-relocs=android+relr",
+                      "-Wl,--use-android-relr-tags"]),
+                (30, ["-Wl,--pack-dyn-relocs=android+relr"])):
+            self.ctx.ndk_api = ndk_api
+            self.assertEqual(
+                arch.get_load_ldflags(), arch.load_ldflags + packing)
+
+    @mock.patch("shutil.which")
+    @mock.patch("pythonforandroid.build.ensure_dir")
+    def test_opt_profile(self, mock_ensure_dir, mock_shutil_which):
+        """
+        Test that the flags of the optimization profile of `--opt-profile`
+        are in the compiler and linker flags.
+        """
+        mock_shutil_which.return_value = self.expected_compiler
+        arch = ArchAarch_64(self.ctx)
+        env = arch.get_env()
+        self.assertNotIn("-O3", env["CFLAGS"])
+        self.assertNotIn("-flto", env["LDFLAGS"])
+
+        self.ctx.opt_profile = "speed"
+        env = arch.get_env()
+        for flag in {"CFLAGS", "CXXFLAGS", "CC", "CXX"}:
+            self.assertIn("-O3", env[flag])
+        self.assertNotIn("-flto", env["LDFLAGS"])
+
+        env = arch.get_env(opt_profile="lto")
+        for flag in {"CFLAGS", "CXXFLAGS", "CC", "CXX"}:
+            self.assertIn("-O2 -flto=thin", env[flag])
+        for flag in {"LDFLAGS", "LDSHARED"}:
+            self.assertIn("-flto=thin", env[flag])
@@ -16,6 +16,7 @@ from pythonforandroid.util import BuildInterruptingException
 from pythonforandroid.androidndk import AndroidNDK
 
 from tests.test_graph import get_fake_recipe
+from tests.storage_dir import STORAGE_DIR
 
 
 class BaseClassSetupBootstrap:
@@ -35,7 +36,7 @@ class BaseClassSetupBootstrap:
         self.ctx._sdk_dir = "/opt/android/android-sdk"
         self.ctx._ndk_dir = "/opt/android/android-ndk"
         self.ctx.ndk = AndroidNDK(self.ctx._ndk_dir)
-        self.ctx.setup_dirs(os.getcwd())
+        self.ctx.setup_dirs(STORAGE_DIR)
         self.ctx.recipe_build_order = [
             "hostpython3",
             "python3",
@@ -358,6 +359,7 @@ class GenericBootstrapTest(BaseClassSetupBootstrap):
     @mock.patch("pythonforandroid.bootstraps.qt.open", create=True)
     @mock.patch("pythonforandroid.bootstrap.open", create=True)
     @mock.patch("pythonforandroid.distribution.open", create=True)
+    @mock.patch("pythonforandroid.bootstrap.Bootstrap.write_link_report")
     @mock.patch("pythonforandroid.bootstrap.Bootstrap.strip_libraries")
     @mock.patch("pythonforandroid.util.exists")
     @mock.patch("pythonforandroid.util.chdir")
@@ -372,6 +374,7 @@ class GenericBootstrapTest(BaseClassSetupBootstrap):
         mock_chdir,
         mock_ensure_dir,
         mock_strip_libraries,
+        mock_write_link_report,
         mock_open_dist_files,
         mock_open_bootstrap_files,
         mock_open_qt_files,
@@ -458,6 +461,7 @@ class GenericBootstrapTest(BaseClassSetupBootstrap):
         mock_chdir.assert_called()
         mock_listdir.assert_called()
         mock_strip_libraries.assert_called()
+        mock_write_link_report.assert_called_once_with(self.ctx.archs[0])
         expected__python_bundle = os.path.join(
             self.ctx.dist_dir,
             self.ctx.bootstrap.distribution.name,
@@ -1,9 +1,19 @@
+import hashlib
+import json
+import marshal
 import unittest
 from unittest import mock
 import pytest
 import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import zipfile
+import zipimport
 
 from pythonforandroid.util import load_source
+from tests.test_nativelibs import make_elf
 
 
 class TestBootstrapBuild(unittest.TestCase):
@@ -178,3 +188,393 @@ class TestOrientationArg(TestBootstrapBuild):
 
         assert "LandscapeLeft" in sdl_orientation_hint
         assert "Portrait" in sdl_orientation_hint
+
+
+class TestMakeTar(TestBootstrapBuild):
+    def setUp(self):
+        super().setUp()
+        self.buildpy.PYTHON = sys.executable
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.temp_dir, "app")
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        self.tfn = os.path.join(self.temp_dir, "private.tar")
+        os.makedirs(os.path.join(self.source_dir, "pkg"))
+        for name, content in (("main.py", "import pkg\n"),
+                              ("pkg/__init__.py", "VALUE = 1\n"),
+                              ("data.txt", "some data\n")):
+            with open(os.path.join(self.source_dir, name), "w") as fileh:
+                fileh.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_tar(self):
+        with mock.patch.object(
+            self.buildpy, "compile_py_file",
+            wraps=self.buildpy.compile_py_file
+        ) as m_compile, mock.patch.object(
+            self.buildpy, "GzipFile", wraps=self.buildpy.GzipFile
+        ) as m_gzip:
+            self.buildpy.make_tar(
+                self.tfn, [self.source_dir],
+                byte_compile_python=True, cache_dir=self.cache_dir)
+        with tarfile.open(self.tfn) as tf:
+            members = sorted(
+                m.name for m in tf.getmembers()
+                if m.isfile() and m.name != self.buildpy.PAYLOAD_MANIFEST)
+        return members, m_compile, m_gzip.called
+
+    def test_unchanged_payload_is_reused(self):
+        members, m_compile, rebuilt = self.make_tar()
+        assert members == ["data.txt", "main.pyc", "pkg/__init__.pyc"]
+        assert m_compile.call_count == 2
+        assert rebuilt
+
+        os.remove(self.tfn)
+        members, m_compile, rebuilt = self.make_tar()
+        assert members == ["data.txt", "main.pyc", "pkg/__init__.pyc"]
+        m_compile.assert_not_called()
+        assert not rebuilt
+
+    def test_changed_payload_only_recompiles_changed_files(self):
+        self.make_tar()
+        with open(os.path.join(self.source_dir, "main.py"), "a") as fileh:
+            fileh.write("print(pkg.VALUE)\n")
+
+        members, m_compile, rebuilt = self.make_tar()
+        assert members == ["data.txt", "main.pyc", "pkg/__init__.pyc"]
+        assert rebuilt
+        m_compile.assert_called_once_with(
+            os.path.join(os.path.realpath(self.source_dir), "main.py"),
+            optimize_python=True, unchecked_hash_pycs=False)
+
+    def read_code(self, name):
+        with tarfile.open(self.tfn) as tf:
+            data = tf.extractfile(name).read()
+        return marshal.loads(data[16:])
+
+    def test_identical_files_keep_their_path(self):
+        os.makedirs(os.path.join(self.source_dir, "other"))
+        for name in ("pkg/empty.py", "other/empty.py"):
+            open(os.path.join(self.source_dir, name), "w").close()
+
+        self.make_tar()
+        for name in ("pkg/empty", "other/empty"):
+            # as compiled from their own path, not from the other
+            code = self.read_code(name + ".pyc")
+            assert code.co_filename == os.path.join(
+                os.path.realpath(self.source_dir), name + ".py")
+
+    def test_unused_pycs_are_pruned(self):
+        self.make_tar()
+        pyc_dir = os.path.join(self.cache_dir, "pyc")
+        assert len(os.listdir(pyc_dir)) == 2
+        with open(os.path.join(self.source_dir, "main.py"), "a") as fileh:
+            fileh.write("print(pkg.VALUE)\n")
+        self.make_tar()
+        assert len(os.listdir(pyc_dir)) == 3
+
+        assert self.buildpy.prune_pyc_cache(self.cache_dir, [self.tfn]) == 1
+        assert len(os.listdir(pyc_dir)) == 2
+        # the pycs of a payload reused outright are kept
+        os.remove(self.tfn)
+        members, m_compile, rebuilt = self.make_tar()
+        assert not rebuilt
+        assert self.buildpy.prune_pyc_cache(self.cache_dir, [self.tfn]) == 0
+
+    def test_unchecked_hash_pycs(self):
+        pyc = self.buildpy.compile_py_file(
+            os.path.join(self.source_dir, "main.py"), unchecked_hash_pycs=True)
+        with open(pyc, "rb") as fileh:
+            data = fileh.read(8)
+        # hash-based, without checking the source (PEP 552)
+        assert int.from_bytes(data[4:8], "little") == 1
+
+    def test_payload_version_is_content_hash(self):
+        version = self.buildpy.make_tar(self.tfn, [self.source_dir])
+        with open(self.tfn, "rb") as fileh:
+            assert version == hashlib.sha256(fileh.read()).hexdigest()
+        os.utime(os.path.join(self.source_dir, "data.txt"), (1e9, 1e9))
+        assert self.buildpy.make_tar(self.tfn, [self.source_dir]) == version
+        with open(os.path.join(self.source_dir, "data.txt"), "w") as fileh:
+            fileh.write("other data\n")
+        assert self.buildpy.make_tar(self.tfn, [self.source_dir]) != version
+
+    def test_payload_starts_with_manifest(self):
+        self.buildpy.make_tar(self.tfn, [self.source_dir])
+        with tarfile.open(self.tfn) as tf:
+            first = tf.next()
+            assert first.name == self.buildpy.PAYLOAD_MANIFEST
+            lines = tf.extractfile(first).read().decode().splitlines()
+            hashes = dict(reversed(line.split(" ", 1)) for line in lines)
+            assert sorted(hashes) == ["data.txt", "main.py", "pkg/__init__.py"]
+            for name, digest in hashes.items():
+                content = tf.extractfile(tf.getmember(name)).read()
+                assert hashlib.sha256(content).hexdigest() == digest
+
+    def test_manifest_records_members(self):
+        self.make_tar()
+        manifest_fn, = [
+            os.path.join(self.cache_dir, fn)
+            for fn in os.listdir(self.cache_dir) if fn.endswith(".json")
+        ]
+        with open(manifest_fn) as fileh:
+            manifest = json.load(fileh)
+        size, mtime, digest = manifest["members"]["data.txt"]
+        assert size == len("some data\n")
+        assert digest == hashlib.sha256(b"some data\n").hexdigest()
+
+    def test_make_app_zip(self):
+        zfn = os.path.join(self.temp_dir, "libpyapp.so")
+        count = self.buildpy.make_app_zip(
+            zfn, [self.source_dir], byte_compile_python=True,
+            member_filter=lambda afn: afn != "data.txt")
+        assert count == 2
+        with zipfile.ZipFile(zfn) as zf:
+            assert sorted(zf.namelist()) == ["main.pyc", "pkg/__init__.pyc"]
+            for zinfo in zf.infolist():
+                assert zinfo.compress_type == zipfile.ZIP_STORED
+        # what each extra arch adds to a universal APK
+        assert 0 < self.buildpy.deflated_size(zfn) < os.path.getsize(zfn)
+
+        # what start.c runs when the entrypoint is only in the zip
+        importer = zipimport.zipimporter(zfn)
+        assert importer.get_filename("main") == os.path.join(zfn, "main.pyc")
+        namespace = {}
+        exec(importer.get_code("pkg"), namespace)
+        assert namespace["VALUE"] == 1
+
+
+class TestArchIndependentFiles(TestBootstrapBuild):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.bundle_dirs = []
+        for arch in ("arm64-v8a", "x86_64"):
+            bundle_dir = os.path.join(self.temp_dir, arch)
+            self.bundle_dirs.append(bundle_dir)
+            for name, content in (
+                    ("_python_bundle/stdlib.zip", "stdlib"),
+                    ("_python_bundle/site-packages/pkg/__init__.pyc", "pkg"),
+                    ("_python_bundle/site-packages/pkg/_ext.so", "ext"),
+                    ("_python_bundle/modules/_sysconfigdata.pyc", arch)):
+                fn = os.path.join(bundle_dir, name)
+                os.makedirs(os.path.dirname(fn), exist_ok=True)
+                with open(fn, "w") as fileh:
+                    fileh.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_find_arch_independent_files(self):
+        common = self.buildpy.find_arch_independent_files(self.bundle_dirs)
+        assert common == {
+            "_python_bundle/stdlib.zip",
+            "_python_bundle/site-packages/pkg/__init__.pyc",
+        }
+
+    def test_make_tar_member_filter(self):
+        common = self.buildpy.find_arch_independent_files(self.bundle_dirs)
+        tfn = os.path.join(self.temp_dir, "libpybundle.so")
+        self.buildpy.make_tar(
+            tfn, [self.bundle_dirs[0]],
+            member_filter=lambda afn: afn not in common)
+        with tarfile.open(tfn) as tf:
+            members = sorted(
+                m.name for m in tf.getmembers()
+                if m.isfile() and m.name != self.buildpy.PAYLOAD_MANIFEST)
+        assert members == [
+            "_python_bundle/modules/_sysconfigdata.pyc",
+            "_python_bundle/site-packages/pkg/_ext.so",
+        ]
+
+
+class TestPythonBundleZip(TestBootstrapBuild):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.bundle_dir = os.path.join(self.temp_dir, "_python_bundle__arm64")
+        python_bundle_dir = os.path.join(self.bundle_dir, "_python_bundle")
+        os.makedirs(os.path.join(python_bundle_dir, "modules"))
+        with zipfile.ZipFile(
+                os.path.join(python_bundle_dir, "stdlib.zip"), "w",
+                zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("os.pyc", "os")
+            zf.writestr("json/__init__.pyc", "json")
+        for name in ("modules/_ctypes.so",
+                     "site-packages/certifi/__init__.pyc",
+                     "site-packages/certifi/cacert.pem",
+                     "site-packages/kivy/__init__.pyc",
+                     "site-packages/kivy/_clock.so"):
+            fn = os.path.join(python_bundle_dir, name)
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+            with open(fn, "w") as fileh:
+                fileh.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_make_python_bundle_zip(self):
+        zfn = os.path.join(self.temp_dir, "libpylib.so")
+        replaced = self.buildpy.make_python_bundle_zip(zfn, self.bundle_dir)
+        assert replaced == {
+            "_python_bundle/stdlib.zip",
+            "_python_bundle/site-packages/certifi/__init__.pyc",
+            "_python_bundle/site-packages/certifi/cacert.pem",
+        }
+        with zipfile.ZipFile(zfn) as zf:
+            assert sorted(zf.namelist()) == [
+                "json/__init__.pyc",
+                "os.pyc",
+                "site-packages/certifi/__init__.pyc",
+                "site-packages/certifi/cacert.pem",
+            ]
+            for zinfo in zf.infolist():
+                assert zinfo.compress_type == zipfile.ZIP_STORED
+            assert zf.read("os.pyc") == b"os"
+
+        # the rest of the bundle is still extracted from libpybundle.so
+        tfn = os.path.join(self.temp_dir, "libpybundle.so")
+        self.buildpy.make_tar(
+            tfn, [self.bundle_dir], member_filter=lambda afn: afn not in replaced)
+        with tarfile.open(tfn) as tf:
+            members = sorted(
+                m.name for m in tf.getmembers()
+                if m.isfile() and m.name != self.buildpy.PAYLOAD_MANIFEST)
+        assert members == [
+            "_python_bundle/modules/_ctypes.so",
+            "_python_bundle/site-packages/kivy/__init__.pyc",
+            "_python_bundle/site-packages/kivy/_clock.so",
+        ]
+
+
+class TestLibraryLoadPlan(TestBootstrapBuild):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_make_library_load_plan(self):
+        for name, needed in (
+                ("libmain.so", ["libpython3.11.so", "libSDL2.so"]),
+                ("libpython3.11.so", ["libffi.so", "libc.so"]),
+                ("libffi.so", []),
+                ("libSDL2.so", []),
+                ("libssl1.1.so", ["libcrypto1.1.so"]),
+                ("libcrypto1.1.so", []),
+                ("libpythonbin.so", ["libpython3.11.so"])):
+            make_elf(os.path.join(self.temp_dir, name), needed)
+        # payloads shipped in the native libs dir
+        with open(os.path.join(self.temp_dir, "libpybundle.so"), "wb") as fh:
+            fh.write(b"\x1f\x8b")
+
+        assert self.buildpy.make_library_load_plan(self.temp_dir) == [
+            "ffi", "crypto1.1", "ssl1.1", "SDL2", "python3.11", "main"]
+
+
+class TestImportIndex(TestBootstrapBuild):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.bundle_dir = os.path.join(self.temp_dir, "_python_bundle__arm64")
+        self.python_bundle_dir = os.path.join(
+            self.bundle_dir, "_python_bundle")
+        os.makedirs(os.path.join(self.python_bundle_dir, "modules"))
+        with zipfile.ZipFile(
+                os.path.join(self.python_bundle_dir, "stdlib.zip"),
+                "w") as zf:
+            zf.writestr("p4a_os.py", "name = 'stdlib'")
+            zf.writestr("p4a_shadowed.py", "")
+            zf.writestr("p4a_json/__init__.py", "")
+            zf.writestr("p4a_json/decoder.py", "")
+        for name in ("modules/_p4a_ctypes.cpython-311.so",
+                     "site-packages/p4a_kivy/__init__.py",
+                     "site-packages/p4a_kivy/_clock.so",
+                     "site-packages/p4a_certifi/__init__.py",
+                     "site-packages/p4a_six.py",
+                     "site-packages/p4a_nspkg/sub/__init__.py",
+                     "site-packages/p4a_pkg-1.0.dist-info/METADATA"):
+            fn = os.path.join(self.python_bundle_dir, name)
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+            with open(fn, "w") as fileh:
+                fileh.write("name = {!r}".format(name))
+        self.app_dir = os.path.join(self.temp_dir, "app")
+        os.makedirs(os.path.join(self.app_dir, "p4a_nspkg"))
+        for name in ("main.py", "p4a_shadowed.py"):
+            with open(os.path.join(self.app_dir, name), "w") as fileh:
+                fileh.write("")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_index(self, ifn):
+        with open(ifn) as fileh:
+            return [line.split() for line in fileh]
+
+    def test_top_level_modules(self):
+        assert self.buildpy.top_level_modules([
+            "os.pyc", "json/__init__.pyc", "json/decoder.pyc",
+            "_ctypes.cpython-311-aarch64-linux-android.so", "ns/sub/a.py",
+            "pkg-1.0.dist-info/METADATA", "README.txt",
+        ]) == {
+            "os": False, "json": True, "_ctypes": False, "ns": None}
+
+    def test_make_import_index(self):
+        ifn = os.path.join(self.temp_dir, "p4a_import_index.txt")
+        count = self.buildpy.make_import_index(
+            ifn, self.bundle_dir, [self.app_dir])
+        assert self.read_index(ifn) == [
+            ["/_python_bundle/stdlib.zip", "p4a_json", "p4a_os"],
+            ["/_python_bundle/modules", "_p4a_ctypes"],
+            ["/_python_bundle/site-packages",
+             "p4a_certifi", "p4a_kivy", "p4a_six"],
+        ]
+        assert count == 6
+
+    def test_make_import_index_bundle_zip(self):
+        replaced = self.buildpy.make_python_bundle_zip(
+            os.path.join(self.temp_dir, "libpylib.so"), self.bundle_dir)
+        ifn = os.path.join(self.temp_dir, "p4a_import_index.txt")
+        self.buildpy.make_import_index(
+            ifn, self.bundle_dir, [self.app_dir], replaced)
+        assert self.read_index(ifn) == [
+            ["/libpylib.so", "p4a_json", "p4a_os"],
+            ["/_python_bundle/modules", "_p4a_ctypes"],
+            ["/_python_bundle/site-packages", "p4a_kivy"],
+            ["/libpylib.so/site-packages", "p4a_certifi", "p4a_six"],
+        ]
+
+    def test_finder(self):
+        finder_module = load_source("p4a_import_index", os.path.join(
+            os.path.dirname(self.buildpy.__file__),
+            self.buildpy.IMPORT_INDEX_FINDER))
+        ifn = os.path.join(self.temp_dir, "p4a_import_index.txt")
+        self.buildpy.make_import_index(ifn, self.bundle_dir, [self.app_dir])
+        path = [
+            self.app_dir,
+            os.path.join(self.python_bundle_dir, "stdlib.zip"),
+            os.path.join(self.python_bundle_dir, "modules"),
+            os.path.join(self.python_bundle_dir, "site-packages"),
+        ]
+        meta_path = [object(), finder_module.PathFinder]
+        finder = finder_module.install(ifn, meta_path, path)
+        assert meta_path[1] is finder
+
+        with mock.patch.object(sys, "path", list(path)):
+            spec = finder.find_spec("p4a_six")
+            assert spec.origin == os.path.join(
+                self.python_bundle_dir, "site-packages", "p4a_six.py")
+            spec = finder.find_spec("p4a_os")
+            assert spec.loader.archive == path[1]
+            # through sys.path
+            assert finder.find_spec("p4a_shadowed") is None
+            assert finder.find_spec("p4a_nspkg") is None
+            assert finder.find_spec("p4a_unknown") is None
+            # submodules, in the __path__ of their package
+            assert finder.find_spec("p4a_json.decoder", [path[1]]) is None
+
+        # the app put its own entry first
+        with mock.patch.object(sys, "path", ["other"] + path):
+            assert finder.find_spec("p4a_six") is None
@@ -9,6 +9,8 @@ from pythonforandroid.build import (
 )
 from pythonforandroid.archs import ArchARMv7_a, ArchAarch_64
 
+from tests.storage_dir import STORAGE_DIR
+
 
 class TestBuildBasic(unittest.TestCase):
 
@@ -123,7 +125,7 @@ class TestContext(unittest.TestCase):
     ):
         mock_get_available_apis.return_value = [RECOMMENDED_TARGET_API]
         context = Context()
-        context.setup_dirs(os.getcwd())
+        context.setup_dirs(STORAGE_DIR)
         context.prepare_build_environment(
             user_sdk_dir='sdk',
             user_ndk_dir='ndk',
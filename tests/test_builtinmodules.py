@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pythonforandroid import builtinmodules
+
+SETUP_STDLIB = """\
+# -*- makefile -*-
+# This file is autogenerated from Modules/Setup.stdlib.in.
+
+# Build modules statically or as shared extensions
+# *shared* / *static*
+*shared*
+
+array arraymodule.c
+_json _json.c
+_lsprof _lsprof.c rotatingtree.c
+math mathmodule.c
+_decimal _decimal/_decimal.c
+#_dbm _dbmmodule.c
+_ssl _ssl.c $(OPENSSL_INCLUDES) $(OPENSSL_LDFLAGS) \\
+    $(OPENSSL_LIBS)
+
+*static*
+_testimportmultiple _testimportmultiple.c
+
+*disabled*
+_tkinter
+"""
+
+
+class TestBuiltinModules(unittest.TestCase):
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.setup_stdlib = os.path.join(self.build_dir, "Setup.stdlib")
+        with open(self.setup_stdlib, "w") as fileh:
+            fileh.write(SETUP_STDLIB)
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def test_read_setup_modules(self):
+        shared = builtinmodules.read_setup_modules(self.setup_stdlib)
+        assert sorted(shared) == [
+            "_decimal", "_json", "_lsprof", "_ssl", "array", "math"]
+        assert shared["_ssl"].split() == [
+            "_ssl", "_ssl.c", "$(OPENSSL_INCLUDES)", "$(OPENSSL_LDFLAGS)",
+            "$(OPENSSL_LIBS)"]
+        assert list(builtinmodules.read_setup_modules(
+            self.setup_stdlib, "static")) == ["_testimportmultiple"]
+        assert builtinmodules.read_setup_modules(
+            os.path.join(self.build_dir, "missing")) == {}
+
+    def test_select_builtin_modules(self):
+        lines, missing = builtinmodules.select_builtin_modules(
+            self.setup_stdlib, ["math", "_dbm", "_json", "_testimportmultiple"])
+        assert lines == ["math mathmodule.c", "_json _json.c"]
+        assert missing == ["_dbm", "_testimportmultiple"]
+
+    def test_write_setup_local(self):
+        setup_local = os.path.join(self.build_dir, "Setup.local")
+        lines = ["math mathmodule.c", "_json _json.c"]
+        assert builtinmodules.write_setup_local(setup_local, lines)
+        assert not builtinmodules.write_setup_local(setup_local, lines)
+        static = builtinmodules.read_setup_modules(setup_local, "static")
+        assert list(static.values()) == lines
+        assert builtinmodules.write_setup_local(setup_local, [])
+        assert builtinmodules.read_setup_modules(setup_local, "static") == {}
+
+    def test_module_objects(self):
+        modules_dir = os.path.join(self.build_dir, "Modules")
+        assert builtinmodules.module_objects(
+            modules_dir, "_lsprof _lsprof.c rotatingtree.c") == [
+                os.path.join(modules_dir, "_lsprof.o"),
+                os.path.join(modules_dir, "rotatingtree.o")]
+        assert builtinmodules.module_objects(
+            modules_dir, "_decimal _decimal/_decimal.c $(LIBMPDEC_CFLAGS)") == [
+                os.path.join(modules_dir, "_decimal", "_decimal.o")]
+
+    def test_extension_filens(self):
+        for filen in ("_json.cpython-314-aarch64-linux-android.so",
+                      "_json_extra.cpython-314-aarch64-linux-android.so",
+                      "math.so", "math.pyc"):
+            with open(os.path.join(self.build_dir, filen), "wb") as fileh:
+                fileh.write(b"\0" * 10)
+        assert sorted(builtinmodules.extension_filens(
+            self.build_dir, ["_json", "math", "array"])) == [
+                os.path.join(self.build_dir,
+                             "_json.cpython-314-aarch64-linux-android.so"),
+                os.path.join(self.build_dir, "math.so")]
+        assert builtinmodules.extensions_size(
+            self.build_dir, ["_json", "math"]) == 20
+
+    def test_report(self):
+        report = builtinmodules.BuiltinModulesReport(
+            ["_json", "math"], 4096 * 1024, 4196 * 1024, 150 * 1024)
+        assert report.size_delta == -50 * 1024
+        assert str(report) == (
+            "2 extension modules built into libpython: libpython 4096.0 KiB "
+            "-> 4196.0 KiB, 2 fewer .so files (150.0 KiB), -50.0 KiB in total")
@@ -1,4 +1,3 @@
-import os
 import json
 import unittest
 from unittest import mock
@@ -9,6 +8,8 @@ from pythonforandroid.recipe import Recipe
 from pythonforandroid.util import BuildInterruptingException
 from pythonforandroid.build import Context
 
+from tests.storage_dir import STORAGE_DIR
+
 dist_info_data = {
     "dist_name": "sdl2_dist",
     "bootstrap": "sdl2",
@@ -37,7 +38,7 @@ class TestDistribution(unittest.TestCase):
         self.ctx.android_api = 27
         self.ctx._sdk_dir = "/opt/android/android-sdk"
         self.ctx._ndk_dir = "/opt/android/android-ndk"
-        self.ctx.setup_dirs(os.getcwd())
+        self.ctx.setup_dirs(STORAGE_DIR)
         self.ctx.recipe_build_order = [
             "hostpython3",
             "python3",
@@ -251,6 +252,31 @@ class TestDistribution(unittest.TestCase):
             "_distributions is not yet implemented",
         )
 
+    @mock.patch("pythonforandroid.distribution.Distribution.get_distributions")
+    def test_get_distribution_profile_mismatch(self, mock_get_dists):
+        """Test that method
+        :meth:`~pythonforandroid.distribution.Distribution.get_distribution`
+        doesn't reuse a dist built with other link or optimization
+        profiles.
+        """
+        built_dist = Distribution.get_distribution(
+            self.ctx,
+            name="test_prj",
+            recipes=["python3", "kivy"],
+            archs=[self.TEST_ARCH],
+        )
+        mock_get_dists.return_value = [built_dist]
+        kwargs = dict(name="test_prj", recipes=["python3", "kivy"],
+                      archs=[self.TEST_ARCH])
+        self.assertIs(
+            Distribution.get_distribution(self.ctx, **kwargs), built_dist)
+
+        with mock.patch.object(self.ctx, "opt_profile", "lto"):
+            dist = Distribution.get_distribution(self.ctx, **kwargs)
+        self.assertIsNot(dist, built_dist)
+        self.assertTrue(dist.needs_build)
+        self.assertEqual(dist.opt_profile, "lto")
+
     @mock.patch("pythonforandroid.distribution.Distribution.get_distributions")
     def test_get_distributions_possible_dists(self, mock_get_dists):
         """Test that method
@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from pythonforandroid import frozenmodules
+
+FREEZE_SCRIPT = """\
+import os
+
+TESTS_SECTION = 'Test module'
+FROZEN = [
+    # See parse_frozen_spec() for the format.
+    ('import system', [
+        'importlib._bootstrap : _frozen_importlib',
+        'zipimport',
+        ]),
+    ('stdlib - startup, without site (python -S)', [
+        'abc',
+        #'<encodings.*>',
+        'io',
+        ]),
+    (TESTS_SECTION, [
+        '__hello__',
+        '<__phello__.**.*>',
+        ]),
+]
+
+if __name__ == '__main__':
+    with open('regenerated', 'w') as fileh:
+        fileh.write(os.getcwd())
+"""
+
+
+class TestFrozenModules(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.script = os.path.join(
+            self.source_dir, "Tools", "build", "freeze_modules.py")
+        os.makedirs(os.path.dirname(self.script))
+        with open(self.script, "w") as fileh:
+            fileh.write(FREEZE_SCRIPT)
+        for filen in ("Lib/os.py", "Lib/abc.py", "Lib/json/__init__.py",
+                      "Lib/json/decoder.py", "Lib/re/_parser.py"):
+            filen = os.path.join(self.source_dir, filen)
+            os.makedirs(os.path.dirname(filen), exist_ok=True)
+            open(filen, "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def test_find_freeze_script(self):
+        assert frozenmodules.find_freeze_script(
+            self.source_dir) == self.script
+        os.remove(self.script)
+        assert frozenmodules.find_freeze_script(self.source_dir) is None
+
+    def test_add_frozen_modules(self):
+        frozenmodules.add_frozen_modules(self.script, ["os", "json.decoder"])
+        frozenmodules.add_frozen_modules(self.script, ["re._parser"])
+        with open(self.script) as fileh:
+            source = fileh.read()
+        assert source.count(frozenmodules.FROZEN_SECTION) == 1
+        assert frozenmodules.read_frozen_modules(self.script) == {
+            "importlib._bootstrap", "zipimport", "abc", "io", "__hello__",
+            "__phello__.**", "re._parser"}
+
+        frozenmodules.add_frozen_modules(self.script, [])
+        with open(self.script) as fileh:
+            assert fileh.read() == FREEZE_SCRIPT
+
+    def test_select_frozen_modules(self):
+        lib_dir = os.path.join(self.source_dir, "Lib")
+        imported = ["_io", "abc", "os", "json", "json.decoder", "six", "os"]
+        assert frozenmodules.select_frozen_modules(
+            lib_dir, imported, extra=["re._parser"], frozen={"abc"}) == [
+                "os", "json.decoder", "re._parser"]
+
+    def test_freeze_modules(self):
+        modules = frozenmodules.freeze_modules(
+            self.source_dir, ["abc", "os", "json.decoder"], sys.executable)
+        assert modules == ["os", "json.decoder"]
+        assert {"os", "json.decoder"} <= frozenmodules.read_frozen_modules(
+            self.script)
+        with open(os.path.join(self.source_dir, "regenerated")) as fileh:
+            assert fileh.read() == self.source_dir
+
+        os.remove(self.script)
+        with self.assertRaises(ValueError):
+            frozenmodules.freeze_modules(self.source_dir, ["os"], sys.executable)
+
+    def test_measure_frozen_startup(self):
+        off, on = frozenmodules.measure_frozen_startup(
+            sys.executable, ["os", "json"], runs=1)
+        assert off > 0 and on > 0
@@ -0,0 +1,46 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from pythonforandroid import hostbench
+from pythonforandroid.hostbench import HostBenchmark
+
+
+class TestHostBench(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_speedup(self):
+        regular = HostBenchmark("regular", 10.0, 4.0)
+        optimized = HostBenchmark("optimized", 8.0, 2.0)
+        assert optimized.speedup(regular) == HostBenchmark(
+            "optimized", 1.25, 2.0)
+        assert HostBenchmark("other", 5.0, None).speedup(regular) == (
+            HostBenchmark("other", 2.0, None))
+        assert str(optimized) == (
+            "optimized: compileall of the stdlib 8.00 s, pip resolution 2.00 s")
+        assert str(HostBenchmark("other", 5.0, None)).endswith(
+            "pip resolution n/a")
+
+    def test_benchmark_compileall(self):
+        for name in ("a.py", os.path.join("test", "b.py")):
+            filen = os.path.join(self.temp_dir, name)
+            os.makedirs(os.path.dirname(filen), exist_ok=True)
+            with open(filen, "w") as fileh:
+                fileh.write("x = 1\n")
+        assert hostbench.benchmark_compileall(
+            sys.executable, self.temp_dir, runs=1) > 0
+        # the .pyc are written out of the sources
+        assert "__pycache__" not in os.listdir(self.temp_dir)
+
+    def test_benchmark_pip_resolve(self):
+        if not os.path.isdir(os.path.join(
+                hostbench.stdlib_dir(sys.executable), "ensurepip",
+                "_bundled")):
+            self.skipTest("the python has no bundled pip")
+        assert hostbench.benchmark_pip_resolve(sys.executable, runs=1) > 0
@@ -0,0 +1,124 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from pythonforandroid import linkprofile
+from pythonforandroid.linkprofile import LibraryStats
+
+LIBRARY_SOURCE = """\
+static int values[64];
+int *pointers[64] = {
+#define P(i) &values[i], &values[i + 1], &values[i + 2], &values[i + 3]
+    P(0), P(4), P(8), P(12), P(16), P(20), P(24), P(28),
+    P(32), P(36), P(40), P(44), P(48), P(52), P(56), P(60)
+};
+
+int first(void) { return *pointers[0]; }
+int second(void) { return *pointers[1]; }
+__attribute__((visibility("default"))) int PyInit_library(void) {
+  return first() + second();
+}
+"""
+
+
+class TestLinkProfile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def build_library(self, name, *flags):
+        source = os.path.join(self.temp_dir, "library.c")
+        with open(source, "w") as fileh:
+            fileh.write(LIBRARY_SOURCE)
+        library = os.path.join(self.temp_dir, "libs", name)
+        os.makedirs(os.path.dirname(library), exist_ok=True)
+        subprocess.check_call(
+            ["gcc", "-shared", "-fPIC", "-O1", source, "-o", library] +
+            list(flags))
+        return library
+
+    def test_count_relocations(self):
+        # an address, then a bitmap of the 63 following words (3 set bits)
+        relr = (0x1000).to_bytes(8, "little") + (0b1011 << 1 | 1).to_bytes(
+            8, "little")
+        assert linkprofile.count_relocations(
+            linkprofile.SHT_RELR, relr, 8, 8) == 4
+        assert linkprofile.count_relocations(
+            linkprofile.SHT_RELA, b"\0" * 72, 8, 24) == 3
+        # the count, sleb128 encoded, follows the APS2 magic
+        assert linkprofile.count_relocations(
+            linkprofile.SHT_ANDROID_RELA, b"APS2\xe5\x8e\x26", 8, 1) == 624485
+        assert linkprofile.count_relocations(
+            linkprofile.SHT_ANDROID_RELA, b"\0\0\0\0", 8, 1) == 0
+
+    def test_library_stats(self):
+        not_elf = os.path.join(self.temp_dir, "not_elf.so")
+        with open(not_elf, "wb") as fileh:
+            fileh.write(b"P4A_BIGLINK placeholder\n")
+        assert linkprofile.library_stats(not_elf) is None
+
+    @unittest.skipUnless(shutil.which("gcc"), "needs gcc")
+    def test_load_profile(self):
+        default = linkprofile.library_stats(self.build_library(
+            "libdefault.so", "-Wl,--hash-style=both"))
+        try:
+            load = linkprofile.library_stats(self.build_library(
+                "libload.so", "-fvisibility=hidden", "-ffunction-sections",
+                "-fdata-sections", "-Wl,--gc-sections", "-Wl,--hash-style=gnu",
+                "-Wl,-z,pack-relative-relocs"))
+        except subprocess.CalledProcessError:
+            self.skipTest("the linker does not pack relocations")
+        # the relative relocations packed, and the symbolic ones of the
+        # hidden symbols resolved at link time
+        assert 64 <= load.relocations < default.relocations
+        assert load.relocations_size < default.relocations_size / 4
+        assert load.exported_symbols == 1 < default.exported_symbols
+        assert load.size < default.size
+
+    @unittest.skipUnless(shutil.which("gcc"), "needs gcc")
+    def test_collect_library_stats(self):
+        library = self.build_library("libone.so")
+        os.symlink(library, os.path.join(self.temp_dir, "libs", "liblink.so"))
+        with open(os.path.join(self.temp_dir, "libs", "data.so"), "w") as fileh:
+            fileh.write("not a library")
+        stats = linkprofile.collect_library_stats(
+            self.temp_dir, [os.path.join(self.temp_dir, "libs")])
+        assert list(stats) == [os.path.join("libs", "libone.so")]
+        stats_fn = os.path.join(self.temp_dir, "stats.json")
+        linkprofile.write_library_stats(stats_fn, stats)
+        assert linkprofile.read_library_stats(stats_fn) == stats
+        assert linkprofile.read_library_stats(
+            os.path.join(self.temp_dir, "missing.json")) is None
+
+    def test_write_link_report(self):
+        stats = {
+            "libs/libpython.so": LibraryStats(2048 * 1024, 1000, 2048, 900),
+            "modules/_json.so": LibraryStats(40 * 1024, 50, 128, 1),
+        }
+        baseline = {
+            "libs/libpython.so": LibraryStats(2560 * 1024, 1000, 24000, 950),
+            "libs/removed.so": LibraryStats(1024, 1, 24, 1),
+        }
+        report_fn = os.path.join(self.temp_dir, "link_report.txt")
+        totals, base_totals = linkprofile.write_link_report(
+            report_fn, stats, baseline, ["link profile: load"])
+        assert totals == LibraryStats(2088 * 1024, 1050, 2176, 901)
+        assert base_totals == LibraryStats(2561 * 1024, 1001, 24024, 951)
+        with open(report_fn) as fileh:
+            lines = [line.split() for line in fileh.read().splitlines()]
+        assert lines[0] == ["#", "link", "profile:", "load"]
+        assert lines[1][-7:] == [
+            "baseline:", "-473.0", "KiB,", "+49", "relocations,", "-50",
+            "symbols"]
+        assert lines[2] == [
+            "libs/libpython.so", "2048.0", "KiB", "(-512.0)", "1000",
+            "relocations", "(+0)", "900", "symbols", "(-50)"]
+        assert lines[3] == [
+            "modules/_json.so", "40.0", "KiB", "50", "relocations", "1",
+            "symbols"]
+        assert str(totals) == (
+            "2088.0 KiB, 1050 relocations (2.1 KiB), 901 symbols")
@@ -0,0 +1,168 @@
+import os
+import struct
+import unittest
+
+import pytest
+
+from pythonforandroid.nativelibs import (
+    DT_NEEDED, SHT_DYNAMIC, SHT_SYMTAB, library_load_order, read_needed,
+    read_symbols)
+
+
+def make_elf(filen, needed, elf_class=2, symbols=()):
+    '''
+    Write a minimal ELF shared library needing the libraries `needed`, with
+    the `symbols` in its symbol table.
+    '''
+    header_fmt, section_fmt, dyn_fmt, sym_fmt = {
+        1: ('<16sHHIIIIIHHHHHH', '<IIIIIIIIII', '<iI', '<IIIBBH'),
+        2: ('<16sHHIQQQIHHHHHH', '<IIQQQQIIQQ', '<qQ', '<IBBHQQ'),
+    }[elf_class]
+    dynstr = b'\0'
+    dynamic = b''
+    for name in needed:
+        dynamic += struct.pack(dyn_fmt, DT_NEEDED, len(dynstr))
+        dynstr += name.encode() + b'\0'
+    dynamic += struct.pack(dyn_fmt, 0, 0)
+    strtab = b'\0'
+    symtab = b'\0' * struct.calcsize(sym_fmt)
+    for name in symbols:
+        symtab += struct.pack(sym_fmt, len(strtab), *[0] * 5)
+        strtab += name.encode() + b'\0'
+
+    dynstr_offset = struct.calcsize(header_fmt)
+    dynamic_offset = dynstr_offset + len(dynstr)
+    strtab_offset = dynamic_offset + len(dynamic)
+    symtab_offset = strtab_offset + len(strtab)
+    shoff = symtab_offset + len(symtab)
+    sections = [
+        struct.pack(section_fmt, *[0] * 10),
+        struct.pack(section_fmt, 0, 3, 0, 0, dynstr_offset, len(dynstr),
+                    0, 0, 1, 0),
+        struct.pack(section_fmt, 0, SHT_DYNAMIC, 0, 0, dynamic_offset,
+                    len(dynamic), 1, 0, 8, struct.calcsize(dyn_fmt)),
+        struct.pack(section_fmt, 0, 3, 0, 0, strtab_offset, len(strtab),
+                    0, 0, 1, 0),
+        struct.pack(section_fmt, 0, SHT_SYMTAB, 0, 0, symtab_offset,
+                    len(symtab), 3, 0, 8, struct.calcsize(sym_fmt)),
+    ]
+    ident = b'\x7fELF' + bytes([elf_class, 1, 1]) + b'\0' * 9
+    header = struct.pack(
+        header_fmt, ident, 3, 183, 1, 0, 0, shoff, 0,
+        struct.calcsize(header_fmt), 0, 0, struct.calcsize(section_fmt),
+        len(sections), 0)
+    with open(filen, 'wb') as fileh:
+        fileh.write(header + dynstr + dynamic + strtab + symtab +
+                    b''.join(sections))
+
+
+class TestReadNeeded(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def set_tmpdir(self, tmpdir):
+        self.tmpdir = str(tmpdir)
+
+    def test_elf64(self):
+        filen = os.path.join(self.tmpdir, 'libmain.so')
+        make_elf(filen, ['libpython3.11.so', 'libc.so'])
+        self.assertEqual(
+            read_needed(filen), ['libpython3.11.so', 'libc.so'])
+
+    def test_elf32(self):
+        filen = os.path.join(self.tmpdir, 'libmain.so')
+        make_elf(filen, ['libpython3.11.so', 'libc.so'], elf_class=1)
+        self.assertEqual(
+            read_needed(filen), ['libpython3.11.so', 'libc.so'])
+
+    def test_not_elf(self):
+        filen = os.path.join(self.tmpdir, 'libpybundle.so')
+        with open(filen, 'wb') as fileh:
+            fileh.write(b'PK\x03\x04')
+        self.assertIsNone(read_needed(filen))
+
+    def test_host_library(self):
+        import _ctypes
+        if not _ctypes.__file__.endswith('.so'):
+            pytest.skip('_ctypes is not a shared library here')
+        with open(_ctypes.__file__, 'rb') as fileh:
+            if fileh.read(6)[5] != 1:
+                pytest.skip('big endian host')
+        needed = read_needed(_ctypes.__file__)
+        self.assertIsInstance(needed, list)
+        self.assertTrue(all('.so' in name for name in needed))
+
+
+class TestReadSymbols(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def set_tmpdir(self, tmpdir):
+        self.tmpdir = str(tmpdir)
+
+    def test_symbols(self):
+        for elf_class in (1, 2):
+            filen = os.path.join(self.tmpdir, 'libpython3.11.so')
+            make_elf(filen, ['libc.so'], elf_class=elf_class, symbols=[
+                'Py_Initialize', '_PyEval_EvalFrameDefault.opcode_targets'])
+            self.assertEqual(read_symbols(filen), {
+                'Py_Initialize', '_PyEval_EvalFrameDefault.opcode_targets'})
+
+    def test_stripped(self):
+        filen = os.path.join(self.tmpdir, 'libpython3.11.so')
+        make_elf(filen, ['libc.so'])
+        self.assertEqual(read_symbols(filen), set())
+
+    def test_not_elf(self):
+        filen = os.path.join(self.tmpdir, 'libpybundle.so')
+        with open(filen, 'wb') as fileh:
+            fileh.write(b'PK\x03\x04')
+        self.assertIsNone(read_symbols(filen))
+
+
+class TestLibraryLoadOrder(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def set_tmpdir(self, tmpdir):
+        self.tmpdir = str(tmpdir)
+
+    def make_libs(self, libs):
+        for name, needed in libs.items():
+            make_elf(os.path.join(self.tmpdir, name), needed)
+
+    def test_dependencies_first(self):
+        self.make_libs({
+            'libmain.so': ['libpython3.11.so', 'libSDL2.so', 'libc.so'],
+            'libpython3.11.so': ['libm.so', 'libc.so'],
+            'libSDL2.so': ['libc.so'],
+            'libssl1.1.so': ['libcrypto1.1.so'],
+            'libcrypto1.1.so': [],
+            'libunused.so': [],
+        })
+        with open(os.path.join(self.tmpdir, 'libpybundle.so'), 'wb') as fh:
+            fh.write(b'\x1f\x8b')
+        self.assertEqual(
+            library_load_order(
+                self.tmpdir,
+                ['libssl*.so', 'libSDL2.so', 'libpython3.*.so', 'libmain.so']),
+            ['libcrypto1.1.so', 'libssl1.1.so', 'libSDL2.so',
+             'libpython3.11.so', 'libmain.so'])
+
+    def test_needed_library_not_in_roots(self):
+        # e.g. a library a recipe added, that libmain.so links against
+        self.make_libs({
+            'libmain.so': ['libpython3.11.so', 'libextra.so'],
+            'libpython3.11.so': [],
+            'libextra.so': ['libdep.so'],
+            'libdep.so': [],
+        })
+        self.assertEqual(
+            library_load_order(self.tmpdir, ['libmain.so']),
+            ['libpython3.11.so', 'libdep.so', 'libextra.so', 'libmain.so'])
+
+    def test_cycle(self):
+        self.make_libs({
+            'liba.so': ['libb.so'],
+            'libb.so': ['liba.so'],
+        })
+        self.assertEqual(
+            library_load_order(self.tmpdir, ['liba.so']),
+            ['libb.so', 'liba.so'])
@@ -0,0 +1,167 @@
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import unittest
+from unittest import mock
+
+from pythonforandroid import pymodules
+from pythonforandroid.build import biglink_pymodules, link_objects
+
+LIBLINK = os.path.join(
+    os.path.dirname(pymodules.__file__), "tools", "liblink")
+
+MODULE_SOURCE = """\
+#include "Python.h"
+
+static struct PyModuleDef module = {{
+    PyModuleDef_HEAD_INIT, "{name}", NULL, 0, NULL}};
+
+PyMODINIT_FUNC PyInit_{init}(void) {{
+  PyObject *m = PyModule_Create(&module);
+  if (m != NULL) {{
+    PyModule_AddStringConstant(m, "NAME", "{name}");
+  }}
+  return m;
+}}
+"""
+
+
+def can_build_extensions():
+    include = sysconfig.get_paths()["include"]
+    return (shutil.which("gcc") is not None and
+            shutil.which("ld") is not None and
+            os.path.exists(os.path.join(include, "Python.h")))
+
+
+class TestPyModules(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.site_packages = os.path.join(self.temp_dir, "site-packages")
+        self.objects_dir = os.path.join(self.temp_dir, "objects_recipe")
+        os.makedirs(self.objects_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, filen, content):
+        filen = os.path.join(self.temp_dir, filen)
+        os.makedirs(os.path.dirname(filen), exist_ok=True)
+        with open(filen, "wb") as fileh:
+            fileh.write(content)
+        return filen
+
+    def test_find_placeholders(self):
+        self.write("site-packages/pkg/_speedups.cpython-314-x.so",
+                   b"P4A_BIGLINK 0123abcd-_speedups.cpython-314-x.so\n")
+        self.write("site-packages/pkg/real.cpython-314-x.so",
+                   b"\x7fELF" + b"\0" * 300)
+        self.write("site-packages/pkg/data.txt", b"P4A_BIGLINK nothing\n")
+        self.write("site-packages/top.so", b"P4A_BIGLINK abcd0123-top.so\n")
+        assert pymodules.find_placeholders(self.site_packages) == {
+            "pkg._speedups": (os.path.join("pkg", "_speedups.cpython-314-x.so"),
+                              "0123abcd-_speedups.cpython-314-x.so"),
+            "top": ("top.so", "abcd0123-top.so"),
+        }
+        assert pymodules.is_placeholder(
+            os.path.join(self.site_packages, "top.so"))
+        assert not pymodules.is_placeholder(
+            os.path.join(self.site_packages, "pkg", "real.cpython-314-x.so"))
+
+    def test_split_modules(self):
+        assert pymodules.split_modules(
+            ["kivy._event", "kivy.graphics.instructions", "other._event",
+             "kivy.properties"]) == (
+                ["kivy.graphics.instructions", "kivy.properties"],
+                ["kivy._event", "other._event"])
+
+    def test_objects_digest(self):
+        obj = self.write("objects_recipe/a.so.o", b"object")
+        self.write("objects_recipe/a.so.libs", b"-lm")
+        digest = pymodules.objects_digest([obj], ["-L/libs"])
+        assert pymodules.objects_digest([obj], ["-L/libs"]) == digest
+        assert pymodules.objects_digest([obj], ["-L/other"]) != digest
+        self.write("objects_recipe/a.so.libs", b"-lm -lz")
+        assert pymodules.objects_digest([obj], ["-L/libs"]) != digest
+
+    def test_object_filens(self):
+        self.write("objects_recipe/a.so.o", b"object")
+        assert pymodules.object_filens([self.objects_dir], "a.so") is None
+        self.write("objects_recipe/a.so.libs", b"")
+        assert pymodules.object_filens(
+            [os.path.join(self.temp_dir, "missing"), self.objects_dir],
+            "a.so") == os.path.join(self.objects_dir, "a.so.o")
+
+    def liblink(self, name, init, output):
+        """Build the extension module name with tools/liblink, as a recipe
+        does with --biglink."""
+        source = self.write("src/{}.c".format(init), MODULE_SOURCE.format(
+            name=name, init=init).encode())
+        obj = source[:-2] + ".o"
+        subprocess.check_call([
+            "gcc", "-fPIC", "-c", "-I" + sysconfig.get_paths()["include"],
+            source, "-o", obj])
+        env = dict(os.environ, LIBLINK_PATH=self.objects_dir, LD="ld")
+        subprocess.check_call(
+            [sys.executable, LIBLINK, "-shared", "-pthread", "-Wl,-O1",
+             "-target", "x86_64-linux-gnu", obj, "-lm", "-o",
+             self.write(output, b"")], env=env, stdout=subprocess.DEVNULL)
+
+    @unittest.skipUnless(can_build_extensions(),
+                         "needs gcc, ld and the python headers")
+    def test_biglink(self):
+        suffix = sysconfig.get_config_var("EXT_SUFFIX")
+        self.liblink("pkg.spam", "spam", "site-packages/pkg/spam" + suffix)
+        self.liblink("eggs", "eggs", "site-packages/eggs" + suffix)
+        self.liblink("other.eggs", "eggs", "site-packages/other/eggs" + suffix)
+        with open(os.path.join(self.site_packages, "eggs" + suffix)) as fileh:
+            assert fileh.read().startswith("P4A_BIGLINK ")
+
+        libs_dir = os.path.join(self.temp_dir, "libs")
+        os.makedirs(libs_dir)
+        ctx = mock.Mock(recipe_build_order=["recipe"])
+        ctx.get_python_install_dir.return_value = self.site_packages
+        ctx.get_libs_dir.return_value = libs_dir
+        ctx.bootstrap.build_dir = self.temp_dir
+        arch = mock.Mock(arch="x86_64")
+        arch.get_env.return_value = dict(os.environ, CC="gcc")
+        recipe = mock.Mock()
+        recipe.name = "recipe"
+        recipe.get_build_container_dir.return_value = self.temp_dir
+        with mock.patch("pythonforandroid.build.Recipe.get_recipe",
+                        return_value=recipe), mock.patch(
+                "pythonforandroid.build.link_objects",
+                wraps=link_objects) as m_link:
+            biglink_pymodules(ctx, arch)
+            library = os.path.join(libs_dir, pymodules.PYMODULES_LIBRARY)
+            # the modules with the same init function are linked separately
+            assert sorted(call[0][0] for call in m_link.call_args_list) == sorted([
+                os.path.join(self.site_packages, "eggs" + suffix),
+                library,
+                os.path.join(self.site_packages, "other", "eggs" + suffix)])
+
+            m_link.reset_mock()
+            biglink_pymodules(ctx, arch)
+            # up to date, and the separate modules are now shared libraries
+            m_link.assert_not_called()
+
+        spec = importlib.util.spec_from_file_location(
+            "_p4a_pymodules",
+            os.path.join(self.site_packages, pymodules.PYMODULES_FINDER))
+        finder_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(finder_module)
+        assert finder_module.MODULES == {
+            "pkg.spam": os.path.join("pkg", "spam" + suffix)}
+        meta_path = []
+        finder = finder_module.install(library, meta_path)
+        assert meta_path == [finder]
+        assert finder.find_spec("eggs") is None
+        spam_spec = finder.find_spec("pkg.spam")
+        spam = importlib.util.module_from_spec(spam_spec)
+        spam_spec.loader.exec_module(spam)
+        assert spam.NAME == "pkg.spam"
+        assert spam.__file__ == os.path.join(
+            self.site_packages, "pkg", "spam" + suffix)
@@ -0,0 +1,313 @@
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+import zipfile
+import zipimport
+from unittest import mock
+
+from pythonforandroid import pythonbundle
+
+
+class TestWriteZipBundle(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.lib_dir = os.path.join(self.temp_dir, "Lib")
+        self.zip_fn = os.path.join(self.temp_dir, "stdlib.zip")
+        self.filens = [
+            "./os.pyc",
+            "./abc.pyc",
+            "./encodings/__init__.pyc",
+            "./encodings/utf_8.pyc",
+            "./json/__init__.pyc",
+        ]
+        for filen in self.filens:
+            filen = os.path.join(self.lib_dir, filen)
+            os.makedirs(os.path.dirname(filen), exist_ok=True)
+            with open(filen, "wb") as fileh:
+                fileh.write(b"x" * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, **kwargs):
+        return pythonbundle.write_zip_bundle(
+            self.zip_fn, self.lib_dir, self.filens, **kwargs)
+
+    def test_deterministic(self):
+        self.write()
+        with open(self.zip_fn, "rb") as fileh:
+            first = fileh.read()
+        os.utime(os.path.join(self.lib_dir, "os.pyc"), (1e9, 1e9))
+        self.write()
+        with open(self.zip_fn, "rb") as fileh:
+            assert fileh.read() == first
+
+        with zipfile.ZipFile(self.zip_fn) as zf:
+            assert zf.namelist() == sorted(zf.namelist())
+            assert {i.date_time for i in zf.infolist()} == {
+                (1980, 1, 1, 0, 0, 0)}
+
+    @mock.patch.dict(os.environ, {"SOURCE_DATE_EPOCH": "1600000000"})
+    def test_source_date_epoch(self):
+        self.write()
+        with zipfile.ZipFile(self.zip_fn) as zf:
+            assert {i.date_time for i in zf.infolist()} == {
+                (2020, 9, 13, 12, 26, 40)}
+
+    def test_compression_policy(self):
+        report = self.write(stored_patterns=["encodings/*"])
+        with zipfile.ZipFile(self.zip_fn) as zf:
+            compress_types = {
+                i.filename: i.compress_type for i in zf.infolist()}
+        assert compress_types["encodings/utf_8.pyc"] == zipfile.ZIP_STORED
+        assert compress_types["os.pyc"] == zipfile.ZIP_DEFLATED
+        assert (report.entries, report.stored, report.deflated) == (5, 2, 3)
+        assert report.uncompressed_size == 5000
+        assert report.inflate_size == 3000
+        assert report.size == os.path.getsize(self.zip_fn)
+        assert report.estimated_inflate_ms > 0
+        assert "5 entries (3 deflated, 2 stored)" in str(report)
+
+        report = self.write(compression="stored")
+        assert (report.stored, report.deflated) == (5, 0)
+        assert report.estimated_inflate_ms == 0
+
+        with self.assertRaises(ValueError):
+            self.write(compression="bzip2")
+
+    def test_import_order(self):
+        self.write(import_order=["encodings", "encodings.utf_8", "os", "nope"])
+        with zipfile.ZipFile(self.zip_fn) as zf:
+            assert zf.namelist() == [
+                "encodings/__init__.pyc",
+                "encodings/utf_8.pyc",
+                "os.pyc",
+                "abc.pyc",
+                "json/__init__.pyc",
+            ]
+
+    def test_alignment(self):
+        self.write(stored_patterns=["encodings/*", "json/*"], align=4096)
+        with open(self.zip_fn, "rb") as fileh:
+            content = fileh.read()
+        with zipfile.ZipFile(self.zip_fn) as zf:
+            for zinfo in zf.infolist():
+                name_len, extra_len = struct.unpack(
+                    "<HH", content[zinfo.header_offset + 26:
+                                   zinfo.header_offset + 30])
+                data_offset = (
+                    zinfo.header_offset + 30 + name_len + extra_len)
+                # read from the central directory, which has no padding
+                assert zinfo.extra == b""
+                if zinfo.compress_type == zipfile.ZIP_STORED:
+                    assert data_offset % 4096 == 0
+                    assert content[data_offset:data_offset + 1000] == (
+                        b"x" * 1000)
+                assert zf.read(zinfo) == b"x" * 1000
+        importer = zipimport.zipimporter(self.zip_fn)
+        assert importer.is_package("encodings")
+
+    def test_read_import_order(self):
+        order_fn = os.path.join(self.temp_dir, "order.txt")
+        with open(order_fn, "w") as fileh:
+            fileh.write("# startup modules\nencodings\n\nos  # comment\n")
+        assert pythonbundle.read_import_order(order_fn) == ["encodings", "os"]
+
+
+class TestPruneStdlib(unittest.TestCase):
+    TRACE = [
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |   _io",
+        "import time:       310 |        430 | encodings",
+        "03-01 10:00:00.000  1234  1234 I python  : "
+        "import time:        80 |         80 |     json.decoder",
+        "import time:        15 |         15 |   encodings",
+        "something else",
+    ]
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_parse_import_trace(self):
+        assert pythonbundle.parse_import_trace(self.TRACE) == [
+            "_io", "encodings", "json.decoder"]
+
+    def test_read_import_trace(self):
+        trace_fn = os.path.join(self.temp_dir, "logcat.txt")
+        with open(trace_fn, "w") as fileh:
+            fileh.write("\n".join(self.TRACE))
+        assert pythonbundle.read_import_trace(trace_fn) == [
+            "_io", "encodings", "json.decoder"]
+
+    def test_capture_import_trace(self):
+        main_py = os.path.join(self.temp_dir, "main.py")
+        with open(main_py, "w") as fileh:
+            fileh.write("import json.decoder\nimport kivy_only_on_device\n")
+        imported = pythonbundle.capture_import_trace(sys.executable, main_py)
+        # the imports up to the failing one are still recorded
+        assert {"json", "json.decoder"} <= set(imported)
+        assert imported[-1] == "kivy_only_on_device"
+
+    def test_module_name(self):
+        assert pythonbundle.module_name("./os.pyc") == "os"
+        assert pythonbundle.module_name("./json/__init__.pyc") == "json"
+        assert pythonbundle.module_name(
+            "./json/decoder.pyc") == "json.decoder"
+        assert pythonbundle.module_name(
+            "./email/architecture.rst") == "email"
+        assert pythonbundle.module_name(
+            "./_ctypes.cpython-311-aarch64-linux-android.so") == "_ctypes"
+        assert pythonbundle.module_name("./LICENSE.txt") is None
+
+    def test_split_in_place_files(self):
+        filens = [
+            "six.pyc",
+            "certifi/__init__.pyc",
+            "certifi/cacert.pem",
+            "kivy/__init__.pyc",
+            "kivy/_clock.cpython-311-aarch64-linux-android.so",
+            "kivy/data/style.kv",
+            "kivy-2.3.0.dist-info/RECORD",
+            "_cffi_backend.cpython-311-aarch64-linux-android.so",
+            "numpy.libs/libopenblas.so",
+        ]
+        in_place, extracted = pythonbundle.split_in_place_files(
+            filens, on_disk=["six"])
+        assert in_place == [
+            "certifi/__init__.pyc",
+            "certifi/cacert.pem",
+            "kivy-2.3.0.dist-info/RECORD",
+        ]
+        assert extracted == [
+            "six.pyc",
+            "kivy/__init__.pyc",
+            "kivy/_clock.cpython-311-aarch64-linux-android.so",
+            "kivy/data/style.kv",
+            "_cffi_backend.cpython-311-aarch64-linux-android.so",
+            "numpy.libs/libopenblas.so",
+        ]
+
+    def test_prune_stdlib(self):
+        filens = [
+            "./LICENSE.txt",
+            "./os.pyc",
+            "./csv.pyc",
+            "./json/__init__.pyc",
+            "./json/decoder.pyc",
+            "./json/tool.pyc",
+            "./email/__init__.pyc",
+            "./email/mime/text.pyc",
+            "./sqlite3/__init__.pyc",
+        ]
+        kept, dropped = pythonbundle.prune_stdlib(
+            filens, ["json.decoder"], keep=["email"])
+        assert kept == [
+            "./LICENSE.txt",
+            "./os.pyc",
+            "./json/__init__.pyc",
+            "./json/decoder.pyc",
+            "./email/__init__.pyc",
+            "./email/mime/text.pyc",
+        ]
+        assert dropped == [
+            "./csv.pyc", "./json/tool.pyc", "./sqlite3/__init__.pyc"]
+
+        for filen in dropped:
+            filen = os.path.join(self.temp_dir, filen)
+            os.makedirs(os.path.dirname(filen), exist_ok=True)
+            with open(filen, "wb") as fileh:
+                fileh.write(b"x" * 2048)
+        report_fn = os.path.join(self.temp_dir, "report.txt")
+        total = pythonbundle.write_prune_report(
+            report_fn, self.temp_dir, kept, dropped, ["stdlib pruned"])
+        assert total == 3 * 2048
+        with open(report_fn) as fileh:
+            report = fileh.read()
+        assert report.startswith("# stdlib pruned\n")
+        assert "kept 6 files, dropped 3 files (6.0 KiB)" in report
+        assert "json" in report and "sqlite3" in report
+
+
+class TestShakePythonTree(unittest.TestCase):
+    SOURCES = {
+        "six.py": "",
+        "pkg/__init__.py": "from . import core\n",
+        "pkg/core.py": (
+            "import importlib\n"
+            "from .utils import helper\n"
+            "def lazy():\n"
+            "    from ..other import thing\n"
+            "    importlib.import_module('pkg.plugins.dynamic')\n"),
+        "pkg/utils.py": "",
+        "pkg/plugins/__init__.py": "",
+        "pkg/plugins/dynamic.py": "",
+        "pkg/plugins/unused.py": "",
+        "pkg/tests/__init__.py": "",
+        "pkg/tests/test_core.py": "import pytest\n",
+        "other/__init__.py": "",
+        "other/thing.py": "",
+        "other/ext/__init__.py": "from ._speedups import run\n",
+        "unused/__init__.py": "import six\n",
+        "kept/__init__.py": "",
+        "kept/sub.py": "",
+    }
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filens = []
+        for filen, source in self.SOURCES.items():
+            self.write(filen, source)
+            self.filens.append("./" + filen + "c")
+            self.write(filen + "c", "")
+        for filen in ["pkg/data/font.ttf", "unused/data.json",
+                      "pkg-1.0.dist-info/RECORD", "README",
+                      "other/ext/_speedups.cpython-311-x86_64-linux-gnu.so",
+                      "other/ext/_helpers.pyc"]:
+            self.write(filen, "")
+            self.filens.append("./" + filen)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, filen, content):
+        filen = os.path.join(self.temp_dir, filen)
+        os.makedirs(os.path.dirname(filen), exist_ok=True)
+        with open(filen, "w") as fileh:
+            fileh.write(content)
+
+    def test_find_imports(self):
+        imports = pythonbundle.find_imports(
+            self.SOURCES["pkg/core.py"], "pkg.core")
+        assert imports == {
+            "importlib", "pkg.utils", "pkg.utils.helper", "other",
+            "other.thing", "pkg.plugins.dynamic"}
+        assert pythonbundle.find_imports(
+            "from . import core", "pkg", is_package=True) == {
+                "pkg", "pkg.core"}
+        with self.assertRaises(SyntaxError):
+            pythonbundle.find_imports("import", "pkg")
+
+    def test_shake_python_tree(self):
+        kept, dropped = pythonbundle.shake_python_tree(
+            self.temp_dir, self.filens, ["pkg", "other.ext"], keep=["kept"])
+        assert sorted(dropped) == [
+            "./pkg/plugins/unused.pyc",
+            "./pkg/tests/__init__.pyc",
+            "./pkg/tests/test_core.pyc",
+            "./six.pyc",
+            "./unused/__init__.pyc",
+            "./unused/data.json",
+        ]
+        # the extension module's package is kept whole
+        assert "./other/ext/_helpers.pyc" in kept
+        assert "./pkg/data/font.ttf" in kept
+        assert "./pkg-1.0.dist-info/RECORD" in kept
+        assert "./README" in kept
+        assert "./kept/sub.pyc" in kept
+        assert len(kept) + len(dropped) == len(self.filens)
@@ -7,7 +7,8 @@ import warnings
 from unittest import mock
 
 from pythonforandroid.build import Context
-from pythonforandroid.recipe import Recipe, TargetPythonRecipe, import_recipe
+from pythonforandroid.recipe import (
+    PythonRecipe, Recipe, TargetPythonRecipe, import_recipe)
 from pythonforandroid.archs import ArchAarch_64
 from pythonforandroid.bootstrap import Bootstrap
 from tests.test_bootstrap import BaseClassSetupBootstrap
@@ -33,6 +34,10 @@ class DummyRecipe(Recipe):
     pass
 
 
+class DummyPythonRecipe(PythonRecipe):
+    pass
+
+
 class TestRecipe(unittest.TestCase):
 
     def test_recipe_dirs(self):
@@ -335,3 +340,96 @@ class TesSTLRecipe(BaseClassSetupBootstrap, unittest.TestCase):
         with mock.patch.dict(os.environ, {f'DOWNLOAD_HEADERS_{recipe.name}': '[["header1","foo"],["header2", "bar"]]'}):
             download_headers = recipe.download_headers
         assert download_headers == [("header1", "foo"), ("header2", "bar")]
+
+
+class TestOptProfile(BaseClassSetupBootstrap, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ctx.bootstrap = Bootstrap().get_bootstrap('sdl2', self.ctx)
+        self.setUp_distribution_with_bootstrap(self.ctx.bootstrap)
+        self.ctx.python_recipe = Recipe.get_recipe('python3', self.ctx)
+        self.arch = ArchAarch_64(self.ctx)
+
+    def test_unsupported_opt_profiles(self):
+        recipe = DummyRecipe()
+        recipe.ctx = self.ctx
+        assert recipe.opt_profile == 'default'
+        self.ctx.opt_profile = 'lto'
+        assert recipe.opt_profile == 'lto'
+        recipe.unsupported_opt_profiles = ['lto']
+        assert recipe.opt_profile == 'default'
+        self.ctx.opt_profile = 'size'
+        assert recipe.opt_profile == 'size'
+
+    def test_build_container_dir_profiles(self):
+        recipe = DummyRecipe()
+        recipe.ctx = self.ctx
+        build_dir = recipe.get_build_container_dir('arm64-v8a')
+        assert os.path.basename(os.path.dirname(build_dir)) == (
+            recipe.get_dir_name())
+        self.ctx.link_profile = 'load'
+        self.ctx.opt_profile = 'lto'
+        lto_build_dir = recipe.get_build_container_dir('arm64-v8a')
+        assert os.path.basename(os.path.dirname(lto_build_dir)) == (
+            recipe.get_dir_name() + '-link_load-opt_lto')
+        recipe.unsupported_opt_profiles = ['lto']
+        assert recipe.get_build_container_dir('arm64-v8a') == (
+            lto_build_dir.replace('-opt_lto', ''))
+        assert self.ctx.get_python_install_dir('arm64-v8a') == os.path.join(
+            self.ctx.python_installs_dir,
+            self.ctx.bootstrap.distribution.name + '-link_load-opt_lto',
+            'arm64-v8a')
+
+    @mock.patch('shutil.which')
+    @mock.patch('pythonforandroid.build.ensure_dir')
+    def test_get_recipe_env(self, mock_ensure_dir, mock_shutil_which):
+        mock_shutil_which.return_value = self.arch.clang_exe
+        recipe = DummyRecipe()
+        recipe.ctx = self.ctx
+        self.ctx.opt_profile = 'size'
+        assert '-Os' in recipe.get_recipe_env(self.arch)['CFLAGS']
+        recipe.unsupported_opt_profiles = ['size']
+        assert '-Os' not in recipe.get_recipe_env(self.arch)['CFLAGS']
+
+    @mock.patch('shutil.which')
+    @mock.patch('pythonforandroid.build.ensure_dir')
+    def test_hidden_visibility(self, mock_ensure_dir, mock_shutil_which):
+        mock_shutil_which.return_value = self.arch.clang_exe
+        recipe = DummyPythonRecipe()
+        recipe.ctx = self.ctx
+        self.ctx.link_profile = 'load'
+        assert '-fvisibility=hidden' not in recipe.get_recipe_env(
+            self.arch)['CFLAGS']
+        recipe.hidden_visibility = True
+        assert '-fvisibility=hidden' in recipe.get_recipe_env(
+            self.arch)['CFLAGS']
+
+    def test_get_cmake_opt_args(self):
+        recipe = Recipe.get_recipe('libwebp', self.ctx)
+        assert recipe.get_cmake_opt_args(self.arch) == []
+        self.ctx.opt_profile = 'speed'
+        assert recipe.get_cmake_opt_args(self.arch) == [
+            '-DCMAKE_C_FLAGS_RELEASE=-DNDEBUG -O3',
+            '-DCMAKE_CXX_FLAGS_RELEASE=-DNDEBUG -O3']
+        self.ctx.opt_profile = 'lto'
+        assert recipe.get_cmake_opt_args(self.arch) == [
+            '-DCMAKE_C_FLAGS_RELEASE=-DNDEBUG -O2 -flto=thin',
+            '-DCMAKE_CXX_FLAGS_RELEASE=-DNDEBUG -O2 -flto=thin',
+            '-DCMAKE_SHARED_LINKER_FLAGS_RELEASE=-flto=thin',
+            '-DCMAKE_MODULE_LINKER_FLAGS_RELEASE=-flto=thin',
+            '-DCMAKE_EXE_LINKER_FLAGS_RELEASE=-flto=thin']
+
+    def test_meson_opt_options(self):
+        recipe = Recipe.get_recipe('numpy', self.ctx)
+        assert recipe.get_meson_opt_options() == {}
+        self.ctx.opt_profile = 'lto'
+        options = {
+            'built-in options': recipe.get_meson_opt_options(),
+            'properties': {'needs_exe_wrapper': True},
+        }
+        with mock.patch.object(recipe, 'get_recipe_meson_options',
+                               return_value=options):
+            cross_file = recipe.write_build_options(self.arch)
+        assert cross_file == (
+            "[built-in options]\nb_lto = true\nb_lto_mode = 'thin'\n\n"
+            "[properties]\nneeds_exe_wrapper = true\n\n")
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pythonforandroid import startuptrace
+
+
+def trace_line(phases, prefix="03-01 10:00:00.000  1234  1234 I python  : "):
+    return prefix + "P4A_STARTUP_TRACE {\"phases\": [" + ", ".join(
+        "{{\"name\": \"{}\", \"start_ns\": {}, \"end_ns\": {}}}".format(
+            name, start, end) for name, start, end in phases) + "]}"
+
+
+def run(load_libraries_ms, py_initialize_ms):
+    load_end = 1000000000 + load_libraries_ms * 1000000
+    init_end = load_end + py_initialize_ms * 1000000
+    return [
+        ("process_start", 1000000000, 1000000000),
+        ("load_libraries", 1000000000, load_end),
+        ("py_initialize", load_end, init_end),
+        ("entrypoint", init_end, init_end),
+    ]
+
+
+class TestStartupTrace(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_parse_startup_traces(self):
+        lines = [
+            "I python  : Initializing Python for Android",
+            trace_line(run(30, 120)),
+            # logcat -v brief, and a cut line
+            trace_line(run(40, 100), prefix="I/python ( 1234): "),
+            "I python  : P4A_STARTUP_TRACE {\"phases\": [{\"name\": ",
+        ]
+        first, second = startuptrace.parse_startup_traces(lines)
+        assert first == [
+            ("process_start", 0, 0),
+            ("load_libraries", 0, 30),
+            ("py_initialize", 30, 120),
+            ("entrypoint", 150, 0),
+        ]
+        assert second[1].duration_ms == 40
+
+    def test_summarize_runs(self):
+        runs = startuptrace.parse_startup_traces([
+            trace_line(run(30, 120)),
+            trace_line(run(50, 100)),
+            trace_line(run(40, 110)),
+        ])
+        summary = startuptrace.summarize_runs(runs)
+        assert summary["load_libraries"] == 40
+        assert summary["py_initialize"] == 110
+        assert summary["total"] == 150
+        assert "entrypoint" not in summary
+
+    def test_format_startup_report(self):
+        before = os.path.join(self.temp_dir, "before.txt")
+        after = os.path.join(self.temp_dir, "after.txt")
+        for filen, runs in ((before, [run(30, 120), run(50, 120)]),
+                            (after, [run(40, 60)])):
+            with open(filen, "w") as fileh:
+                fileh.write("\n".join(trace_line(phases) for phases in runs))
+        report = startuptrace.format_startup_report([
+            ("before.txt", startuptrace.read_startup_traces(before)),
+            ("after.txt", startuptrace.read_startup_traces(after)),
+        ])
+        lines = report.splitlines()
+        assert "before.txt (2 runs)" in lines[0]
+        assert "after.txt (1 runs)" in lines[0]
+        assert lines[1].split() == ["process_start", "0.0", "0.0", "+0.0"]
+        assert lines[2].split() == ["load_libraries", "40.0", "40.0", "+0.0"]
+        assert lines[3].split() == ["py_initialize", "120.0", "60.0", "-60.0"]
+        assert lines[4].split() == ["total", "160.0", "100.0", "-60.0"]
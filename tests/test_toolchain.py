@@ -138,6 +138,28 @@ class TestToolchainCL:
         # deletes static attribute to not mess with other tests
         del Recipe.recipes
 
+    def test_startup_report(self, tmp_path):
+        """
+        Checks the `startup_report` command prints the startup phases of the
+        logcat outputs, and fails on outputs without any.
+        """
+        logcat = tmp_path / 'logcat.txt'
+        logcat.write_text(
+            'I python  : P4A_STARTUP_TRACE {"phases": ['
+            '{"name": "py_initialize", "start_ns": 0, "end_ns": 80000000}, '
+            '{"name": "entrypoint", "start_ns": 90000000, '
+            '"end_ns": 90000000}]}\n')
+        argv = ['toolchain.py', 'startup_report', str(logcat)]
+        with patch_sys_argv(argv), patch_sys_stdout() as m_stdout:
+            ToolchainCL()
+        assert m_stdout.getvalue().splitlines()[1].split() == [
+            'py_initialize', '80.0']
+
+        logcat.write_text('I python  : Initializing Python for Android\n')
+        with patch_sys_argv(argv), pytest.raises(
+                BuildInterruptingException, match='No startup trace'):
+            ToolchainCL()
+
     def test_local_recipes_dir(self):
         """
         Checks the `local_recipes` attribute in the Context is absolute.